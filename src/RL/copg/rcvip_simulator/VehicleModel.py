@@ -8,6 +8,7 @@ import numpy as np
 import copy
 from math import radians,degrees
 import matplotlib.pyplot as plt
+from sysid.tire import tire_model
 
 class VehicleModel():
     def __init__(self,n_batch,device,track='orca',dt=0.03):
@@ -129,11 +130,9 @@ class VehicleModel():
 
         return F_rx, F_ry, F_fy
 
+    # same curve as the simulator's tire model, evaluated on tensors
     def tireCurve(self,alpha):
-        C = 1.6
-        B = 2.3
-        D = 1.1
-        retval = D * torch.sin( C * torch.atan(B *alpha)) 
+        retval = tire_model.D * torch.sin( tire_model.C * torch.atan(tire_model.B *alpha))
         return retval
 
     # refine discretization
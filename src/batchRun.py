@@ -1,40 +1,121 @@
 # run batch experiment
+# every configs/<name>/exp*.xml is run headless in a pool of worker processes
+# results of each experiment are appended to log/<name>/batch_results.jsonl as they finish
+# experiments already in the results file are skipped, so an interrupted batch can be resumed
+# usage: python batchRun.py name [--jobs N] [--seed S] [--latency]
 from common import *
 from run import Main
 import glob
 import sys
+import os
+import json
+import argparse
+import traceback
+import multiprocessing
+from contextlib import redirect_stdout
+from time import time
+
+def toList(values):
+    try:
+        return [float(val) for val in values]
+    except TypeError:
+        return None
+
+# run one experiment in a worker process, output is redirected to a per experiment text log
+def runExperiment(job):
+    config_filename, name, seed, log_folder, log_latency = job
+    result = {'config_filename':config_filename, 'seed':seed}
+    exp_name = os.path.splitext(os.path.basename(config_filename))[0]
+    t0 = time()
+    with open(os.path.join(log_folder,exp_name+'.out'),'w') as f, redirect_stdout(f):
+        try:
+            experiment = Main(config_filename,headless=True)
+            experiment.experiment_name = name
+            experiment.seed = seed
+            if (log_latency):
+                experiment.latency_log = os.path.join(log_folder,exp_name+'_latency.json')
+            experiment.init()
+            experiment.run()
+        except Exception:
+            result['error'] = traceback.format_exc()
+            return result
+    result['wall_time'] = time()-t0
+    result['sim_time'] = experiment.sim_t
+    # these are collected by Laptimer, LapCounter, CollisionChecker, BoundaryChecker and Watchdog if loaded
+    result['laptime_mean'] = toList(getattr(experiment,'car_laptime_mean',[]))
+    result['laptime_stddev'] = toList(getattr(experiment,'car_laptime_stddev',[]))
+    result['total_laps'] = toList(getattr(experiment,'car_total_laps',[]))
+    result['total_collisions'] = toList(getattr(experiment,'car_total_collisions',[]))
+    result['total_car_collisions'] = toList(getattr(experiment,'car_total_car_collisions',[]))
+    result['total_boundary_violation'] = toList(getattr(experiment,'car_total_boundary_violation',[]))
+    result['ensemble'] = getattr(experiment,'ensemble_stats',None)
+    result['noise_seed'] = getattr(experiment,'noise_seed',None)
+    result['deadline_overruns'] = getattr(experiment,'deadline_overrun_count',None)
+    try:
+        result['watchdog_triggered'] = experiment.watchdog.triggered
+    except AttributeError:
+        result['watchdog_triggered'] = None
+    if (log_latency):
+        result['latency'] = experiment.timer.latencyStats()
+    return result
+
+# config filenames of successfully completed experiments in results file
+def completedExperiments(results_filename):
+    completed = set()
+    if (not os.path.isfile(results_filename)):
+        return completed
+    with open(results_filename,'r') as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                # partially written last line from an interrupted run
+                continue
+            if ('error' not in result):
+                completed.add(result['config_filename'])
+    return completed
 
-skip = 0
 if __name__ == '__main__':
-    if (len(sys.argv) == 2):
-        name = sys.argv[1]
-    else:
-        print_error("you must specify a folder name under configs/")
+    parser = argparse.ArgumentParser(description='run all configs/<name>/exp*.xml in parallel')
+    parser.add_argument('name', help='folder name under configs/')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count(), help='number of worker processes')
+    parser.add_argument('--seed', type=int, default=0, help='base seed, experiment i uses seed+i')
+    parser.add_argument('--latency', action='store_true', help='record step latency percentiles of each experiment')
+    args = parser.parse_args()
+    name = args.name
 
     pattern = './configs/'+name+'/exp*.xml'
-    config_filename_vec = glob.glob(pattern)
-
-    '''
-    pattern1 = './configs/'+'grid8'+'/exp*.xml'
-    config_filename_vec1 = glob.glob(pattern1)
-    pattern2 = './configs/'+'grid11'+'/exp*.xml'
-    config_filename_vec2 = glob.glob(pattern1)
-    config_filename_vec = config_filename_vec1 + config_filename_vec2
-    '''
+    config_filename_vec = sorted(glob.glob(pattern))
 
     if (len(config_filename_vec) == 0):
         print_error("no file fitting pattern ",pattern)
     print_info('total configs: %d'%len(config_filename_vec))
 
-    # TODO add progress report, suppress output
-    print_info('skipping first %d exp'%(skip))
-    count = 0
-    for config_filename in config_filename_vec:
-        if (count < skip):
-            print_info('skipping ',config_filename)
-            count += 1
-            continue
-        experiment = Main(config_filename)
-        experiment.experiment_name = name
-        experiment.init()
-        experiment.run()
+    log_folder = '../log/' + name + '/'
+    os.makedirs(log_folder,exist_ok=True)
+    results_filename = os.path.join(log_folder,'batch_results.jsonl')
+    completed = completedExperiments(results_filename)
+    # seed is tied to position in the full list so a resumed batch uses the same seeds
+    jobs = [(config_filename, name, args.seed+i, log_folder, args.latency) for i,config_filename in enumerate(config_filename_vec) if config_filename not in completed]
+    print_info('skipping %d completed exp, %d remaining'%(len(config_filename_vec)-len(jobs),len(jobs)))
+    print_info('results will be saved to '+results_filename)
+
+    # spawn so each worker starts clean (no inherited CUDA context), one experiment per worker
+    # since Car, Extension and simulators keep state in class variables
+    context = multiprocessing.get_context('spawn')
+    t0 = time()
+    done = 0
+    failed = 0
+    with context.Pool(processes=min(args.jobs,max(len(jobs),1)),maxtasksperchild=1) as pool:
+        for result in pool.imap_unordered(runExperiment,jobs):
+            done += 1
+            with open(results_filename,'a') as f:
+                f.write(json.dumps(result)+'\n')
+            if ('error' in result):
+                failed += 1
+                print_warning(result['config_filename']+' failed:\n'+result['error'])
+            elapsed = time()-t0
+            eta = elapsed/done*(len(jobs)-done)
+            print_info('[%d/%d] %s, elapsed %.0f s, ETA %.0f s'%(done,len(jobs),result['config_filename'],elapsed,eta))
+
+    print_ok('batch complete, %d experiments in %.0f s, %d failed'%(done,time()-t0,failed))
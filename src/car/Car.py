@@ -1,5 +1,4 @@
 from common import *
-import serial
 from math import atan2,radians,degrees,sin,cos,pi,tan,copysign,asin,acos,isnan,exp,pi
 class Car(PrintObject):
     car_count = 0
@@ -10,6 +9,8 @@ class Car(PrintObject):
         self.controller = None
         self._throttle = 0.0
         self._steering = 0.0
+        # if set, states are computed by calling states_source(car) on first access
+        self.states_source = None
         #x,y,heading,v_forward,v_sideways(left positive),omega(angular speed,turning to left positive)
         self.states = (0,0,0,0,0,0)
         # default values, will be overridden
@@ -17,6 +18,24 @@ class Car(PrintObject):
         self.max_steering_left = radians(26.1)
         self.max_steering_right = radians(26.1)
         self.debug_dict = {}
+        # set by Watchdog to stop this car without ending an ensemble experiment
+        self.retired = False
+
+    # simulators that don't keep cartesian states (CurvilinearSimulator) set states_source
+    # so states are only computed when a controller or extension reads them
+    @property
+    def states(self):
+        if (self.states_source is not None):
+            self._states = self.states_source(self)
+            self.states_source = None
+        return self._states
+
+    @states.setter
+    def states(self,val):
+        self._states = val
+        self.states_source = None
+        # tells simulators keeping their own state that states were changed from outside
+        self.states_assigned = True
 
     @property
     def throttle(self):
@@ -53,7 +72,7 @@ class Car(PrintObject):
         pass
 
     def control(self):
-        if (self.controller is None):
+        if (self.controller is None or self.retired):
             self.throttle = 0.0
             self.steering = 0.0
         else:
@@ -61,7 +80,10 @@ class Car(PrintObject):
             self.controller.control()
             #print_info("[Car]: "+"T=%4.1f, S=%4.1f"%(self.throttle, degrees(self.steering)))
             #print_info(self.states)
+        self.applyControl()
 
+    # called after throttle and steering are set, by control() or a batched controller
+    def applyControl(self):
         if (self.main.slowdown.is_set()):
             self.throttle = 0.0
         if (self.main.experiment_type == ExperimentType.Realworld):
@@ -75,28 +97,24 @@ class Car(PrintObject):
     @classmethod
     def Factory(cls, main, config):
         # TODO error handling, it's ok there's no hardware
+        # config is compiled by util.configCompiler, class names are already resolved
         try:
-            hardware_class_text = config.getElementsByTagName('hardware')[0].firstChild.nodeValue
-            exec('from car import '+hardware_class_text)
+            hardware_class = config.getElementsByTagName('hardware')[0].cls
         except IndexError:
             self.print_warning('no hardware specified')
 
         config_controller = config.getElementsByTagName('controller')[0]
-        controller_class_text = config_controller.getElementsByTagName('type')[0].firstChild.nodeValue
+        controller = config_controller.getElementsByTagName('type')[0].cls
 
         try:
-            init_states_text = config.getElementsByTagName('init_states')[0].firstChild.nodeValue
-            init_states = eval(init_states_text)
+            init_states = config.getElementsByTagName('init_states')[0].value
         except IndexError:
             print_warning('Car: no initial state specified')
             init_states = (0,0,0,0)
 
         config_name = config.getElementsByTagName('config_name')[0].firstChild.nodeValue
-        exec('from controller import '+controller_class_text)
-        controller = eval(controller_class_text)
-        config_name = config_name
 
-        car = eval(hardware_class_text)(main)
+        car = hardware_class(main)
 
         # (x,y,theta,vforward,vsideway=0,omega)
         x,y,heading,v_forward = init_states
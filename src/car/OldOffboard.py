@@ -1,6 +1,7 @@
 from .Car import Car
 from common import *
-import serial
+from util.lazyImport import lazyImport
+serial = lazyImport('serial')
 from math import atan2,radians,degrees,sin,cos,pi,tan,copysign,asin,acos,isnan,exp,pi
 class OldOffboard(Car):
     car_count = 0
@@ -56,12 +56,17 @@ class ConfigObject(PrintObject):
             self.print_warning('no config available')
             return
         self.print_ok("setting " + config.firstChild.nodeValue + " attributes")
+        # compiled config (util.configCompiler) carries evaluated values
+        evaluated = getattr(config,'evaluated',None)
         # load config parameters
         for key,value_text in config.attributes.items():
-            try:
-                value = eval(value_text)
-            except NameError:
-                value = value_text
+            if evaluated is not None:
+                value = evaluated[key]
+            else:
+                try:
+                    value = eval(value_text)
+                except NameError:
+                    value = value_text
             setattr(self,key,value)
             self.print_info(config.firstChild.nodeValue, ".",key,'=',value_text)
 
@@ -29,6 +29,24 @@ class CarController(ConfigObject):
         steering = 0.0
         return (throttle, steering)
 
+    # True if control() of this controller can be replaced by a controlBatch() call
+    # together with other instances of the same class and parameters (ensemble copies)
+    def canControlBatch(self):
+        return False
+
+    # same as calling control() of every controller, controllers are instances of cls
+    # made from the same config, subclasses override this with a vectorized version
+    @classmethod
+    def controlBatch(cls, controllers):
+        for controller in controllers:
+            controller.control()
+
+    # called by DeadlineMonitor when control can't keep up with main.dt
+    # reduce computation (samples, horizon, planning ...) and return True
+    # return False if there's nothing to reduce
+    def degrade(self):
+        return False
+
     # predict car's future trajectory over a short horizon
     # simple baseline method use current control and a kinematic model
     # update predicted_traj vector
@@ -48,6 +66,7 @@ class CarController(ConfigObject):
         img = self.car.main.visualization.visualization_img
         for coord in trajectory:
             img = self.car.main.track.drawCircle(img,coord, 0.02, color=(0,0,0))
+        self.car.main.visualization.markDirtyCoords(trajectory,int(0.02*self.car.main.track.resolution)+1)
         self.car.main.visualization.visualization_img = img
         return
 
@@ -43,6 +43,29 @@ class PidController:
         self.mag_d = d_term
         return p_term + i_term + d_term
 
+    # control() of several controllers with the same gains at once
+    # x0, x: arrays with one entry per controller, returns control output array
+    @staticmethod
+    def controlBatch(controllers, x0, x):
+        first = controllers[0]
+        x0 = np.broadcast_to(np.asarray(x0,dtype=float),np.shape(x))
+        last_error = np.array([c.__last_error for c in controllers],dtype=float)
+        integral = np.array([c.__integral for c in controllers],dtype=float)
+        error = x0 - x
+        error = (1 - first.__alpha) * last_error + first.__alpha * error
+        p_term = first.__p * error
+        integral = np.clip(integral + error * first.__dt, -first.__integral_limit, first.__integral_limit)
+        i_term = first.__i * integral
+        d_term = first.__d * (error - last_error) / first.__dt
+        for k,c in enumerate(controllers):
+            c.__integral = integral[k]
+            c.__last_error = error[k]
+            c.__last_x0 = x0[k]
+            c.mag_p = p_term[k]
+            c.mag_i = i_term[k]
+            c.mag_d = d_term[k]
+        return p_term + i_term + d_term
+
     def getDebug(self):
         return (self.mag_p, self.mag_i, self.mag_d)
 
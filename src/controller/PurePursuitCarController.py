@@ -2,8 +2,8 @@ from common import *
 from math import isnan,pi,degrees,radians,sin,cos
 from controller.CarController import CarController
 from controller.PidController import PidController
-from planner import Planner
-import matplotlib.pyplot as plt
+from util.lazyImport import lazyImport
+plt = lazyImport('matplotlib.pyplot')
 
 class PurePursuitCarController(CarController):
     def __init__(self, car,config):
@@ -19,7 +19,7 @@ class PurePursuitCarController(CarController):
         # TODO put this in a parent class constructor
         try:
             config_planner = config.getElementsByTagName('planner')[0]
-            planner_class = eval(config_planner.firstChild.nodeValue)
+            planner_class = config_planner.cls
             self.planner = planner_class(config_planner)
             self.planner.main = self.main
             self.planner.car = self.car
@@ -129,6 +129,50 @@ class PurePursuitCarController(CarController):
 
         return None
 
+    def canControlBatch(self):
+        return self.planner is None
+
+    # control() of ensemble copies at once, same control law
+    @classmethod
+    def controlBatch(cls, controllers):
+        first = controllers[0]
+        cars = [controller.car for controller in controllers]
+        raceline_pnts = first.track.raceline_points.T
+        raceline_speed = first.track.raceline_velocity
+        states = np.array([car.states for car in cars],dtype=float)
+        x,y,heading,vf = states[:,0],states[:,1],states[:,2],states[:,3]
+
+        # find control point of distance lookahead, (cars, raceline points)
+        dist = ((raceline_pnts[:,0] - x[:,np.newaxis])**2 + (raceline_pnts[:,1] - y[:,np.newaxis])**2)**0.5
+        idx_car = np.argmin(dist,axis=1)
+        # only points from idx_car on are candidates
+        after_car = np.arange(dist.shape[1]) >= idx_car[:,np.newaxis]
+        idx_lookahead = np.argmin(np.where(after_car, np.abs(dist - first.lookahead), np.inf),axis=1)
+
+        # change to local reference frame
+        dx = raceline_pnts[idx_lookahead,0] - x
+        dy = raceline_pnts[idx_lookahead,1] - y
+        dx_body = dx*np.cos(heading) + dy*np.sin(heading)
+        dy_body = -dx*np.sin(heading) + dy*np.cos(heading)
+
+        # pure pursuit
+        theta = np.arctan2(dx_body,dy_body)
+        R = dist[np.arange(len(cars)),idx_lookahead] / 2 / np.cos(theta)
+        wheelbase = np.array([car.wheelbase for car in cars])
+        steering = np.copysign(np.arctan2(wheelbase,R),dy_body)
+        max_steering_left = np.array([car.max_steering_left for car in cars])
+        max_steering_right = np.array([car.max_steering_right for car in cars])
+        steering = np.minimum(np.maximum(steering,-max_steering_right),max_steering_left)
+
+        v_target = np.minimum(raceline_speed[idx_car], first.max_speed)
+        acc_target = PidController.controlBatch([controller.throttle_pid for controller in controllers],v_target,vf)
+        max_throttle = np.array([car.max_throttle for car in cars])
+        throttle = np.clip((acc_target + 1.01294228)/4.95445214,-1,max_throttle)
+
+        for i,car in enumerate(cars):
+            car.throttle = throttle[i]
+            car.steering = steering[i]
+
 
     # PID controller for forward velocity
     def calcThrottle(self,state,v_target):
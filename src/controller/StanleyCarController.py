@@ -2,7 +2,6 @@ from common import *
 from math import isnan,pi,degrees,radians,sin,cos
 from controller.CarController import CarController
 from controller.PidController import PidController
-from planner import Planner
 
 class StanleyCarController(CarController):
     def __init__(self, car,config):
@@ -40,7 +39,7 @@ class StanleyCarController(CarController):
         self.no_planner_override = True
         try:
             config_planner = config.getElementsByTagName('planner')[0]
-            planner_class = eval(config_planner.firstChild.nodeValue)
+            planner_class = config_planner.cls
             self.planner = planner_class(config_planner)
             self.planner.main = self.main
             self.planner.car = self.car
@@ -81,6 +80,61 @@ class StanleyCarController(CarController):
         #self.predict()
         return valid
 
+    def canControlBatch(self):
+        return self.planner is None and hasattr(self.track,'localTrajectoryBatch')
+
+    # control() of ensemble copies with one track.localTrajectoryBatch() call
+    # same control law as ctrlCar()
+    @classmethod
+    def controlBatch(cls, controllers):
+        first = controllers[0]
+        cars = [controller.car for controller in controllers]
+        states = np.array([car.states for car in cars],dtype=float)
+        _,offset,orientation,_,v_target,_,_ = first.track.localTrajectoryBatch(states)
+        v_target = np.minimum(v_target, first.max_speed)
+        # nan offset (off track) compares False
+        valid = np.abs(offset) <= first.max_offset
+
+        heading = states[:,2]
+        vf = states[:,3]
+        P = np.clip(first.Pfun_slope*np.abs(vf)+first.Pfun_offset,0.5,4.0)/280*pi/0.01
+        steering = (orientation-heading) - (offset * P)
+        steering = (steering+pi)%(2*pi) -pi
+        max_steering_left = np.array([car.max_steering_left for car in cars])
+        max_steering_right = np.array([car.max_steering_right for car in cars])
+        steering = np.minimum(np.maximum(steering,-max_steering_right),max_steering_left)
+
+        # speed controller only runs for valid cars, as in ctrlCar()
+        throttle = np.zeros(len(cars))
+        index = np.flatnonzero(valid)
+        if (len(index) > 0):
+            pids = [controllers[i].throttle_pid for i in index]
+            acc_target = PidController.controlBatch(pids,v_target[index],vf[index])
+            max_throttle = np.array([cars[i].max_throttle for i in index])
+            throttle[index] = np.clip((acc_target + 1.01294228)/4.95445214,-1,max_throttle)
+
+        for i,controller in enumerate(controllers):
+            car = cars[i]
+            if valid[i]:
+                controller.debug_dict = {}
+                car.throttle = throttle[i]
+                car.steering = steering[i]
+            else:
+                controller.debug_dict = {'offset':0.0 if np.isnan(offset[i]) else offset[i]}
+                controller.print_warning(" car %d invalid results from ctrlCar", car.id)
+                car.throttle = 0.0
+                car.steering = 0.0
+            car.debug_dict.update(controller.debug_dict)
+
+    # planner is the expensive part, follow raceline directly without it
+    def degrade(self):
+        if (self.planner is None):
+            return False
+        self.print_warning("car %d disabling planner"%(self.car.id))
+        self.planner = None
+        self.no_planner_override = True
+        return True
+
 # given state of the vehicle and an instance of track, provide throttle and steering output
 # input:
 #   state: (x,y,heading,v_forward,v_sideway,omega)
@@ -1,12 +1,15 @@
-from controller.CarController import CarController
-try:
-    from controller.ccmppi.CcmppiCarController import CcmppiCarController
-    from controller.mppi.MppiCarController import MppiCarController
-    from controller.cvar.CvarCarController import CvarCarController
-except ModuleNotFoundError as e:
-    print("mppi/ccmppi import failure,skipping : ",str(e))
-from controller.PidController import PidController
-from controller.StanleyCarController import StanleyCarController
-from controller.PurePursuitCarController import PurePursuitCarController
-from controller.EmptyCarController import EmptyCarController
-from controller.CopgCarController import CopgCarController
+# controllers are imported on first access (e.g. from controller import StanleyCarController)
+# so pycuda (mppi, ccmppi, cvar) and torch (copg) are only loaded when used
+from util.lazyImport import lazyPackage
+
+lazyPackage(__name__,{
+    'CarController' : 'controller.CarController',
+    'CcmppiCarController' : 'controller.ccmppi.CcmppiCarController',
+    'MppiCarController' : 'controller.mppi.MppiCarController',
+    'CvarCarController' : 'controller.cvar.CvarCarController',
+    'PidController' : 'controller.PidController',
+    'StanleyCarController' : 'controller.StanleyCarController',
+    'PurePursuitCarController' : 'controller.PurePursuitCarController',
+    'EmptyCarController' : 'controller.EmptyCarController',
+    'CopgCarController' : 'controller.CopgCarController',
+})
@@ -1,6 +1,7 @@
 import numpy as np
 from common import *
 from extension.Extension import Extension
+from util.ensemble import groupByEnsemble,distribution,formatDistribution
 
 # count number of times car is in collision with boundary
 class BoundaryChecker(Extension):
@@ -9,7 +10,7 @@ class BoundaryChecker(Extension):
         # running sum of collision count, reset every lap
         self.collision_count = [0] * len(self.main.cars)
         # collision count by lap
-        self.collision_by_lap_vec = [[] * len(self.main.cars)]
+        self.collision_by_lap_vec = [[] for car in self.main.cars]
 
     def postInit(self):
         self.discretized_raceline = self.main.cars[0].controller.discretized_raceline
@@ -41,6 +42,11 @@ class BoundaryChecker(Extension):
             mean_vec.append(mean)
             self.print_info("car %d, total boundary violation = %d, mean = %.2f"%(i,total, mean))
         self.main.car_total_boundary_violation = total_vec
+        if (self.main.ensemble_size > 1):
+            stats = [distribution(group) for group in groupByEnsemble(self.main.cars,total_vec)]
+            for source,dist in enumerate(stats):
+                self.print_info("ensemble car%d total boundary violation: "%(source)+formatDistribution(dist))
+            self.main.ensemble_stats['boundary_violation'] = stats
 
     def isOutOfBoundary(self,car):
         x,y,heading,vf,vs,omega = car.states
@@ -1,25 +1,34 @@
 import numpy as np
 from common import *
 from extension.Extension import Extension
+from util.ensemble import groupByEnsemble,distribution,formatDistribution
 
 # check collision with static obstacles
+# and count car to car contacts reported by simulator (car.new_car_contact)
 class CollisionChecker(Extension):
     def __init__(self,main):
         Extension.__init__(self,main)
         self.collision_count = [0] * len(self.main.cars)
         # collision count by lap
-        self.collision_by_lap_vec = [[] * len(self.main.cars)]
+        self.collision_by_lap_vec = [[] for car in self.main.cars]
+        # car to car contacts, a contact lasting several steps is counted once
+        self.car_collision_count = [0] * len(self.main.cars)
 
     def update(self):
+        states = np.array([car.states for car in self.main.cars])
+        in_obstacle,_,_ = self.main.track.isInObstacleBatch(states)
         for i in range(len(self.main.cars)):
             car = self.main.cars[i]
-            if (self.main.track.isInObstacle(car.states)[0]):
+            if (in_obstacle[i]):
                 self.print_info('collision with obstacle')
                 self.collision_count[i] += 1
                 car.in_collision = True
                 #print_ok(self.prefix(), "collision = %d"%(self.collision_count[i]))
             else:
                 car.in_collision = False
+            if (getattr(car,'new_car_contact',False)):
+                self.print_info('car %d collision with car %s'%(car.id,str(car.car_contacts)))
+                self.car_collision_count[i] += 1
             try:
                 if (car.laptimer.new_lap.is_set()):
                     self.collision_by_lap_vec[i].append(self.collision_count[i])
@@ -36,6 +45,14 @@ class CollisionChecker(Extension):
             total_vec.append(total)
             mean_vec.append(mean)
             self.print_info("car %d, total obstacle collision = %d, mean = %.2f"%(i,total, mean))
+            if (self.car_collision_count[i] > 0):
+                self.print_info("car %d, total car collision = %d"%(i,self.car_collision_count[i]))
         self.main.car_total_collisions = total_vec
+        self.main.car_total_car_collisions = self.car_collision_count
+        if (self.main.ensemble_size > 1):
+            stats = [distribution(group) for group in groupByEnsemble(self.main.cars,total_vec)]
+            for source,dist in enumerate(stats):
+                self.print_info("ensemble car%d total obstacle collision: "%(source)+formatDistribution(dist))
+            self.main.ensemble_stats['collision'] = stats
 
 
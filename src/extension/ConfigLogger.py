@@ -2,7 +2,6 @@
 import numpy as np
 from common import *
 from extension.Extension import Extension
-from xml.dom import minidom
 import os
 
 class ConfigLogger(Extension):
@@ -10,11 +9,11 @@ class ConfigLogger(Extension):
         Extension.__init__(self,main)
 
     def init(self):
-        config = minidom.parse(self.main.config_filename)
+        config = self.main.config
         config_extensions = config.getElementsByTagName('extensions')[0]
         for config_extension in config_extensions.getElementsByTagName('extension'):
             if config_extension.getAttribute('handle') == 'simulator':
-                self.noise = eval(config_extension.getAttribute('state_noise_magnitude'))[0]
+                self.noise = config_extension.evaluated['state_noise_magnitude'][0]
 
     def postFinal(self):
         # stuff to log down
@@ -38,8 +37,7 @@ class ConfigLogger(Extension):
         entry.append(self.main.lap_counter.total_laps)
 
         # retrieve cvar params
-        config_filename = self.main.config_filename
-        config = minidom.parse(config_filename)
+        config = self.main.config
         config_cars = config.getElementsByTagName('cars')[0]
         config_car = config_cars.getElementsByTagName('car')[0]
         config_controller = config_car.getElementsByTagName('controller')[0]
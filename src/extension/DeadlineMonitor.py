@@ -0,0 +1,147 @@
+# monitor computation time of each control loop tick against main.dt
+# time spent waiting for a new state (main.new_state_update) or for real time
+# (Simulator.matchRealTime) is excluded, so what's measured is the time the
+# main loop needs to produce a command after a state becomes available
+#
+# after max_consecutive_miss consecutive overruns the next action in policy is applied,
+# actions are applied in order, one each time the trigger is hit again
+#   'log'                 : only record the overrun
+#   'skip_extensions'     : update non-critical extensions (visualization, plotting) skip_factor times less often
+#   'degrade_controller'  : ask each controller to reduce computation, see CarController.degrade()
+#   'fallback_controller' : replace each car's controller with fallback_controller (e.g. 'StanleyCarController')
+#   'slowdown'            : set main.slowdown, cars cut throttle
+# e.g. <extension handle='deadline' policy="['skip_extensions','fallback_controller','slowdown']" fallback_controller='StanleyCarController'>DeadlineMonitor</extension>
+# the fallback controller is configured only by fallback_config, a dict of controller attributes,
+# e.g. fallback_config="{'max_speed':1.5}", not by the config of the controller it replaces
+#
+# overruns are measured in postUpdate, so this should be the last extension in config
+import json
+from time import time
+from common import *
+from extension.Extension import Extension
+from util.configCompiler import ConfigNode
+
+class DeadlineMonitor(Extension):
+    def __init__(self,main):
+        Extension.__init__(self,main)
+        # default values, will be overridden if defined in config
+        # deadline in seconds, None to use main.dt
+        self.deadline = None
+        self.max_consecutive_miss = 3
+        self.policy = ['skip_extensions']
+        self.skip_factor = 4
+        self.fallback_controller = None
+        # attributes of fallback controller, class defaults are used for the rest
+        self.fallback_config = {}
+        # if set, overruns and actions are saved to this json file
+        self.log_filename = None
+
+        self.consecutive_miss = 0
+        self.overrun_count = 0
+        self.tick_count = 0
+        self.max_overrun = 0.0
+        # index of next action in policy
+        self.policy_index = 0
+        # (tick, sim/wall time, duration) of each overrun
+        self.overruns = []
+        # (tick, sim/wall time, action) of each applied action
+        self.actions = []
+
+    # must run every step to see every tick
+    def getUpdatePeriod(self,dt):
+        if (self.update_rate is not None):
+            self.print_warning("update_rate is ignored for DeadlineMonitor")
+        return 1
+
+    def init(self):
+        if (self.deadline is None):
+            self.deadline = self.main.dt
+        if (isinstance(self.policy,str)):
+            self.policy = [self.policy]
+        for action in self.policy:
+            if (not hasattr(self,'apply_'+action)):
+                self.print_error("unknown policy "+str(action))
+        if ('fallback_controller' in self.policy and self.fallback_controller is None):
+            self.print_error("fallback_controller policy requires fallback_controller attribute")
+        if (not isinstance(self.fallback_config,dict)):
+            self.print_error("fallback_config must be a dict of controller attributes, got "+str(self.fallback_config))
+        if (self.main.extensions[-1] is not self):
+            self.print_warning("not the last extension, postUpdate of later extensions is not measured")
+        self.print_info("deadline %.1f ms, policy %s after %d consecutive miss"%(self.deadline*1e3,str(self.policy),self.max_consecutive_miss))
+
+    def postUpdate(self):
+        duration = time() - self.main.tick_start - self.main.tick_wait
+        self.tick_count += 1
+        if (duration <= self.deadline):
+            self.consecutive_miss = 0
+            return
+        self.consecutive_miss += 1
+        self.overrun_count += 1
+        self.max_overrun = max(self.max_overrun, duration)
+        self.overruns.append((self.main.step, self.main.time(), duration))
+        if (self.consecutive_miss >= self.max_consecutive_miss):
+            self.consecutive_miss = 0
+            self.trigger(duration)
+
+    def trigger(self,duration):
+        if (self.policy_index >= len(self.policy)):
+            return
+        action = self.policy[self.policy_index]
+        self.policy_index += 1
+        self.print_warning("%d consecutive overruns (last %.1f ms > %.1f ms), applying %s"%(self.max_consecutive_miss,duration*1e3,self.deadline*1e3,action))
+        self.actions.append((self.main.step, self.main.time(), action))
+        getattr(self,'apply_'+action)()
+
+    def apply_log(self):
+        pass
+
+    def apply_skip_extensions(self):
+        for item in self.main.extensions:
+            if (not item.critical):
+                item.period_scale *= self.skip_factor
+                self.print_info(item.name+" update period x%d"%(item.period_scale))
+        self.main.buildSchedule()
+
+    def apply_degrade_controller(self):
+        for car in self.main.cars:
+            if (car.controller is not None and not car.controller.degrade()):
+                self.print_info("car %d controller %s can't be degraded"%(car.id,car.controller.__class__.__name__))
+
+    def apply_fallback_controller(self):
+        import controller
+        controller_class = getattr(controller,self.fallback_controller)
+        for car in self.main.cars:
+            if (isinstance(car.controller,controller_class)):
+                continue
+            car.controller = controller_class(car,self.fallbackConfig())
+            car.controller.init()
+            self.print_info("car %d switched to %s"%(car.id,self.fallback_controller))
+
+    # config node for fallback controller, same form as a compiled <controller> node
+    def fallbackConfig(self):
+        config = ConfigNode('controller',self.fallback_controller)
+        for key,value in self.fallback_config.items():
+            config.attributes[key] = repr(value)
+            config.evaluated[key] = value
+        return config
+
+    def apply_slowdown(self):
+        self.main.slowdown.set()
+        self.main.slowdown_ts = time()
+
+    def final(self):
+        self.print_info("%d/%d ticks over %.1f ms deadline, max %.1f ms, %d actions applied"%(self.overrun_count,self.tick_count,self.deadline*1e3,self.max_overrun*1e3,len(self.actions)))
+        for step,ts,action in self.actions:
+            self.print_info("  tick %d (t = %.2f) %s"%(step,ts,action))
+        self.main.deadline_overrun_count = self.overrun_count
+        if (self.log_filename is not None):
+            log = {'deadline':self.deadline,
+                    'max_consecutive_miss':self.max_consecutive_miss,
+                    'policy':self.policy,
+                    'tick_count':self.tick_count,
+                    'overrun_count':self.overrun_count,
+                    'overruns':[{'tick':step,'t':ts,'duration':duration} for step,ts,duration in self.overruns],
+                    'actions':[{'tick':step,'t':ts,'action':action} for step,ts,action in self.actions]}
+            with open(self.log_filename,'w') as f:
+                json.dump(log,f,indent=2)
+            self.print_info("saved deadline log to "+self.log_filename)
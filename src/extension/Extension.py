@@ -5,6 +5,22 @@ class Extension(PrintObject):
         print_ok(self.prefix() + "in use")
         main.extensions.append(self)
         self.name = self.__class__.__name__
+        # update rate in Hz, None to update every step
+        # can be set in config, e.g. <extension update_rate='30'>
+        self.update_rate = None
+        # update every update_period steps, resolved by main
+        self.update_period = 1
+        # non-critical extensions (visualization, plotting ...) may be updated less often
+        # by DeadlineMonitor when the control loop can't keep up
+        self.critical = True
+        # multiplier on update period, set by DeadlineMonitor
+        self.period_scale = 1
+
+    # number of main.dt steps between two updates
+    def getUpdatePeriod(self,dt):
+        if (self.update_rate is None):
+            return self.period_scale
+        return max(1,int(round(1.0/(self.update_rate*dt))))*self.period_scale
 
 
     # optional initialization
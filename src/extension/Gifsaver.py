@@ -3,14 +3,16 @@ import numpy as np
 from common import *
 from extension.Extension import Extension
 
-from PIL import Image
-import cv2
+from util.lazyImport import lazyImport
+Image = lazyImport('PIL.Image')
+cv2 = lazyImport('cv2')
 import os.path
-import matplotlib.pyplot as plt
+plt = lazyImport('matplotlib.pyplot')
 
 class Gifsaver(Extension):
     def __init__(self,main):
         Extension.__init__(self,main)
+        self.critical = False
 
     def init(self):
 
@@ -2,7 +2,8 @@
 from extension.Extension import *
 from threading import Thread,Event
 from common import *
-import cv2
+from util.lazyImport import lazyImport
+cv2 = lazyImport('cv2')
 
 class LapCounter(Extension):
     def __init__(self, main):
@@ -22,6 +23,8 @@ class LapCounter(Extension):
 
     def update(self):
         for car in self.main.cars:
+            if (car.retired):
+                continue
             if (self.plotLapCountFlag):
                 self.plotLapCount(car)
             if car.laptimer.new_lap.is_set():
@@ -40,7 +43,11 @@ class LapCounter(Extension):
                     print_ok("[LapCounter]: car%d critical lap end"%(car.id))
                     car.critical_lap.clear()
                     # should we wait for next time step to st exit flag?
-                    self.main.exit_request.set()
+                    # in ensemble mode stop this copy and wait for all copies to finish
+                    if (self.main.ensemble_size > 1):
+                        car.retired = True
+                    if (self.main.ensemble_size == 1 or all(car.retired for car in self.main.cars)):
+                        self.main.exit_request.set()
 
     def plotLapCount(self,car):
         if (not self.main.visualization.update_visualization.is_set()):
@@ -61,4 +68,5 @@ class LapCounter(Extension):
         # Using cv2.putText() method
         img = cv2.putText(img, text, org, font,
                            fontScale, color, thickness, cv2.LINE_AA)
+        car.main.visualization.markDirtyText(text, org, font, fontScale, thickness)
         car.main.visualization.visualization_img = img
@@ -5,6 +5,7 @@ from math import sin,cos
 import numpy as np
 from time import time
 from common import *
+from util.ensemble import groupByEnsemble,distribution,formatDistribution
 import pickle
 
 class Laptimer(Extension):
@@ -64,6 +65,18 @@ class Laptimer(Extension):
                 car_laptime_stddev.append(stddev)
         self.main.car_laptime_mean = car_laptime_mean
         self.main.car_laptime_stddev = car_laptime_stddev
+        if (self.main.ensemble_size > 1):
+            self.showEnsembleStats()
+
+    # distribution of laptime over all laps of all copies of each car
+    def showEnsembleStats(self):
+        laptimes = [car.laptime_vec[1:] for car in self.main.cars]
+        stats = []
+        for source,group in enumerate(groupByEnsemble(self.main.cars,laptimes)):
+            dist = distribution(np.concatenate(group))
+            stats.append(dist)
+            print_info("[Laptimer]: ensemble car%d laptime: "%(source)+formatDistribution(dist))
+        self.main.ensemble_stats['laptime'] = stats
 
 
 class _Laptimer:
@@ -59,12 +59,14 @@ class Logger(Extension):
         # v_sideway in vehicle frame, left positive
         # omega in vehicle frame, axis pointing upward
         log_entry = []
+        # use simulation time in headless mode so logs are reproducible
+        ts = self.main.sim_t if self.main.headless else time()
         for i in range(len(self.main.cars)):
             car = self.main.cars[i]
             (x,y,theta,v_forward,v_sideway,omega) = car.states
 
             # (time, x,y,theta,vforward,vsideway=0,omega)
-            log_entry.append([time(),x,y,theta,v_forward,v_sideway,omega, car.steering,car.throttle])
+            log_entry.append([ts,x,y,theta,v_forward,v_sideway,omega, car.steering,car.throttle])
 
         self.full_state_log.append(log_entry)
 
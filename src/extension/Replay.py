@@ -6,7 +6,8 @@ from extension.Extension import Extension
 from extension import Simulator
 from math import atan2,radians,degrees,sin,cos,pi,tan,copysign,asin,acos,isnan
 from scipy.interpolate import splprep, splev,CubicSpline,interp1d
-import matplotlib.pyplot as plt
+from util.lazyImport import lazyImport
+plt = lazyImport('matplotlib.pyplot')
 
 class Replay(Simulator):
     def __init__(self,main):
@@ -2,6 +2,8 @@ from common import *
 from extension import Extension
 from time import time,sleep
 import numpy as np
+from util.carCollision import findContacts,resolveContacts
+from util.noiseBuffer import NoiseBuffer
 # base class for all simulators
 # contains code for aligning simulator time with real time
 
@@ -17,6 +19,20 @@ class Simulator(Extension,PrintObject):
         self.state_noise_magnitude = None
         self.state_noise_type = None
         self.state_noise_probability = None
+        # state noise is drawn from its own generator, seeded with noise_seed
+        # (main.seed if None, a random seed that's printed if that's None too)
+        # noise_offset: step to start the noise sequence from, to replay part of a run
+        self.noise_seed = None
+        self.noise_offset = 0
+        self.noise_block_size = 1000
+        # car to car collision, cars are rectangles of car.width by car.L*car_length_scale
+        # response: 'impulse' (elastic with car_collision_restitution), 'slowdown'
+        # (speed scaled by car_collision_speed_factor) or 'none' (detect only)
+        self.car_collision = True
+        self.car_collision_response = 'impulse'
+        self.car_collision_restitution = 0.3
+        self.car_collision_speed_factor = 0.5
+        self.car_length_scale = 1.5
 
         self.t0 = None
         self.real_sim_time_ratio = 1.0
@@ -32,42 +48,96 @@ class Simulator(Extension,PrintObject):
             assert (self.state_noise_type is not None)
             assert (self.state_noise_magnitude is not None)
             self.state_noise_magnitude = np.array(self.state_noise_magnitude)
+            n = len(self.main.cars)
             if (self.state_noise_type == 'normal'):
                 self.addStateNoise = self.addStateNoiseNormal
+                shape = (n,6)
             elif (self.state_noise_type == 'uniform'):
                 self.addStateNoise = self.addStateNoiseUniform
+                shape = (n,6)
             elif (self.state_noise_type == 'impulse'):
                 assert (self.state_noise_probability is not None)
                 self.addStateNoise = self.addStateNoiseImpulse
+                shape = (n,)
             else:
                 self.print_error('unknown noise type ',self.state_noise_type)
+            if (self.noise_seed is None):
+                self.noise_seed = getattr(self.main,'seed',None)
+            if (self.noise_seed is None):
+                self.noise_seed = np.random.SeedSequence().entropy
+            self.noise = NoiseBuffer(self.state_noise_type,shape,self.noise_seed,self.noise_block_size,self.noise_offset)
+            self.main.noise_seed = self.noise_seed
+            self.print_info("state noise seed %d, offset %d"%(self.noise_seed,self.noise_offset))
 
 
+    # subclass calls this once self.cars is set
+    def initCarCollision(self):
+        if (self.car_collision_response not in ['impulse','slowdown','none']):
+            self.print_error("unknown car_collision_response "+str(self.car_collision_response))
+        self.car_length = np.array([car.L*self.car_length_scale for car in self.cars],dtype=float)
+        self.car_width = np.array([car.width for car in self.cars],dtype=float)
+        # ensemble copies are independent and can't hit each other
+        self.car_group = np.array([getattr(car,'ensemble_member',0) for car in self.cars])
+        # pairs of car index in contact in last step
+        self.car_contact_pairs = set()
+        for car in self.cars:
+            car.car_contacts = []
+            car.new_car_contact = False
+
+    # detect and resolve car to car contacts, states (n,6) of self.cars is modified in place
+    # sets car.car_contacts (id of cars in contact) and car.new_car_contact (a contact started this step)
+    def handleCarCollision(self,states):
+        if (not self.car_collision or len(self.cars) < 2):
+            return
+        a,b,depth,normal = findContacts(states,self.car_length,self.car_width,self.car_group)
+        if (len(self.car_contact_pairs) == 0 and len(a) == 0):
+            return
+        if (self.car_collision_response != 'none'):
+            resolveContacts(states,a,b,depth,normal,self.car_collision_response,self.car_collision_restitution,self.car_collision_speed_factor)
+        pairs = set(zip(a.tolist(),b.tolist()))
+        for car in self.cars:
+            car.car_contacts = []
+            car.new_car_contact = False
+        for i,j in pairs:
+            self.cars[i].car_contacts.append(self.cars[j].id)
+            self.cars[j].car_contacts.append(self.cars[i].id)
+            if ((i,j) not in self.car_contact_pairs):
+                self.cars[i].new_car_contact = True
+                self.cars[j].new_car_contact = True
+        self.car_contact_pairs = pairs
+
+    # simulator advances main.sim_t and must run every step
+    def getUpdatePeriod(self,dt):
+        if (self.update_rate is not None):
+            self.print_warning("update_rate is ignored for simulators")
+        return 1
+
     def matchRealTime(self):
-        if (not self.match_time):
+        if (not self.match_time or self.main.headless):
             return
         if (self.t0 is None):
             self.t0 = time()
         time_to_reach = self.main.sim_t * self.real_sim_time_ratio + self.t0
         self.print_debug("sim_t = %.3f, time = %.3f, expected= %.3f, delta = %.3f"%(self.main.sim_t, time()-self.t0, self.main.sim_t*self.real_sim_time_ratio, time_to_reach-time() ))
-        if (time_to_reach-time() < 0):
-            pass
-            #print_warning("algorithm can't keep up ..... %.3f s"%(time()-time_to_reach))
-
-        sleep(max(0,time_to_reach - time()))
+        # falling behind is reported by DeadlineMonitor if loaded
+        sleep_time = max(0,time_to_reach - time())
+        self.main.tick_wait += sleep_time
+        sleep(sleep_time)
 
     def addStateNoiseNormal(self):
-        for car in self.cars:
-            car.states += np.random.normal(size=car.states.shape) * self.state_noise_magnitude * self.main.dt
+        noise = self.noise.next() * self.state_noise_magnitude * self.main.dt
+        for i,car in enumerate(self.cars):
+            car.states += noise[i]
 
     def addStateNoiseUniform(self):
-        for car in self.cars:
-            car.states += np.random.uniform(low=-1.0,high=1.0,size=car.states.shape) * self.state_noise_magnitude * self.main.dt
+        noise = self.noise.next() * self.state_noise_magnitude * self.main.dt
+        for i,car in enumerate(self.cars):
+            car.states += noise[i]
 
     def addStateNoiseImpulse(self):
-        for car in self.cars:
-            val = np.random.uniform()
-            if val < self.state_noise_probability:
+        mask = self.noise.next() < self.state_noise_probability
+        for i,car in enumerate(self.cars):
+            if mask[i]:
                 # to stay consistent with cvar_racecar.cu
                 '''
                 new_val = np.random.uniform()
@@ -1,9 +1,11 @@
 from extension.Extension import Extension
-import matplotlib.pyplot as plt
-import cv2
+from util.lazyImport import lazyImport
+plt = lazyImport('matplotlib.pyplot')
+cv2 = lazyImport('cv2')
 class SnapshotSaver(Extension):
     def __init__(self,main):
         Extension.__init__(self,main)
+        self.critical = False
 
     def postInit(self):
         self.background = self.main.track.drawTrack()
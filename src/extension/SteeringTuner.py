@@ -1,5 +1,6 @@
 from extension.Extension import Extension
-import matplotlib.pyplot as plt
+from util.lazyImport import lazyImport
+plt = lazyImport('matplotlib.pyplot')
 class SteeringTuner(Extension):
     def __init__(self,main):
         Extension.__init__(self,main)
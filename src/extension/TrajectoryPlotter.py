@@ -3,12 +3,14 @@ import numpy as np
 from common import *
 from extension.Extension import Extension
 
-import cv2
+from util.lazyImport import lazyImport
+cv2 = lazyImport('cv2')
 import os.path
 
 class TrajectoryPlotter(Extension):
     def __init__(self,main):
         Extension.__init__(self,main)
+        self.critical = False
         print_ok(self.prefix()+" in use")
 
     def init(self):
@@ -1,15 +1,24 @@
-import cv2
+from util.lazyImport import lazyImport
+cv2 = lazyImport('cv2')
 from time import sleep,time
 from common import *
 from extension.Extension import Extension
+from util.renderCache import composite
 from threading import Event
 import pickle
-import matplotlib.pyplot as plt
+plt = lazyImport('matplotlib.pyplot')
 from math import degrees,radians
-from PIL import Image
+
+# NOTE incremental rendering
+# the frame is kept between updates, instead of copying the whole background
+# every frame only regions drawn on last frame (cars, control bars, overlays from
+# controllers/extensions) are restored from background (img_track with obstacles) before drawing.
+# anything drawn on visualization_img must be reported with markDirty*()
+# so it is erased next frame, unreported drawings leave trails
 class Visualization(Extension):
     def __init__(self,main):
         super().__init__(main)
+        self.critical = False
         self.update_visualization = Event()
         self.update_freq = 100
         self.frame_dt = 1.0/self.update_freq
@@ -18,12 +27,27 @@ class Visualization(Extension):
         self.count = 0
         # default setting, will be overridden if defined in config
         self.car_graphics = False
+        # restore only dirty regions each frame, False copies whole background every frame
+        self.incremental = True
         self.track = self.main.track
+        # regions (x0,y0,x1,y1) in pixel drawn on current frame
+        self.dirty = []
+        # restore whole frame next update
+        self.full_redraw = True
+        self.frame = None
+        # img_track with obstacles, and the img_track it was made from
+        self.img_background = None
+        self.img_background_source = None
 
     def final(self):
         cv2.destroyAllWindows()
 
     def init(self,):
+        # in headless mode update_visualization is never set
+        # so nothing will be drawn
+        if (self.main.headless):
+            self.print_info("headless, visualization disabled")
+            return
         self.visualization_ts = time()
         self.img_track = self.main.track.drawTrack()
         self.img_blank_track = self.img_track.copy()
@@ -45,6 +69,8 @@ class Visualization(Extension):
 
 
     def postInit(self,):
+        if (self.main.headless):
+            return
         self.saveBlankImg()
 
 
@@ -66,6 +92,8 @@ class Visualization(Extension):
     # show image
     # do this last since controllers may need to alter the image
     def postUpdate(self,):
+        if (self.main.headless):
+            return
         if (self.update_visualization.is_set()):
             self.update_visualization.clear()
             self.visualization_ts = time()
@@ -95,19 +123,94 @@ class Visualization(Extension):
     def preUpdate(self,):
         # restrict update rate to 0.02s/frame, a rate higher than this can lead to frozen frames
         #print_info(self.prefix(), "preupdate %.1f"%(time()-self.visualization_ts))
+        if (self.main.headless):
+            return
         if (time()-self.visualization_ts > self.frame_dt):
             self.update_visualization.set()
 
         if (self.update_visualization.is_set()):
-            img = self.img_track.copy()
+            img = self.restoreFrame()
             for car in self.main.cars:
                 img = self.drawCar(img, car)
+                self.markDirty(*self.carBox(car))
             img = self.drawControlForAllCars(img)
-            img = self.track.plotObstacles(img)
+            img = self.track.plotObstacles(img,static=not self.incremental)
+            self.frame = img
             self.visualization_img = img
 
+    # background for a new frame, previous frame with dirty regions restored
+    # or a copy of background if static layers have changed
+    def restoreFrame(self):
+        if (not self.incremental):
+            self.dirty = []
+            return self.img_track.copy()
+        if (self.img_background_source is not self.img_track):
+            self.img_background = self.img_track.copy()
+            if (self.track.obstacle):
+                composite(self.img_background,self.track.layer('obstacles',self.img_background.shape))
+            self.img_background_source = self.img_track
+            self.full_redraw = True
+        background = self.img_background
+        frame = self.frame
+        if (self.full_redraw or frame is None or frame.shape != background.shape
+                or frame is background or frame is self.img_track):
+            self.full_redraw = False
+            self.dirty = []
+            return background.copy()
+        for x0,y0,x1,y1 in self.dirty:
+            frame[y0:y1,x0:x1] = background[y0:y1,x0:x1]
+        self.dirty = []
+        return frame
+
+    # next frame is redrawn from whole background, e.g. after img_track is modified in place
+    def invalidate(self):
+        self.img_background_source = None
+        self.full_redraw = True
+
+    # mark rectangle (x0,y0)-(x1,y1) in pixel (x1,y1 exclusive) as drawn on this frame
+    def markDirty(self,x0,y0,x1,y1):
+        x0 = max(int(x0),0)
+        y0 = max(int(y0),0)
+        x1 = int(x1)
+        y1 = int(y1)
+        if (x1 > x0 and y1 > y0):
+            self.dirty.append((x0,y0,x1,y1))
+
+    # mark bounding box of coords (n,2) in meter, plus margin in pixel
+    def markDirtyCoords(self,coords,margin=5):
+        coords = np.asarray(coords,dtype=float).reshape(-1,2)
+        if (len(coords) == 0):
+            return
+        # y axis is reversed on canvas
+        top_left = self.track.m2canvas((coords[:,0].min(),coords[:,1].max()))
+        bottom_right = self.track.m2canvas((coords[:,0].max(),coords[:,1].min()))
+        if (top_left is None or bottom_right is None):
+            self.invalidate()
+            return
+        self.markDirty(top_left[0]-margin,top_left[1]-margin,bottom_right[0]+margin+1,bottom_right[1]+margin+1)
+
+    # mark text drawn with cv2.putText at org (bottom left)
+    def markDirtyText(self,text,org,font,fontScale,thickness):
+        (width,height),baseline = cv2.getTextSize(text,font,fontScale,thickness)
+        self.markDirty(org[0]-thickness,org[1]-height-thickness,org[0]+width+thickness+1,org[1]+baseline+thickness+1)
+
+    # region drawCar() draws on, (x0,y0,x1,y1) in pixel
+    def carBox(self,car):
+        src = self.main.track.m2canvas(car.states[:2])
+        if (src is None):
+            return (0,0,0,0)
+        if (self.car_graphics):
+            height, width = car.image.shape[:2]
+            x, y = (src[0]-width//2), (src[1]-height//2)
+            return (x,y,x+width,y+height)
+        # longest arrow and line thickness
+        margin = 30 + 5
+        return (src[0]-margin,src[1]-margin,src[0]+margin+1,src[1]+margin+1)
+
 
     def final(self):
+        if (self.main.headless):
+            return
         img = self.img_track.copy()
         self.visualization_img = img
         self.update_visualization.set()
@@ -138,6 +241,9 @@ class Visualization(Extension):
         for car in self.main.cars:
             #img = self.drawAcceleration(img, car, (0,0))
             img = self.drawControl(img, car, (-10,offset))
+            # bars and labels, x1,y1 as in drawControl
+            x1,y1 = -10 + 30, offset
+            self.markDirty(x1,y1+20,x1+200,y1+65)
             offset += 60
         return img
 
@@ -230,8 +336,8 @@ class Visualization(Extension):
             return img
         return self.overlayCarRenderingRaw(img,car,src,heading)
 
-    # TODO optimize this
     # overlay Car rendering at specified location in pixel coord, for plotting controls
+    # blended into img in place, only within the rendering's box
     def overlayCarRenderingRaw(self,img, car, src,angle=np.pi/2):
         #x,y,heading, vf_lf, vs_lf, omega_lf = car.states
         #coord = (x,y)
@@ -248,15 +354,16 @@ class Visualization(Extension):
         scale = 40.0/height/200.0*self.track.resolution/0.0461*car.width 
         rotate_matrix = cv2.getRotationMatrix2D(center=center, angle=degrees(angle), scale=scale)
         rotated_car = cv2.warpAffine(src=car.image, M=rotate_matrix, dsize=(width, height)) 
-        overlay_t = Image.fromarray(cv2.cvtColor(rotated_car, cv2.COLOR_BGRA2RGBA))
-        bg_img = Image.fromarray(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
-        bg_img = Image.alpha_composite(Image.new("RGBA", bg_img.size),bg_img.convert('RGBA'))
         x, y = (src[0]-width//2), (src[1]-height//2)
-
-        bg_img.paste(overlay_t,(x,y),overlay_t)
-        bg_img = np.array(bg_img,dtype=np.uint8)
-        bg_img = cv2.cvtColor(bg_img, cv2.COLOR_RGBA2BGRA)
-        
-        return bg_img
+        # clip to canvas
+        x0, y0 = max(x,0), max(y,0)
+        x1, y1 = min(x+width,img.shape[1]), min(y+height,img.shape[0])
+        if (x0 >= x1 or y0 >= y1):
+            return img
+        sprite = rotated_car[y0-y:y1-y,x0-x:x1-x]
+        alpha = sprite[:,:,3:]/255.0
+        roi = img[y0:y1,x0:x1,:3]
+        img[y0:y1,x0:x1,:3] = (sprite[:,:,:3]*alpha + roi*(1.0-alpha) + 0.5).astype(np.uint8)
+        return img
 
 
@@ -11,28 +11,35 @@ class Watchdog(Extension):
 
     def postUpdate(self):
         for car in self.main.cars:
+            if (car.retired):
+                continue
             # if car is outside track, halt
             x = car.states[0]
             y = car.states[1]
             vf = car.states[3]
             if (self.track.isOutside((x,y)) ):
                 car.in_track = False
-                self.triggered = True
-                self.main.exit_request.set()
-                print_warning(self.prefix()+"car outside track, terminating experiment")
+                self.halt(car,"car outside track")
 
-            if (vf < 0.05):
+            elif (vf < 0.05):
                 car.in_track = True
-                self.triggered = True
-                self.main.exit_request.set()
-                print_warning(self.prefix()+"car stopped, terminating experiment")
+                self.halt(car,"car stopped")
 
             # if laptime is unreasonable, halt
-            if (car.laptimer.new_lap.is_set()):
+            elif (car.laptimer.new_lap.is_set()):
                 if(car.laptimer.last_laptime < 2.0 or self.main.sim_t - car.laptimer.last_lap_ts > 20):
-                    self.triggered = True
-                    self.main.exit_request.set()
-                    print_warning(self.prefix()+"unreasonable laptime: %.2f, terminating experiment"%(car.laptimer.last_laptime))
-
-
+                    self.halt(car,"unreasonable laptime: %.2f"%(car.laptimer.last_laptime))
 
+    # terminate experiment, in ensemble mode only this copy is stopped
+    # and experiment is terminated when all copies are stopped
+    def halt(self,car,reason):
+        self.triggered = True
+        if (self.main.ensemble_size == 1):
+            self.main.exit_request.set()
+            print_warning(self.prefix()+reason+", terminating experiment")
+            return
+        car.retired = True
+        print_warning(self.prefix()+"car%d "%(car.id)+reason+", stopping car")
+        if (all(car.retired for car in self.main.cars)):
+            self.main.exit_request.set()
+            print_warning(self.prefix()+"all cars stopped, terminating experiment")
@@ -1,26 +1,33 @@
-from extension.CollisionChecker import CollisionChecker
-from extension.CrosstrackErrorTracker import CrosstrackErrorTracker
-from extension.Extension import Extension
-from extension.Gifsaver import Gifsaver
-from extension.LapCounter import LapCounter
-from extension.Laptimer import Laptimer
-from extension.Logger import Logger
-from extension.Optitrack import Optitrack
-from extension.PerformanceTracker import PerformanceTracker
-from extension.Simulator import Simulator
-from extension.StepCounter import StepCounter
-from extension.TrajectoryPlotter import TrajectoryPlotter
-from extension.Visualization import Visualization
-from extension.Watchdog import Watchdog
-from extension.SteeringTracker import SteeringTracker
-from extension.SnapshotSaver import SnapshotSaver
-from extension.SteeringTuner import SteeringTuner
-from extension.BoundaryChecker import BoundaryChecker
-from extension.ConfigLogger import ConfigLogger
+# extensions are imported on first access (e.g. from extension import Laptimer)
+# so an experiment only loads the extensions it uses, together with their
+# dependencies (cv2, matplotlib, torch ...)
+from util.lazyImport import lazyPackage
 
+lazyPackage(__name__,{
+    'CollisionChecker' : 'extension.CollisionChecker',
+    'CrosstrackErrorTracker' : 'extension.CrosstrackErrorTracker',
+    'Extension' : 'extension.Extension',
+    'Gifsaver' : 'extension.Gifsaver',
+    'LapCounter' : 'extension.LapCounter',
+    'Laptimer' : 'extension.Laptimer',
+    'Logger' : 'extension.Logger',
+    'Optitrack' : 'extension.Optitrack',
+    'PerformanceTracker' : 'extension.PerformanceTracker',
+    'Simulator' : 'extension.Simulator',
+    'StepCounter' : 'extension.StepCounter',
+    'TrajectoryPlotter' : 'extension.TrajectoryPlotter',
+    'Visualization' : 'extension.Visualization',
+    'Watchdog' : 'extension.Watchdog',
+    'SteeringTracker' : 'extension.SteeringTracker',
+    'SnapshotSaver' : 'extension.SnapshotSaver',
+    'SteeringTuner' : 'extension.SteeringTuner',
+    'BoundaryChecker' : 'extension.BoundaryChecker',
+    'ConfigLogger' : 'extension.ConfigLogger',
+    'DeadlineMonitor' : 'extension.DeadlineMonitor',
 
-from extension.simulator.KinematicSimulator import KinematicSimulator
-from extension.simulator.DynamicSimulator import DynamicSimulator
-from extension.simulator.CurvilinearSimulator import CurvilinearSimulator
+    'KinematicSimulator' : 'extension.simulator.KinematicSimulator',
+    'DynamicSimulator' : 'extension.simulator.DynamicSimulator',
+    'CurvilinearSimulator' : 'extension.simulator.CurvilinearSimulator',
 
-from extension.Replay import Replay
+    'Replay' : 'extension.Replay',
+})
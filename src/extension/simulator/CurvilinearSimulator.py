@@ -1,14 +1,16 @@
 # use curvilinear ref frame dynamics from copg
+# states of all cars are kept in curvilinear form (s, d, mu, vx, vy, r) in one batch,
+# cartesian car.states is computed (for all cars at once) only when read,
+# and a car is converted back to curvilinear form only when its car.states is assigned
 
 import os
 import sys
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 from extension import Simulator
 
-from sysid.tire import tireCurve
 import numpy as np
+import torch
 from math import sin,cos,tan,radians,degrees,pi,atan
-import matplotlib.pyplot as plt
 from Simulator import Simulator
 from common import *
 from threading import Event,Lock
@@ -28,9 +30,25 @@ class CurvilinearSimulator(Simulator):
         KinematicSimulator.max_v = 100
         for car in self.cars:
             self.addCar(car)
-        self.main.new_state_update.set()
 
-        CurvilinearSimulator.vehicle_model = VehicleModel(1,'cpu','rcp',dt=self.main.dt)
+        vehicle_model = CurvilinearSimulator.vehicle_model = VehicleModel(len(self.cars),'cpu','rcp',dt=self.main.dt)
+        # reference path for batched local to global conversion
+        self.track_ref_pos = np.vstack([vehicle_model.track_X.numpy(), vehicle_model.track_Y.numpy()]).T
+        self.track_s = vehicle_model.track_s.numpy().astype(np.float64)
+        self.track_phi = vehicle_model.track_phi.numpy().astype(np.float64)
+        self.track_len = self.track_s[-1]
+        self.ds = self.track_s[1] - self.track_s[0]
+        # first index and last are same
+        self.track_n = vehicle_model.track_n - 1
+
+        # curvilinear states of all cars, every car is converted from car.states
+        # at first update since car.states_assigned is set
+        self.local_states = torch.zeros((len(self.cars),6),dtype=torch.float64)
+        self.controls = torch.zeros((len(self.cars),2),dtype=torch.float64)
+        self.global_states = None
+        for i,car in enumerate(self.cars):
+            car.sim_index = i
+        self.main.new_state_update.set()
 
     # add a car to be DynamicSimu  
     # car needs to (x,y,heading,v_forward,v_sideway,omega)
@@ -76,12 +94,46 @@ class CurvilinearSimulator(Simulator):
         global_state = CurvilinearSimulator.vehicle_model.fromLocalToGlobal(new_local_state).flatten()
         return global_state.flatten()
 
+    # cartesian states of all cars from curvilinear states, same as VehicleModel.fromLocalToGlobal
+    def localToGlobal(self,local_states):
+        s = (local_states[:,0] + self.track_len) % self.track_len
+        d = local_states[:,1]
+        rel_heading = local_states[:,2]
+        index = np.searchsorted(self.track_s,s,side='right') - 1
+        index = np.minimum(index,self.track_n-1)
+        ratio = (s-self.track_s[index])/self.ds
+        track_tangent = self.track_ref_pos[(index+1)%self.track_n] - self.track_ref_pos[(index-1)%self.track_n]
+        track_tangent = track_tangent/np.linalg.norm(track_tangent,axis=1)[:,np.newaxis]
+        mid_ref_pos = self.track_ref_pos[index] + track_tangent*(self.ds*ratio)[:,np.newaxis]
+        d_phi = (self.track_phi[(index+1)%self.track_n] - self.track_phi[index] + np.pi ) % (2*np.pi) -np.pi
+        ref_heading = self.track_phi[index] + ratio* d_phi
+        car_pos = mid_ref_pos + d[:,np.newaxis]*np.vstack([-np.sin(ref_heading), np.cos(ref_heading)]).T
+        abs_heading = (ref_heading + rel_heading + np.pi)%(2*np.pi) - np.pi
+        return np.hstack([car_pos, abs_heading[:,np.newaxis], local_states[:,3:6]])
+
+    # states_source of each car, converts all cars on first access after an update
+    def globalStates(self,car):
+        if (self.global_states is None):
+            self.global_states = self.localToGlobal(self.local_states.numpy())
+        return self.global_states[car.sim_index].copy()
+
     def update(self): 
         #print_ok(self.prefix() + "update")
+        for i,car in enumerate(self.cars):
+            # car.states set from outside (initial state, noise ...), find its curvilinear state
+            if (car.states_assigned):
+                self.local_states[i] = torch.from_numpy(np.array(self.vehicle_model.fromGlobalToLocal(car.states),dtype=np.float64))
+                car.states_assigned = False
+            self.controls[i,0] = car.throttle
+            self.controls[i,1] = car.steering
+        # dynModelBlendBatch clamps controls in place, they are overwritten every step anyway
+        self.local_states = self.vehicle_model.dynModelBlendBatch(self.local_states, self.controls)
+        # keep progress in [0,track length) and heading error in [-pi,pi)
+        self.local_states[:,0] = torch.remainder(self.local_states[:,0], self.track_len)
+        self.local_states[:,2] = torch.remainder(self.local_states[:,2] + np.pi, 2*np.pi) - np.pi
+        self.global_states = None
         for car in self.cars:
-            car.states = self.advanceDynamics(car.states, (car.throttle, car.steering), car)
-            #print(self.prefix()+str(car.states))
-            #print(self.prefix()+"T: %.1f, S:%.1f"%(car.throttle, degrees(car.steering)))
+            car.states_source = self.globalStates
         if (self.state_noise_enabled):
             self.addStateNoise()
         self.main.new_state_update.set()
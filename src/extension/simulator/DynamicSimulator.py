@@ -5,20 +5,36 @@ import sys
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 from extension import Simulator
 
-from sysid.tire import tireCurve
+from sysid.tire import TireModel,tire_model
 import numpy as np
 from math import sin,cos,tan,radians,degrees,pi,atan
-import matplotlib.pyplot as plt
 from Simulator import Simulator
 from common import *
 from threading import Event,Lock
 from simulator.KinematicSimulator import KinematicSimulator
+from util.integrator import integrate,AdaptiveIntegrator
 
 class DynamicSimulator(Simulator):
     def __init__(self,main):
         super().__init__(main)
         DynamicSimulator.max_v = 3.0
         DynamicSimulator.using_kinematics = False
+        # advance all cars in one vectorized step if there are at least this many cars
+        # numpy call overhead makes the per car scalar version faster for a few cars
+        self.batch_min_cars = 8
+        # 'euler': the discrete update in advanceDynamics, 'rk4' or 'adaptive' (error controlled)
+        # euler and rk4 take substeps steps per main.dt, so controller can run at a coarse dt
+        # while physics stays accurate
+        self.integrator = 'euler'
+        self.substeps = 1
+        # tolerance for adaptive integrator
+        self.integrator_rtol = 1e-4
+        self.integrator_atol = 1e-6
+        # tire curve evaluation, None for analytic, 'linear' or 'cubic' for table lookup
+        # with error below tire_max_error, see sysid/tire.py
+        self.tire_interpolation = None
+        self.tire_max_error = 1e-6
+        self.tire = tire_model
 
     def init(self):
         super().init()
@@ -28,8 +44,47 @@ class DynamicSimulator(Simulator):
         KinematicSimulator.max_v = 100
         for car in self.cars:
             self.addCar(car)
+        self.packStates()
+        self.initCarCollision()
+        if (self.integrator not in ['euler','rk4','adaptive']):
+            self.print_error("unknown integrator "+str(self.integrator))
+        self.adaptive = AdaptiveIntegrator(self.integrator_rtol,self.integrator_atol)
+        if (self.tire_interpolation is not None):
+            self.tire = TireModel(interpolation=self.tire_interpolation, max_error=self.tire_max_error)
+            self.print_info("tire curve table: %d points, error %.1e"%(len(self.tire.table),self.tire.error))
+        if (self.integrator != 'euler' or self.substeps > 1):
+            self.print_info("integrator: %s, %d substeps"%(self.integrator,self.substeps))
         self.main.new_state_update.set()
 
+    # keep states, controls and parameters of all cars in contiguous arrays
+    # so the whole field is advanced in one vectorized step
+    # car.states is a view into self.states, it's updated in place,
+    # copy it if a snapshot needs to be kept
+    def packStates(self):
+        n = len(self.cars)
+        self.states = np.zeros((n,6))
+        self.controls = np.zeros((n,2))
+        self.lf = np.array([car.lf for car in self.cars],dtype=float)
+        self.lr = np.array([car.lr for car in self.cars],dtype=float)
+        self.m = np.array([car.m for car in self.cars],dtype=float)
+        self.Iz = np.array([car.Iz for car in self.cars],dtype=float)
+        self.state_views = []
+        for i,car in enumerate(self.cars):
+            self.states[i] = car.states
+            car.states = self.states[i]
+            self.state_views.append(car.states)
+
+    # state noise added to all cars at once
+    def addStateNoiseNormal(self):
+        self.states += self.noise.next() * self.state_noise_magnitude * self.main.dt
+
+    def addStateNoiseUniform(self):
+        self.states += self.noise.next() * self.state_noise_magnitude * self.main.dt
+
+    def addStateNoiseImpulse(self):
+        mask = self.noise.next() < self.state_noise_probability
+        self.states[mask] += self.state_noise_magnitude * self.main.dt
+
     # add a car to be DynamicSimu  
     # car needs to (x,y,heading,v_forward,v_sideway,omega)
     def addCar(self,car):
@@ -65,15 +120,17 @@ class DynamicSimulator(Simulator):
     # this method does NOT update car.sim_states, only returns a sim_state
     # this is to make itself useful for when update is not necessary
     #    x,y,psi,v_forward,v_sideway,d_psi = car_states
+    # tire: TireModel giving lateral friction coefficient from slip angle
     @staticmethod
-    def advanceDynamics(car_states, control, car):
+    def advanceDynamics(car_states, control, car, dt=None, tire=tire_model):
         lf = car.lf
         lr = car.lr
         L = car.L
 
         Iz = car.Iz
         m = car.m
-        dt = DynamicSimulator.dt
+        if (dt is None):
+            dt = DynamicSimulator.dt
 
         # NOTE here vx = vf, vy = vs, different convention
         x,y,heading,vx,vy,omega = car_states
@@ -101,8 +158,8 @@ class DynamicSimulator(Simulator):
 
             #Ffy = Df * np.sin( C * np.arctan(B *slip_f)) * 9.8 * lr / (lr + lf) * m
             #Fry = Dr * np.sin( C * np.arctan(B *slip_r)) * 9.8 * lf / (lr + lf) * m
-            Ffy = tireCurve(slip_f) * m * 9.8 *lr/(lr+lf)
-            Fry = 1.15*tireCurve(slip_r) * m * 9.8 *lf/(lr+lf)
+            Ffy = tire(slip_f) * m * 9.8 *lr/(lr+lf)
+            Fry = 1.15*tire(slip_r) * m * 9.8 *lf/(lr+lf)
 
             # Dynamics
             #d_vx = 1.0/m * (Frx - Ffy * np.sin( steering ) + m * vy * omega)
@@ -127,13 +184,130 @@ class DynamicSimulator(Simulator):
         car_states = x,y,heading,vx,vy,omega
         return np.array(car_states)
 
+    # same as advanceDynamics, for n cars at once
+    # states: (n,6) x,y,heading,v_forward,v_sideway,omega
+    # controls: (n,2) throttle,steering
+    # lf,lr,m,Iz: (n,) per car parameters
+    # result is written to out (may be states itself), a new array if out is None
+    @staticmethod
+    def advanceDynamicsBatch(states, controls, lf, lr, m, Iz, dt, out=None, tire=tire_model):
+        if (out is None):
+            out = np.empty_like(states)
+        L = lf + lr
+        x,y,heading,vx,vy,omega = states.T
+        throttle, steering = controls.T
+
+        # for small longitudinal velocity use kinematic model
+        kinematic = vx < 0.05
+        any_kinematic = kinematic.any()
+        # vx in kinematic lanes is replaced to avoid division by zero, these lanes are overwritten later
+        safe_vx = np.where(kinematic, 1.0, vx) if any_kinematic else vx
+
+        slip_f = steering - np.arctan((omega*lf + vy)/safe_vx)
+        slip_r = np.arctan((omega*lr - vy)/safe_vx)
+        Ffy = tire(slip_f) * m * 9.8 *lr/L
+        Fry = 1.15*tire(slip_r) * m * 9.8 *lf/L
+        cos_steering = np.cos(steering)
+        # motor model, same for both branches
+        d_vx = 6.17*(throttle - vx/15.2 -0.333)
+        d_vy = (Fry + Ffy * cos_steering)/m - vx * omega
+        d_omega = (Ffy * lf * cos_steering - Fry * lr)/Iz
+
+        new_vx = vx + d_vx * dt
+        new_vy = vy + d_vy * dt
+        new_omega = omega + d_omega * dt
+        if (any_kinematic):
+            k = kinematic
+            beta = np.arctan(lr[k]/L[k]*np.tan(steering[k]))
+            new_vy[k] = np.sqrt(new_vx[k]**2+vy[k]**2)*np.sin(beta)
+            new_omega[k] = new_vx[k]/L[k]*np.tan(steering[k])
+            d_omega[k] = 0.0
+
+        # back to global frame
+        cos_heading = np.cos(heading)
+        sin_heading = np.sin(heading)
+        vxg = new_vx*cos_heading-new_vy*sin_heading
+        vyg = new_vx*sin_heading+new_vy*cos_heading
+
+        # x,y,heading are read above, safe to overwrite when out is states
+        out[:,0] = x + vxg*dt
+        out[:,1] = y + vyg*dt
+        out[:,2] = heading + new_omega*dt + 0.5* d_omega * dt * dt
+        out[:,3] = new_vx
+        out[:,4] = new_vy
+        out[:,5] = new_omega
+        return out
+
+    # continuous time dynamics for the rk4 and adaptive integrators, d(states)/dt of n cars
+    # same model as advanceDynamicsBatch, in the low speed kinematic regime
+    # v_sideway and omega are not integrated but set by projectKinematic
+    @staticmethod
+    def derivativesBatch(states, controls, lf, lr, m, Iz, tire=tire_model):
+        L = lf + lr
+        x,y,heading,vx,vy,omega = states.T
+        throttle, steering = controls.T
+
+        kinematic = vx < 0.05
+        any_kinematic = kinematic.any()
+        safe_vx = np.where(kinematic, 1.0, vx) if any_kinematic else vx
+
+        slip_f = steering - np.arctan((omega*lf + vy)/safe_vx)
+        slip_r = np.arctan((omega*lr - vy)/safe_vx)
+        Ffy = tire(slip_f) * m * 9.8 *lr/L
+        Fry = 1.15*tire(slip_r) * m * 9.8 *lf/L
+        cos_steering = np.cos(steering)
+        d_vx = 6.17*(throttle - vx/15.2 -0.333)
+        d_vy = (Fry + Ffy * cos_steering)/m - vx * omega
+        d_omega = (Ffy * lf * cos_steering - Fry * lr)/Iz
+        if (any_kinematic):
+            d_vy[kinematic] = 0.0
+            d_omega[kinematic] = 0.0
+
+        cos_heading = np.cos(heading)
+        sin_heading = np.sin(heading)
+        return np.stack([vx*cos_heading-vy*sin_heading, vx*sin_heading+vy*cos_heading, omega, d_vx, d_vy, d_omega],axis=1)
+
+    # low speed kinematic model: v_sideway and omega follow from v_forward and steering
+    @staticmethod
+    def projectKinematic(states, controls, lf, lr):
+        k = states[:,3] < 0.05
+        if (not k.any()):
+            return states
+        L = lf[k] + lr[k]
+        steering = controls[k,1]
+        vx = states[k,3]
+        beta = np.arctan(lr[k]/L*np.tan(steering))
+        states[k,4] = np.sqrt(vx**2+states[k,4]**2)*np.sin(beta)
+        states[k,5] = vx/L*np.tan(steering)
+        return states
+
+    # advance all cars by main.dt with selected integrator
+    def step(self):
+        dt = self.main.dt
+        if (self.integrator == 'euler'):
+            h = dt/self.substeps
+            for k in range(self.substeps):
+                if (len(self.cars) >= self.batch_min_cars):
+                    self.advanceDynamicsBatch(self.states, self.controls, self.lf, self.lr, self.m, self.Iz, h, out=self.states, tire=self.tire)
+                else:
+                    for i,car in enumerate(self.cars):
+                        self.states[i] = self.advanceDynamics(self.states[i], self.controls[i], car, h, self.tire)
+            return
+        rhs = lambda states: self.derivativesBatch(states, self.controls, self.lf, self.lr, self.m, self.Iz, self.tire)
+        project = lambda states: self.projectKinematic(states, self.controls, self.lf, self.lr)
+        self.states[:] = integrate(self.integrator, rhs, self.states, dt, self.substeps, project, self.adaptive)
 
     def update(self): 
         #print_ok(self.prefix() + "update")
-        for car in self.cars:
-            car.states = self.advanceDynamics(car.states, (car.throttle, car.steering), car)
-            #print(self.prefix()+str(car.states))
-            #print(self.prefix()+"T: %.1f, S:%.1f"%(car.throttle, degrees(car.steering)))
+        for i,car in enumerate(self.cars):
+            # car.states may have been replaced (e.g. reset by an extension)
+            if (car.states is not self.state_views[i]):
+                self.states[i] = car.states
+                car.states = self.state_views[i]
+            self.controls[i,0] = car.throttle
+            self.controls[i,1] = car.steering
+        self.step()
+        self.handleCarCollision(self.states)
         if (self.state_noise_enabled):
             self.addStateNoise()
         self.main.new_state_update.set()
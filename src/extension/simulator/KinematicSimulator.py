@@ -9,6 +9,7 @@ import numpy as np
 from math import radians
 from common import *
 from threading import Event
+from util.integrator import integrate,AdaptiveIntegrator
 
 class KinematicSimulator(Simulator):
 
@@ -21,6 +22,13 @@ class KinematicSimulator(Simulator):
         KinematicSimulator.max_v = 3.0
         KinematicSimulator.dt = self.main.dt
         self.simple_throttle_model = False
+        # 'euler': the discrete update in advanceDynamics, 'rk4' or 'adaptive' (error controlled)
+        # euler and rk4 take substeps steps per main.dt
+        self.integrator = 'euler'
+        self.substeps = 1
+        # tolerance for adaptive integrator
+        self.integrator_rtol = 1e-4
+        self.integrator_atol = 1e-6
 
     def init(self):
         super().init()
@@ -29,6 +37,12 @@ class KinematicSimulator(Simulator):
         self.cars = self.main.cars
         for car in self.cars:
             self.addCar(car)
+        self.initCarCollision()
+        if (self.integrator not in ['euler','rk4','adaptive']):
+            self.print_error("unknown integrator "+str(self.integrator))
+        self.adaptive = AdaptiveIntegrator(self.integrator_rtol,self.integrator_atol)
+        if (self.integrator != 'euler' or self.substeps > 1):
+            self.print_info("integrator: %s, %d substeps"%(self.integrator,self.substeps))
         self.main.new_state_update.set()
 
     # add a car to be KinematicSimulator
@@ -39,17 +53,37 @@ class KinematicSimulator(Simulator):
 
     def update(self): 
         #print_ok("[KinematicSimulator]: update")
-        for car in self.cars:
-            car.states = self.advanceDynamics(car.states, (car.throttle, car.steering), car)
+        if (self.integrator == 'euler'):
+            h = self.main.dt/self.substeps
+            for car in self.cars:
+                for k in range(self.substeps):
+                    car.states = self.advanceDynamics(car.states, (car.throttle, car.steering), car, h)
+        else:
+            states = np.array([car.states for car in self.cars],dtype=float)
+            controls = np.array([(car.throttle, car.steering) for car in self.cars])
+            lf = np.array([car.lf for car in self.cars])
+            lr = np.array([car.lr for car in self.cars])
+            rhs = lambda states: self.derivativesBatch(states, controls, lf, lr)
+            project = lambda states: self.projectKinematic(states, controls, lf, lr)
+            states = integrate(self.integrator, rhs, states, self.main.dt, self.substeps, project, self.adaptive)
+            for i,car in enumerate(self.cars):
+                car.states = states[i]
+        if (self.car_collision and len(self.cars) > 1):
+            states = np.array([car.states for car in self.cars],dtype=float)
+            self.handleCarCollision(states)
+            if (len(self.car_contact_pairs) > 0):
+                for i,car in enumerate(self.cars):
+                    car.states = states[i]
         self.main.new_state_update.set()
         self.main.sim_t += self.main.dt
         self.matchRealTime()
 
     @staticmethod
-    def advanceDynamics(car_states,control, car):
+    def advanceDynamics(car_states,control, car, dt=None):
         lr = car.lr
         lf = car.lf
-        dt = KinematicSimulator.dt
+        if (dt is None):
+            dt = KinematicSimulator.dt
         
         '''
         throttle = np.clip(throttle, -1.0, 1.0)
@@ -87,4 +121,26 @@ class KinematicSimulator(Simulator):
         car_states = x,y,heading,v_forward,v_sideway,omega
         return np.array(car_states)
 
+    # continuous time dynamics of n cars for the rk4 and adaptive integrators
+    # same model as advanceDynamics, v_sideway and omega are set by projectKinematic
+    @staticmethod
+    def derivativesBatch(states, controls, lf, lr):
+        heading = states[:,2]
+        v = states[:,3]
+        throttle, steering = controls.T
+        beta = np.arctan( np.tan(steering) * lr / (lf+lr))
+        if KinematicSimulator.simple_throttle_model:
+            dvdt = np.where(v > KinematicSimulator.max_v, -0.01, throttle)
+        else:
+            dvdt = 6.17*(throttle - v/15.2 -0.333)
+        zeros = np.zeros_like(v)
+        return np.stack([v * np.cos( heading + beta ), v * np.sin( heading + beta ), v/lr*np.sin(beta), dvdt, zeros, zeros],axis=1)
+
+    @staticmethod
+    def projectKinematic(states, controls, lf, lr):
+        beta = np.arctan( np.tan(controls[:,1]) * lr / (lf+lr))
+        states[:,4] = 0
+        states[:,5] = states[:,3]/lr*np.sin(beta)
+        return states
+
 KinematicSimulator.simple_throttle_model = False
@@ -104,43 +104,13 @@ class ctrlMppiWrapper(Car):
     def createBoundary(self,show=False):
         # construct a (self.discretized_raceline_len * 2) vector
         # to record the left and right track boundary as an offset to the discretized raceline
-        left_boundary = []
-        right_boundary = []
-
-        left_boundary_points = []
-        right_boundary_points = []
-
-        for i in range(self.discretized_raceline_len):
-            # find normal direction
-            coord = self.raceline_points[:,i]
-            heading = self.raceline_headings[i]
-
-            left, right = self.track.preciseTrackBoundary(coord,heading)
-            left_boundary.append(left)
-            right_boundary.append(right)
-
-            # debug boundary points
-            left_point = (coord[0] + left * cos(heading+np.pi/2),coord[1] + left * sin(heading+np.pi/2))
-            right_point = (coord[0] + right * cos(heading-np.pi/2),coord[1] + right * sin(heading-np.pi/2))
-
-            left_boundary_points.append(left_point)
-            right_boundary_points.append(right_point)
-
-
-            # DEBUG
-            # calculate left/right boundary
-            '''
-            left_point = (coord[0] + left * cos(heading+np.pi/2),coord[1] + left * sin(heading+np.pi/2))
-            right_point = (coord[0] + right * cos(heading-np.pi/2),coord[1] + right * sin(heading-np.pi/2))
-            img = self.track.drawTrack()
-            img = self.track.drawRaceline(img = img)
-            img = self.track.drawPoint(img,coord,color=(0,0,0))
-            img = self.track.drawPoint(img,left_point,color=(0,0,0))
-            img = self.track.drawPoint(img,right_point,color=(0,0,0))
-            plt.imshow(img)
-            plt.show()
-            '''
+        coords = self.raceline_points.T
+        headings = np.array(self.raceline_headings)
+        left_boundary, right_boundary = self.track.preciseTrackBoundaryBatch(coords,headings)
 
+        # debug boundary points
+        left_boundary_points = coords + left_boundary[:,np.newaxis]*np.column_stack([np.cos(headings+np.pi/2),np.sin(headings+np.pi/2)])
+        right_boundary_points = coords + right_boundary[:,np.newaxis]*np.column_stack([np.cos(headings-np.pi/2),np.sin(headings-np.pi/2)])
 
         self.raceline_left_boundary = left_boundary
         self.raceline_right_boundary = right_boundary
@@ -9,6 +9,7 @@ from laptimer import Laptimer
 from RCPTrack import RCPtrack
 from math import pi,radians,degrees,asin,acos,isnan
 from ethCarSim import ethCarSim
+from tire import TireModel
 from time import time
 from cs_solver import CSSolver #from cs_solver_covariance_only import CSSolver
 import cvxpy as cp
@@ -394,10 +395,8 @@ class LinearizeDynamics():
         self.mass = 0.1667
 
         # tire model
-        self.Df = 3.93731
-        self.Dr = 6.23597
-        self.C = 2.80646
-        self.B = 0.51943
+        self.tire_f = TireModel(B=0.51943, C=2.80646, D=3.93731)
+        self.tire_r = TireModel(B=0.51943, C=2.80646, D=6.23597)
 
         # motor/longitudinal model
         self.Cm1 = 6.03154
@@ -490,10 +489,6 @@ class LinearizeDynamics():
         lr = self.lr
         L = self.L
 
-        Df = self.Df
-        Dr = self.Dr
-        B = self.B
-        C = self.C
         Cm1 = self.Cm1
         Cm2 = self.Cm2
         Cr = self.Cr
@@ -543,8 +538,8 @@ class LinearizeDynamics():
         slip_f[~mask] = -np.arctan((omega[~mask]*lf + vy[~mask])/vx[~mask]) + steering[~mask]
         slip_r[~mask] = np.arctan((omega[~mask]*lr - vy[~mask])/vx[~mask])
 
-        Ffy[~mask] = Df * np.sin( C * np.arctan(B *slip_f[~mask])) * 9.8 * lr / (lr + lf) * m
-        Fry[~mask] = Dr * np.sin( C * np.arctan(B *slip_r[~mask])) * 9.8 * lf / (lr + lf) * m
+        Ffy[~mask] = self.tire_f(slip_f[~mask]) * 9.8 * lr / (lr + lf) * m
+        Fry[~mask] = self.tire_r(slip_r[~mask]) * 9.8 * lf / (lr + lf) * m
 
         # motor model
         Frx[~mask] = (( Cm1 - Cm2 * vx[~mask]) * throttle[~mask] - Cr - Cd * vx[~mask] * vx[~mask])*m
@@ -562,7 +557,7 @@ class LinearizeDynamics():
         '''
         print("vx = %5.2f, vy = %5.2f"%(vx,vy))
         print("slip_f = %5.2f, slip_r = %5.2f"%(degrees(slip_f), degrees(slip_r)))
-        print("f_coeff_f = %5.2f, f_coeff_f = %5.2f"%(tireCurve(slip_f), tireCurve(slip_r)))
+        print("f_coeff_f = %5.2f, f_coeff_f = %5.2f"%(self.tire_f(slip_f), self.tire_r(slip_r)))
         '''
 
         # back to global frame
@@ -1,7 +1,8 @@
 import numpy as np
 from time import time
 import cvxopt
-import matplotlib.pyplot as plt
+from util.lazyImport import lazyImport
+plt = lazyImport('matplotlib.pyplot')
 
 class MPC:
     def __init__(self,):
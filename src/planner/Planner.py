@@ -4,7 +4,8 @@
 
 # MPC based trajectory planner
 from common import *
-import matplotlib.pyplot as plt
+from util.lazyImport import lazyImport
+plt = lazyImport('matplotlib.pyplot')
 import numpy as np
 from planner.MPC import MPC
 from time import time
@@ -156,6 +157,8 @@ class Planner(ConfigObject):
         return True
 
     def plotAllSolutions(self):
+        if (not self.main.visualization.update_visualization.is_set()):
+            return
         # plot solutions
         sols = self.solutions
         best_sol_idx = self.best_solution_index
@@ -171,6 +174,7 @@ class Planner(ConfigObject):
             u = np.linspace(0,self.N-1)
             traj = self.evalBezierSpline(bezier_coeffs,u)
             img = self.track.drawPolyline(traj,lineColor=color,img=img)
+            self.main.visualization.markDirtyCoords(traj,3)
         self.main.visualization.visualization_img = img
         return 
 
@@ -180,6 +184,7 @@ class Planner(ConfigObject):
         for sol in sols:
             p = sol[3]
             img = self.track.drawPoints(img,p,color=color)
+            self.main.visualization.markDirtyCoords(p,4)
         self.main.visualization.visualization_img = img
         return 
 
@@ -262,46 +267,13 @@ class Planner(ConfigObject):
     def createBoundary(self,show=False):
         # construct a (self.discretized_raceline_len * 2) vector
         # to record the left and right track boundary as an offset to the discretized raceline
-        left_boundary = []
-        right_boundary = []
-
-        left_boundary_points = []
-        right_boundary_points = []
-
-        ref_path = self.ref_path.T
-        ref_heading = self.raceline_headings
-
-        for i in range(self.discretized_raceline_len):
-            # find normal direction
-            coord = ref_path[:,i]
-            heading = ref_heading[i]
-
-            left, right = self.track.preciseTrackBoundary(coord,heading)
-            left_boundary.append(left)
-            right_boundary.append(right)
-
-            '''
-            # debug boundary points
-            left_point = (coord[0] + left * np.cos(heading+np.pi/2),coord[1] + left * np.sin(heading+np.pi/2))
-            right_point = (coord[0] + right * np.cos(heading-np.pi/2),coord[1] + right * np.sin(heading-np.pi/2))
-
-            left_boundary_points.append(left_point)
-            right_boundary_points.append(right_point)
-
-
-            # DEBUG
-            # plot left/right boundary
-            left_point = (coord[0] + left * cos(heading+np.pi/2),coord[1] + left * sin(heading+np.pi/2))
-            right_point = (coord[0] + right * cos(heading-np.pi/2),coord[1] + right * sin(heading-np.pi/2))
-            img = self.track.drawTrack()
-            img = self.track.drawRaceline(img = img)
-            img = self.track.drawPoint(img,coord,color=(0,0,0))
-            img = self.track.drawPoint(img,left_point,color=(0,0,0))
-            img = self.track.drawPoint(img,right_point,color=(0,0,0))
-            plt.imshow(img)
-            plt.show()
-            '''
+        coords = self.ref_path
+        headings = np.array(self.raceline_headings)
+        left_boundary, right_boundary = self.track.preciseTrackBoundaryBatch(coords,headings)
 
+        # debug boundary points
+        left_boundary_points = coords + left_boundary[:,np.newaxis]*np.column_stack([np.cos(headings+np.pi/2),np.sin(headings+np.pi/2)])
+        right_boundary_points = coords + right_boundary[:,np.newaxis]*np.column_stack([np.cos(headings-np.pi/2),np.sin(headings-np.pi/2)])
 
         self.raceline_left_boundary = left_boundary
         self.raceline_right_boundary = right_boundary
@@ -1,38 +1,71 @@
 # universal entry point for running the car
+import sys
+# import profiler must be enabled before anything else is imported
+if ('--profile-startup' in sys.argv):
+    from util.lazyImport import enableImportProfiler,printImportProfile
+    enableImportProfiler()
 from common import *
 from threading import Event,Lock
-from math import pi,radians,degrees
+from math import pi,radians,degrees,gcd
 from time import time,sleep
 
-from util.timeUtil import execution_timer
+from util.timeUtil import execution_timer,enable_tracing
+from util.configCompiler import loadConfig
 from track import TrackFactory
 
 from car.Car import Car
 
-from xml.dom import minidom
-import xml.etree.ElementTree as ET
-
-import sys
+import argparse
 import os.path
 import os
 os.environ["PATH"] = os.environ["PATH"]+":/usr/local/cuda/bin/" # enables cuda
 
 class Main(PrintObject):
-    def __init__(self,config_filename):
+    # headless: run simulation as fast as possible in lockstep
+    # no visualization window, no real time matching, no Event handshake with simulator
+    def __init__(self,config_filename,headless=False):
         self.basedir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
         self.config_filename = config_filename
+        self.headless = headless
+        # seed for np.random, None to leave it unseeded
+        self.seed = None
+        # if set, step latency statistics are saved to this json file at exit
+        # this enables the timer even in headless mode
+        self.latency_log = None
+        # if set, every timed section and extension hook is saved to this chrome trace json at exit
+        self.trace_log = None
+        # number of independent copies of each car, see util/ensemble.py
+        self.ensemble_size = 1
+        # stddev of initial state perturbation of each copy (x,y,heading,v_forward)
+        self.ensemble_init_noise = None
+        # aggregated statistics of ensemble, filled by Laptimer, CollisionChecker ...
+        self.ensemble_stats = {}
 
     def init(self):
         self.print_ok(" loading settings")
-        config = minidom.parse(self.config_filename)
+        t0 = time()
+        config,from_cache = loadConfig(self.config_filename)
+        if (from_cache):
+            self.print_info(" loaded compiled config from cache in %.1f ms"%((time()-t0)*1e3))
+        else:
+            self.print_info(" compiled config in %.1f ms"%((time()-t0)*1e3))
+        self.config = config
         config_settings = config.getElementsByTagName('settings')[0]
         self.print_ok(" setting main attributes")
-        for key,value_text in config_settings.attributes.items():
-            setattr(self,key,eval(value_text))
-            self.print_info(" main.",key,'=',value_text)
+        headless = self.headless
+        for key,value in config_settings.evaluated.items():
+            setattr(self,key,value)
+            self.print_info(" main.",key,'=',config_settings.attributes[key])
+        # command line --headless takes precedence over config
+        self.headless = self.headless or headless
+        if (self.headless):
+            self.print_info(" running headless")
+        if (self.seed is not None):
+            np.random.seed(self.seed)
+        if (self.trace_log is not None):
+            self.tracer = enable_tracing()
 
-        config_experiment_text = config_settings.getElementsByTagName('experiment_type')[0].firstChild.nodeValue
-        self.experiment_type = eval('ExperimentType.'+config_experiment_text)
+        self.experiment_type = config_settings.getElementsByTagName('experiment_type')[0].value
 
         # prepare track
         #config_track_text = config_settings.getElementsByTagName('track')[0].firstChild.nodeValue
@@ -43,12 +76,23 @@ class Main(PrintObject):
         # prepare cars
         Car.reset()
         config_cars = config.getElementsByTagName('cars')[0]
-        for config_car in config_cars.getElementsByTagName('car'):
-            Car.Factory(self,config_car)
+        for source,config_car in enumerate(config_cars.getElementsByTagName('car')):
+            for member in range(self.ensemble_size):
+                car = Car.Factory(self,config_car)
+                car.ensemble_source = source
+                car.ensemble_member = member
+                if (member > 0 and self.ensemble_init_noise is not None):
+                    x,y,heading,v_forward,v_sideway,omega = car.states
+                    dx,dy,dheading,dv = np.random.normal(size=4) * np.array(self.ensemble_init_noise)
+                    car.states = (x+dx,y+dy,heading+dheading,v_forward+dv,v_sideway,omega)
         self.cars = Car.cars
+        if (self.ensemble_size > 1):
+            self.print_info(" ensemble of %d copies per car"%(self.ensemble_size))
         self.print_info(" total cars: %d"%(len(self.cars)))
 
-        self.timer = execution_timer(True)
+        # timer calls time() for every section, skip in headless mode unless latency is logged
+        # steps taking longer than dt are counted as overruns
+        self.timer = execution_timer(not self.headless or self.latency_log is not None, deadline=self.dt, name='step')
         self.new_state_update = Event()
         # flag to quit all child threads gracefully
         self.exit_request = Event()
@@ -64,10 +108,7 @@ class Main(PrintObject):
         self.extensions = []
         config_extensions = config.getElementsByTagName('extensions')[0]
         for config_extension in config_extensions.getElementsByTagName('extension'):
-            extension_class_name = config_extension.firstChild.nodeValue
-            exec('from extension import '+extension_class_name)
-            #ext = eval(extension_class_name+'(self)')
-            ext = eval(extension_class_name)(self)
+            ext = config_extension.cls(self)
             handle_name = ''
             for key,raw in config_extension.attributes.items():
                 if key == 'handle':
@@ -75,14 +116,14 @@ class Main(PrintObject):
                     setattr(self,handle_name,ext)
                     self.print_info('main.'+handle_name+' = '+ext.__class__.__name__)
                 else:
-                    try:
-                        value = eval(raw)
-                    except NameError:
-                        value = raw
+                    value = config_extension.evaluated[key]
                     # all other attributes will be set to extension
                     setattr(ext,key,value)
                     self.print_info('main.'+handle_name+'.'+key+' = '+str(value))
 
+        self.step = 0
+        self.buildSchedule()
+
         for item in self.extensions:
             item.init()
 
@@ -92,20 +133,43 @@ class Main(PrintObject):
         for item in self.extensions:
             item.postInit()
 
+    # prepare a list of due extensions for each step in a hyperperiod
+    # so update() only needs one lookup per step
+    # this can be called again while running if update periods change
+    def buildSchedule(self):
+        for item in self.extensions:
+            item.update_period = item.getUpdatePeriod(self.dt)
+            if (item.update_period > 1):
+                self.print_info(item.name+' update every %d steps'%(item.update_period))
+        hyperperiod = 1
+        for item in self.extensions:
+            hyperperiod = hyperperiod * item.update_period // gcd(hyperperiod, item.update_period)
+        self.schedule = [[item for item in self.extensions if step % item.update_period == 0] for step in range(hyperperiod)]
+
     # run experiment until user press q in visualization window
     def run(self):
         self.print_info("running ... press q to quit")
+        wall_t0 = time()
         while not self.exit_request.is_set():
-            ts = time()
             self.update()
+        wall_duration = time() - wall_t0
         # exit point
         self.print_info("Exiting ...")
+        if (self.experiment_type == ExperimentType.Simulation and wall_duration > 0):
+            self.sim_wall_ratio = self.sim_t / wall_duration
+            self.print_info("simulated %.2f s in %.2f s wall time, %.1f sim-s/wall-s"%(self.sim_t, wall_duration, self.sim_wall_ratio))
         for item in self.extensions:
             item.preFinal()
         for item in self.extensions:
             item.final()
         for item in self.extensions:
             item.postFinal()
+        if (self.latency_log is not None):
+            self.timer.exportJson(self.latency_log)
+            self.print_info("saved latency statistics to "+self.latency_log)
+        if (self.trace_log is not None):
+            count = self.tracer.save(self.trace_log)
+            self.print_info("saved %d trace events to "%(count)+self.trace_log)
 
     def time(self):
         if self.experiment_type == ExperimentType.Simulation:
@@ -123,34 +187,66 @@ class Main(PrintObject):
     # client (this function) need to unset that event
     def update(self,):
         t = self.timer
+        # start of this tick and time spent waiting for new state / real time
+        # used by DeadlineMonitor to measure computation time of a tick
+        self.tick_start = time()
+        self.tick_wait = 0.0
+        # extensions due at this step
+        extensions = self.schedule[self.step % len(self.schedule)]
         # -- Extension update -- 
         t.s()
-        for item in self.extensions:
+        for item in extensions:
             t.s(item.name)
             item.preUpdate()
             t.e(item.name)
 
-        self.new_state_update.wait()
-        self.new_state_update.clear()
+        # in headless mode simulator and controllers run in lockstep, no need to wait
+        if (not self.headless):
+            wait_start = time()
+            self.new_state_update.wait()
+            self.new_state_update.clear()
+            self.tick_wait += time() - wait_start
 
         t.s('control')
-        for car in self.cars:
-            # call controller, send command to car in real experiment
-            car.control()
+        self.controlCars()
         t.e('control')
 
         # -- Extension update -- 
         t.s('update')
-        for item in self.extensions:
+        for item in extensions:
+            t.trace_start(item.name+'.update')
             item.update()
+            t.trace_end(item.name+'.update')
         t.e('update')
         t.s('post')
-        for item in self.extensions:
+        for item in extensions:
+            t.trace_start(item.name+'.postUpdate')
             item.postUpdate()
+            t.trace_end(item.name+'.postUpdate')
         t.e('post')
         t.e()
+        self.step += 1
         
 
+    # call controller of each car, send command to car in real experiment
+    # in an ensemble, copies of a config car whose controller supports it
+    # are controlled with one controlBatch() call, see CarController
+    def controlCars(self):
+        if (self.ensemble_size == 1):
+            for car in self.cars:
+                car.control()
+            return
+        groups = {}
+        for car in self.cars:
+            if (car.controller is None or car.retired or not car.controller.canControlBatch()):
+                car.control()
+            else:
+                groups.setdefault((car.ensemble_source,type(car.controller)),[]).append(car)
+        for (source,controller_class),cars in groups.items():
+            controller_class.controlBatch([car.controller for car in cars])
+            for car in cars:
+                car.applyControl()
+
     # call before exiting
     def stop(self,):
         for car in self.cars:
@@ -159,10 +255,14 @@ class Main(PrintObject):
 
 
 if __name__ == '__main__':
-    if (len(sys.argv) == 2):
-        name = sys.argv[1]
-    else:
-        name = 'default'
+    parser = argparse.ArgumentParser(description='run an experiment defined in configs/<name>.xml')
+    parser.add_argument('name', nargs='?', default='default', help='config name under configs/')
+    parser.add_argument('--headless', action='store_true', help='run simulation as fast as possible without visualization')
+    parser.add_argument('--latency', metavar='FILENAME', help='save step latency percentiles to a json file')
+    parser.add_argument('--trace', metavar='FILENAME', help='save a chrome trace of the control loop')
+    parser.add_argument('--profile-startup', action='store_true', help='print import time of each module and initialization time')
+    args = parser.parse_args()
+    name = args.name
 
     config_filename = './configs/'+name+'.xml'
     if (os.path.exists(config_filename)):
@@ -170,8 +270,14 @@ if __name__ == '__main__':
     else:
         print_error(config_filename + '  does not exist!')
 
-    experiment = Main(config_filename)
+    experiment = Main(config_filename,headless=args.headless)
+    experiment.latency_log = args.latency
+    experiment.trace_log = args.trace
+    t0 = time()
     experiment.init()
+    if (args.profile_startup):
+        printImportProfile()
+        print_info("initialization took %.1f ms"%((time()-t0)*1e3))
     experiment.run()
     experiment.timer.summary()
     #experiment.cars[0].controller.p.summary()
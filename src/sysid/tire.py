@@ -1,7 +1,6 @@
 # visually test tire curve
-import matplotlib.pyplot as plt
 import numpy as np
-from math import radians,degrees
+from math import radians,degrees,sin,atan
 # slip: slip angle in rad
 # output: lateral friction coefficient
 def oldoldTireCurve(slip):
@@ -30,6 +29,119 @@ def tireCurve(slip):
     retval = D * np.sin( C * np.arctan(B *slip)) 
     return retval
 
+# tire curve D*sin(C*arctan(B*slip)) with its parameters
+# tire(slip) works on floats and numpy arrays, tire.derivative(slip) gives
+# d(friction)/d(slip) for linearization
+# interpolation:
+#   None: evaluate analytic curve (math functions for floats, numpy for arrays)
+#   'linear' or 'cubic' (Hermite, using tabulated derivative): evaluate from a table
+#   built over [-slip_max,slip_max] with as many points as needed to keep the error
+#   against the analytic curve below max_error, outside the table the analytic curve is used
+# slip_max default covers every slip angle the simulators can produce (< pi/2 + max steering)
+class TireModel:
+    def __init__(self, B=2.3, C=1.6, D=1.1, interpolation=None, slip_max=2.5, max_error=1e-6):
+        self.B = B
+        self.C = C
+        self.D = D
+        self.interpolation = interpolation
+        self.slip_max = slip_max
+        self.max_error = max_error
+        self.error = 0.0
+        if (interpolation is None):
+            return
+        if (interpolation not in ['linear','cubic']):
+            raise ValueError("unknown interpolation "+str(interpolation))
+        self.buildTable()
+
+    def analytic(self,slip):
+        return self.D * np.sin( self.C * np.arctan(self.B *slip))
+
+    def analyticDerivative(self,slip):
+        return self.D * np.cos( self.C * np.arctan(self.B *slip)) * self.C * self.B / (1 + (self.B*slip)**2)
+
+    # double table size until error at check points between table points is below max_error
+    def buildTable(self):
+        count = 64
+        while True:
+            self.slip_min = -self.slip_max
+            self.h = 2*self.slip_max/(count-1)
+            self.inv_h = 1.0/self.h
+            self.slip_table = np.linspace(-self.slip_max,self.slip_max,count)
+            self.table = self.analytic(self.slip_table)
+            self.derivative_table = self.analyticDerivative(self.slip_table)
+            # derivative per table step, used by hermite basis
+            self.step_derivative_table = self.derivative_table*self.h
+            check = (self.slip_table[:-1,np.newaxis] + np.linspace(0.05,0.95,10)*self.h).flatten()
+            self.error = max(np.max(np.abs(self.interpolate(check) - self.analytic(check))),
+                    np.max(np.abs(self.interpolate(check,derivative=True) - self.analyticDerivative(check))))
+            if (self.error < self.max_error or count >= 2**22):
+                break
+            count *= 2
+        # lists are faster to index for scalar evaluation
+        self.table_list = self.table.tolist()
+        self.step_derivative_list = self.step_derivative_table.tolist()
+
+    def __call__(self,slip):
+        if (isinstance(slip,np.ndarray)):
+            if (self.interpolation is None):
+                return self.analytic(slip)
+            return self.interpolate(slip)
+        return self.evalScalar(slip)
+
+    def evalScalar(self,slip):
+        if (self.interpolation is None):
+            return self.D * sin( self.C * atan(self.B *slip))
+        u = (slip - self.slip_min)*self.inv_h
+        i = int(u)
+        if (u < 0 or i >= len(self.table_list)-1):
+            return self.D * sin( self.C * atan(self.B *slip))
+        t = u - i
+        y0 = self.table_list[i]
+        y1 = self.table_list[i+1]
+        if (self.interpolation == 'linear'):
+            return y0 + t*(y1-y0)
+        m0 = self.step_derivative_list[i]
+        m1 = self.step_derivative_list[i+1]
+        t2 = t*t
+        t3 = t2*t
+        return (2*t3-3*t2+1)*y0 + (t3-2*t2+t)*m0 + (-2*t3+3*t2)*y1 + (t3-t2)*m1
+
+    # table lookup for arrays, value or derivative
+    def interpolate(self,slip,derivative=False):
+        slip = np.asarray(slip,dtype=float)
+        u = (slip - self.slip_min)*self.inv_h
+        i = u.astype(np.intp)
+        np.minimum(i,len(self.table)-2,out=i)
+        np.maximum(i,0,out=i)
+        t = u - i
+        if (self.interpolation == 'linear'):
+            table = self.derivative_table if derivative else self.table
+            y0 = table[i]
+            retval = y0 + t*(table[i+1]-y0)
+        else:
+            y0 = self.table[i]
+            y1 = self.table[i+1]
+            m0 = self.step_derivative_table[i]
+            m1 = self.step_derivative_table[i+1]
+            t2 = t*t
+            if (derivative):
+                retval = ((6*t2-6*t)*(y0-y1) + (3*t2-4*t+1)*m0 + (3*t2-2*t)*m1)*self.inv_h
+            else:
+                t3 = t2*t
+                retval = (2*t3-3*t2+1)*y0 + (t3-2*t2+t)*m0 + (-2*t3+3*t2)*y1 + (t3-t2)*m1
+        outside = np.abs(slip) > self.slip_max
+        if (outside.any()):
+            retval = np.where(outside, self.analyticDerivative(slip) if derivative else self.analytic(slip), retval)
+        return retval
+
+    def derivative(self,slip):
+        if (self.interpolation is None):
+            return self.analyticDerivative(slip)
+        return self.interpolate(slip,derivative=True)
+
+# shared by simulators
+tire_model = TireModel()
+
 '''
 xx = np.linspace(-10.0,10.0)
 acc = np.arctan(xx)
@@ -38,6 +150,7 @@ plt.show()
 '''
 
 if __name__=="__main__":
+    import matplotlib.pyplot as plt
 
     xx = np.linspace(radians(-40),radians(40),1000)
     acc = tireCurve(xx)
@@ -16,7 +16,7 @@ from track import RCPTrack
 import cv2
 from time import sleep
 
-from tire import tireCurve
+from tire import tire_model
 from PIL import Image
 
 from collections import namedtuple
@@ -113,8 +113,8 @@ def step_raw(state,control,dt=0.01,slip_f_override=None):
 
         #Ffy = tireCurve(slip_f) * m * ( 9.8 *lr/(lr+lf) - d_vx*h/(lr+lf))
         #Fry = 1.15*tireCurve(slip_r) * m * ( 9.8 *lf/(lr+lf) + d_vx*h/(lr+lf))
-        Ffy = 0.9*tireCurve(slip_f) * m * 9.8 *lr/(lr+lf)
-        Fry = 0.95*tireCurve(slip_r) * m * 9.8 *lf/(lr+lf)
+        Ffy = 0.9*tire_model(slip_f) * m * 9.8 *lr/(lr+lf)
+        Fry = 0.95*tire_model(slip_r) * m * 9.8 *lf/(lr+lf)
 
         d_vy = 1.0/m * (Fry + Ffy * np.cos( steering ) - m * vx * omega)
         d_omega = 1.0/Iz * (Ffy * lf * np.cos( steering ) - Fry * lr)
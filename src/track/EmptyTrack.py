@@ -1,6 +1,7 @@
 from track.Track import Track
 import numpy as np
-import cv2
+from util.lazyImport import lazyImport
+cv2 = lazyImport('cv2')
 from math import sin,cos
 
 class EmptyTrack(Track):
@@ -11,7 +11,8 @@ from common import *
 from track.Track import Track
 import json
 from scipy.interpolate import splprep, splev,CubicSpline,interp1d
-import matplotlib.pyplot as plt
+from util.lazyImport import lazyImport
+plt = lazyImport('matplotlib.pyplot')
 
 class OrcaTrack(Track):
     def __init__(self,main,config):
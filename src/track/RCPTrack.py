@@ -3,20 +3,25 @@
 import numpy as np
 import os.path
 from numpy import isclose
-import matplotlib.pyplot as plt
+from util.lazyImport import lazyImport
+plt = lazyImport('matplotlib.pyplot')
 from math import atan2,radians,degrees,sin,cos,pi,tan,copysign,asin,acos,isnan
 from scipy.interpolate import splprep, splev,CubicSpline,interp1d
 from scipy.optimize import minimize_scalar,minimize,brentq
 from scipy.integrate import solve_ivp
 from time import sleep,time
-import cv2
-from PIL import Image
+cv2 = lazyImport('cv2')
+Image = lazyImport('PIL.Image')
 import pickle
-from bisect import bisect
 
 from common import *
 from track.Track import Track
 from util.timeUtil import execution_timer
+from util.racelineIndex import RacelineIndex
+from util.racelineArtifact import artifactFilename,saveArtifact,loadArtifact
+from util.speedProfile import speedProfile,constantMotor
+from util.arcLength import arcLength,UniformLut
+from util.renderCache import composite
 
 # debugging
 K_vec = [] # curvature
@@ -53,6 +58,8 @@ class RCPTrack(Track):
         self.offset_timestamp = []
         self.log_no = 0
         self.debug = {}
+        # built when raceline is available, see buildRacelineIndex()
+        self.raceline_index = None
         # Moved to Car.py and Visualization.py
         #self.car = cv2.imread('data/image.png',-1)
 
@@ -152,7 +159,13 @@ class RCPTrack(Track):
         return 
 
 
+    # picture of the track, tiles layer from render cache unless drawing onto img
     def drawTrack(self, img=None,show=False):
+        if img is None:
+            return self.renderTrack(('tiles',))
+        return self.renderTiles(img)
+
+    def renderTiles(self, img=None):
         # show a picture of the track
         # resolution : pixels per peter
         # scale: side length of a grid (meter)
@@ -182,25 +195,21 @@ class RCPTrack(Track):
         if img is None:
             img = 255*np.ones([gs*rows,gs*cols,3],dtype='uint8')
         lookup_table = {'SE':0,'SW':270,'NE':90,'NW':180}
+        # rotate each tile type once
+        tiles = {'WE':WE}
+        M = cv2.getRotationMatrix2D((gs/2,gs/2),90,1.01)
+        tiles['NS'] = cv2.warpAffine(WE,M,(gs,gs))
+        for signature,angle in lookup_table.items():
+            M = cv2.getRotationMatrix2D((gs/2,gs/2),angle,1.01)
+            tiles[signature] = cv2.warpAffine(SE,M,(gs,gs))
         for i in range(cols):
             for j in range(rows):
                 signature = self.track[i][rows-1-j]
                 if signature == None:
                     continue
 
-                if (signature == 'WE'):
-                    img[j*gs:(j+1)*gs,i*gs:(i+1)*gs] = WE
-                    continue
-                elif (signature == 'NS'):
-                    M = cv2.getRotationMatrix2D((gs/2,gs/2),90,1.01)
-                    NS = cv2.warpAffine(WE,M,(gs,gs))
-                    img[j*gs:(j+1)*gs,i*gs:(i+1)*gs] = NS
-                    continue
-                elif (signature in lookup_table):
-                    M = cv2.getRotationMatrix2D((gs/2,gs/2),lookup_table[signature],1.01)
-                    dst = cv2.warpAffine(SE,M,(gs,gs))
-                    img[j*gs:(j+1)*gs,i*gs:(i+1)*gs] = dst
-                    continue
+                if (signature in tiles):
+                    img[j*gs:(j+1)*gs,i*gs:(i+1)*gs] = tiles[signature]
                 else:
                     print("err, unexpected track designation : " + signature)
 
@@ -317,6 +326,7 @@ class RCPTrack(Track):
         #tck, u = splprep(pts.T, u=None, s=0.0, per=1) 
         self.u = u
         self.raceline = tck
+        self.raceline_index = None
         '''
         u_new = np.linspace(0,self.track_length_grid,100)
         x_new, y_new = splev(u_new, tck)
@@ -337,23 +347,24 @@ class RCPTrack(Track):
         '''
         
 
-    def generateSpeedProfile(self, n_steps=1000):
-        g = 9.81
+    # three pass velocity profile along raceline, see util/speedProfile.py
+    # mu: friction factor
+    # acc_max_motor, dec_max_motor: maximum longitudinal acceleration/deceleration from motor,
+    #   either a constant or a function of longitudinal speed (e.g. util.speedProfile.linearMotor)
+    # show: plot the three passes (blocking)
+    # returns u values and target speed at each
+    def generateSpeedProfile(self, n_steps=1000, mu=1.1, acc_max_motor=3.3, dec_max_motor=4.5, show=True):
         self.n_steps = n_steps
-
-        # friction factor
-        mu = 1.1
-        # maximum longitudinial acceleration available from motor, given current longitudinal speed
-        # actually around 3.3
-        acc_max_motor = lambda x:3.3
-        dec_max_motor = lambda x:4.5
+        if (not callable(acc_max_motor)):
+            acc_max_motor = constantMotor(acc_max_motor)
+        if (not callable(dec_max_motor)):
+            dec_max_motor = constantMotor(dec_max_motor)
         # generate velocity profile
         # u values for control points
         xx = np.linspace(0,self.track_length_grid,n_steps+1)
-        #curvature = splev(xx,self.raceline,der=2)
-        #curvature = np.linalg.norm(curvature,axis=0)
 
         # let raceline curve be r(u)
+        r = np.array(splev(xx,self.raceline,der=0))
         # dr = r'(u), parameterized with xx/u
         dr = np.array(splev(xx,self.raceline,der=1))
         # ddr = r''(u)
@@ -361,57 +372,13 @@ class RCPTrack(Track):
         _norm = lambda x:np.linalg.norm(x,axis=0)
         # radius of curvature can be calculated as R = |y'|^3/sqrt(|y'|^2*|y''|^2-(y'*y'')^2)
         curvature = 1.0/(_norm(dr)**3/(_norm(dr)**2*_norm(ddr)**2 - np.sum(dr*ddr,axis=0)**2)**0.5)
+        # distance between two steps
+        ds = _norm(np.diff(r,axis=1))
 
-        # first pass, based on lateral acceleration
-        v1 = (mu*g/curvature)**0.5
-
-        dist = lambda a,b: ((a[0]-b[0])**2+(a[1]-b[1])**2)**0.5
-        # second pass, based on engine capacity and available longitudinal traction
-        # start from the index with lowest speed
-        min_xx = np.argmin(v1)
-        v2 = np.zeros_like(v1)
-        v2[min_xx] = v1[min_xx]
-        for i in range(min_xx,min_xx+n_steps):
-            # lateral acc at next step if the car mainains speed
-            a_lat = v2[i%n_steps]**2*curvature[(i+1)%n_steps]
-
-            # is there available traction for acceleration?
-            if ((mu*g)**2-a_lat**2)>0:
-                a_lon_available_traction = ((mu*g)**2-a_lat**2)**0.5
-                # constrain with motor capacity
-                a_lon = min(acc_max_motor(v2[i%n_steps]),a_lon_available_traction)
-
-                (x_i, y_i) = splev(xx[i%n_steps], self.raceline, der=0)
-                (x_i_1, y_i_1) = splev(xx[(i+1)%n_steps], self.raceline, der=0)
-                # distance between two steps
-                ds = dist((x_i, y_i),(x_i_1, y_i_1))
-                # assume vehicle accelerate uniformly between the two steps
-                v2[(i+1)%n_steps] =  min((v2[i%n_steps]**2 + 2*a_lon*ds)**0.5,v1[(i+1)%n_steps])
-            else:
-                v2[(i+1)%n_steps] =  v1[(i+1)%n_steps]
-
-        v2[-1]=v2[0]
-        # third pass, backwards for braking
-        min_xx = np.argmin(v2)
-        v3 = np.zeros_like(v1)
-        v3[min_xx] = v2[min_xx]
-        for i in np.linspace(min_xx,min_xx-n_steps,n_steps+2):
-            i = int(i)
-            a_lat = v3[i%n_steps]**2*curvature[(i-1+n_steps)%n_steps]
-            a_lon_available_traction = abs((mu*g)**2-a_lat**2)**0.5
-            a_lon = min(dec_max_motor(v3[i%n_steps]),a_lon_available_traction)
-            #print(a_lon)
-
-            (x_i, y_i) = splev(xx[i%n_steps], self.raceline, der=0)
-            (x_i_1, y_i_1) = splev(xx[(i-1+n_steps)%n_steps], self.raceline, der=0)
-            # distance between two steps
-            ds = dist((x_i, y_i),(x_i_1, y_i_1))
-            #print(ds)
-            v3[(i-1+n_steps)%n_steps] =  min((v3[i%n_steps]**2 + 2*a_lon*ds)**0.5,v2[(i-1+n_steps)%n_steps])
-            #print(v3[(i-1+n_steps)%n_steps],v2[(i-1+n_steps)%n_steps])
-            pass
-
-        v3[-1]=v3[0]
+        v1,v2,v3 = speedProfile(ds,curvature[:-1],mu,acc_max_motor,dec_max_motor)
+        v1 = np.append(v1,v1[0])
+        v2 = np.append(v2,v2[0])
+        v3 = np.append(v3,v3[0])
 
         # call with self.targetVfromU(u) alwayos u is in range [0,len(self.ctrl_pts)]
         self.targetVfromU = interp1d(xx,v3,kind='cubic')
@@ -422,22 +389,15 @@ class RCPTrack(Track):
         self.max_v = max(v3)
         self.min_v = min(v3)
 
-        # debug target v curve fitting
-        #p0, = plt.plot(xx,v3,'*',label='original')
-        #xxx = np.linspace(0,self.track_length_grid,10*n_steps)
-        #sampleV = self.targetVfromU(xxx)
-        #p1, = plt.plot(xxx,sampleV,label='fitted')
-        #plt.legend(handles=[p0,p1])
-        #plt.show()
-
-
-        # three pass of velocity profile
-        p0, = plt.plot(curvature, label='curvature')
-        p1, = plt.plot(v1,label='1st pass')
-        p2, = plt.plot(v2,label='2nd pass')
-        p3, = plt.plot(v3,label='3rd pass')
-        plt.legend(handles=[p1,p2,p3])
-        plt.show()
+        if (show):
+            # three pass of velocity profile
+            p0, = plt.plot(curvature, label='curvature')
+            p1, = plt.plot(v1,label='1st pass')
+            p2, = plt.plot(v2,label='2nd pass')
+            p3, = plt.plot(v3,label='3rd pass')
+            plt.legend(handles=[p1,p2,p3])
+            plt.show()
+        return xx,v3
 
 
     # ---------- for curvature norm minimization -----
@@ -503,14 +463,34 @@ class RCPTrack(Track):
         print_ok("track and raceline saved")
 
     # load quadratically smoothed raceline
+    # the first load of a pickle saves everything derived from it as an artifact
+    # (see util/racelineArtifact.py), later loads of the same pickle read that instead
+    # an artifact (.npz) can also be loaded directly
     def load(self,filename=None):
         # get data folder abs path
         thisdir = os.path.dirname(os.path.abspath(__file__))
         basedir = os.path.dirname(thisdir)
         if filename is None:
             filename = "raceline.p"
+        path = basedir+'/data/'+filename
+        if filename.endswith('.npz'):
+            loadArtifact(self,path)
+            print_ok("track and raceline loaded")
+            return
+
+        artifact_filename = None
+        if (os.path.isfile(path)):
+            artifact_filename = artifactFilename(path)
+            if (os.path.isfile(artifact_filename)):
+                try:
+                    loadArtifact(self,artifact_filename)
+                    print_ok("track and raceline loaded")
+                    return
+                except (KeyError,ValueError,OSError) as e:
+                    print_warning("can't use raceline artifact "+artifact_filename+" ("+str(e)+"), rebuilding")
+
         try:
-            with open(basedir+'/data/'+filename, 'rb') as f:
+            with open(path, 'rb') as f:
                 save = pickle.load(f)
         except FileNotFoundError:
             print_error("can't find "+filename+", run qpSmooth.py first")
@@ -532,6 +512,10 @@ class RCPTrack(Track):
 
         print_ok("track and raceline loaded")
         self.reconstructRaceline()
+        try:
+            saveArtifact(self,artifact_filename)
+        except OSError as e:
+            print_warning("can't save raceline artifact: "+str(e))
         return
 
     # calculate distance
@@ -738,123 +722,137 @@ class RCPTrack(Track):
             wr = radius - deadzone
         return min(wl,wr)
 
+    # same as checkTrackBoundary for coords (n,2), negative outside track tiles
+    def checkTrackBoundaryBatch(self,coords):
+        deadzone = 0.087
+        if (not hasattr(self,'tile_type')):
+            self.buildTileTable()
+        local = np.asarray(coords,dtype=float).reshape(-1,2)/self.scale
+        cell = np.floor(local).astype(int)
+        inside = (cell[:,0] >= 0) & (cell[:,0] < self.tile_type.shape[0]) & (cell[:,1] >= 0) & (cell[:,1] < self.tile_type.shape[1])
+        cell = np.where(inside[:,np.newaxis],cell,0)
+        tile = np.where(inside,self.tile_type[cell[:,0],cell[:,1]],0)
+        local -= cell
+        # straights, distance to nearer wall across the band
+        across = np.where(tile == 1,local[:,1],local[:,0])
+        margin = np.minimum(across - deadzone, 1 - deadzone - across)
+        # turns, distance to nearer wall of annulus around apex
+        radius = np.linalg.norm(local - self.tile_apex[tile],axis=1)
+        margin = np.where(tile >= 3, np.minimum(1 - deadzone - radius, radius - deadzone), margin)
+        return np.where(tile > 0, margin, -1.0)
+
+    def drivableArea(self,coords):
+        return self.checkTrackBoundaryBatch(coords) > 0
+
+    # coords are matched to raceline of their own grid, as in localTrajectory
+    def racelineProjection(self,coords):
+        coords = np.asarray(coords,dtype=float).reshape(-1,2)
+        if (self.raceline_index is None):
+            self.buildRacelineIndex()
+        seq = self.gridSequenceBatch(coords)
+        valid = seq >= 0
+        lower,upper = self.racelineWindow(np.maximum(seq,0),coords)
+        u,_,dist = self.raceline_index.query(coords,lower=lower,upper=upper)
+        s = np.full(len(u),np.nan)
+        s[valid] = self.uToS(u[valid])
+        dist[np.logical_not(valid)] = np.nan
+        return s,dist
+
     # given coordinate and heading, calculate precise boundary to left and right
     # return a vector (dist_to_left, dist_to_right)
     def preciseTrackBoundary(self,coord,heading):
-        heading = (heading + np.pi)%(2*np.pi) - np.pi
-        # figure out which grid the coord is in
-        # grid coordinate, (col, row), col starts from left and row starts from bottom, both indexed from 0
-        nondim= np.array(np.array(coord)/self.scale//1,dtype=int)
-        nondim[0] = np.clip(nondim[0],0,len(self.track)-1).astype(int)
-        nondim[1] = np.clip(nondim[1],0,len(self.track[0])-1).astype(int)
-
-        # e.g. 'WE','SE'
-        grid_type = self.track[nondim[0]][nondim[1]]
-
-        # change ref frame to tile local ref frame
-        x_local = coord[0]/self.scale - nondim[0]
-        y_local = coord[1]/self.scale - nondim[1]
-
-        # find the distance to track sides
-        # boundary/wall width / grid side length
+        left,right = self.preciseTrackBoundaryBatch(np.reshape(coord,(1,2)),np.array([heading]))
+        return (left[0],right[0])
+
+    # same as preciseTrackBoundary for coords (n,2) and headings (n,)
+    # return arrays dist_to_left (n,), dist_to_right (n,)
+    def preciseTrackBoundaryBatch(self,coords,headings):
+        left = self.boundaryDistance(coords,headings+np.pi/2)
+        right = self.boundaryDistance(coords,headings-np.pi/2)
+        return left,right
+
+    # distance from coords (n,2) along directions (n,) (angle, rad) to track boundary
+    # same boundary as checkTrackBoundary: straight tiles are a band between two walls,
+    # turn tiles an annulus around apex, the ray is followed across tiles and the
+    # intersection with each tile's walls is solved in closed form
+    # points outside track or grid give 0
+    def boundaryDistance(self,coords,directions,max_tiles=8):
+        # boundary/wall width / grid side length, same as checkTrackBoundary
         deadzone = 0.087
-        straights = ['WE','NS']
-        turns = ['SE','SW','NE','NW']
-        if grid_type in straights:
-            if grid_type == 'WE':
-                # track section is staight, arranged horizontally
-                # remaining space on top (negative means coord outside track
-                grid_down = y_local - deadzone
-                grid_up = 1 - deadzone - y_local
-                if (heading > -np.pi/2 and heading < np.pi/2):
-                    left = grid_up / cos(heading)
-                    right = grid_down / cos(heading)
-                else:
-                    left = - grid_down / cos(heading)
-                    right = - grid_up / cos(heading)
-
-            if grid_type == 'NS':
-                # track section is staight, arranged vertically
-                # remaining space on left (negative means coord outside track
-                grid_left= x_local - deadzone
-                grid_right = 1 - deadzone - x_local
-                if (heading > 0 and heading < np.pi):
-                    left = grid_left/ sin(heading)
-                    right = grid_right/ sin(heading)
-                else:
-                    left = - grid_right/ sin(heading)
-                    right = - grid_left/ sin(heading)
-                    # TODO
-        elif grid_type in turns:
-            step_size = 0.01
-
-            # find left boundary
-            left = 0.0
-            flag_in_limit = True
-            while (flag_in_limit):
-                left_point = (coord[0] + left * cos(heading+np.pi/2),coord[1] + left * sin(heading+np.pi/2))
-                flag_in_limit = self.checkTrackBoundary(left_point) > 0
-                left += step_size
-
-            # find right boundary
-            right = 0.0
-            flag_in_limit = True
-            while (flag_in_limit):
-                right_point = (coord[0] + right * cos(heading-np.pi/2),coord[1] + right * sin(heading-np.pi/2))
-                flag_in_limit = self.checkTrackBoundary(right_point) > 0
-                right += step_size
-
-            # convert metric unit to dimensionless unit
-            left /= self.scale
-            right /= self.scale
-
-            '''
-            if grid_type == 'SE':
-                apex = (1,0)
-            if grid_type == 'SW':
-                apex = (0,0)
-            if grid_type == 'NE':
-                apex = (1,1)
-            if grid_type == 'NW':
-                apex = (0,1)
-            radius = ((x_local - apex[0])**2 + (y_local - apex[1])**2)**0.5
-            grid_out = 1-deadzone-radius
-            grid_in = radius - deadzone
-
-
-
-            if grid_type == 'SE':
-                if (heading > -0.25*np.pi and heading < 0.75*np.pi):
-                    left = 0.1
-                    right = 0.1
-                else:
-                    left = 0.1
-                    right = 0.1
-            if grid_type == 'SW':
-                if (heading > -0.75*np.pi and heading < 0.25*np.pi):
-                    left = 0.1
-                    right = 0.1
-                else:
-                    left = 0.1
-                    right = 0.1
-            if grid_type == 'NE':
-                if (heading > 0.25*np.pi and heading < 1.25*np.pi):
-                    left = 0.1
-                    right = 0.1
-                else:
-                    left = 0.1
-                    right = 0.1
-            if grid_type == 'NW':
-                if (heading > 0.35*np.pi and heading < -0.25*np.pi):
-                    left = 0.1
-                    right = 0.1
-                else:
-                    left = 0.1
-                    right = 0.1
-            '''
-
-
-        return (left*self.scale,right*self.scale)
+        if (not hasattr(self,'tile_type')):
+            self.buildTileTable()
+        # work in grid units, origin of ray at param 0
+        origin = np.asarray(coords,dtype=float).reshape(-1,2)/self.scale
+        direction = np.column_stack([np.cos(directions),np.sin(directions)])
+        n = len(origin)
+        cell = np.floor(origin).astype(int)
+        t = np.zeros(n)
+        dist = np.zeros(n)
+        active = np.ones(n,dtype=bool)
+        with np.errstate(divide='ignore',invalid='ignore'):
+            # param to cross next vertical/horizontal grid line is (line - origin)/direction
+            step_sign = np.where(direction >= 0,1,0)
+            for i in range(max_tiles):
+                idx = np.nonzero(active)[0]
+                if (len(idx) == 0):
+                    break
+                c = cell[idx]
+                o = origin[idx] - c
+                d = direction[idx]
+                t0 = t[idx]
+                # param where ray leaves this tile
+                t_axis = np.where(d != 0, (step_sign[idx] - o)/d, np.inf)
+                t1 = t_axis.min(axis=1)
+
+                in_grid = np.all((c >= 0) & (c < self.tile_type.shape),axis=1)
+                c_clip = np.clip(c,0,np.array(self.tile_type.shape)-1)
+                tile = np.where(in_grid,self.tile_type[c_clip[:,0],c_clip[:,1]],0)
+
+                # first param in [t0,t1] where ray leaves track within this tile, inf if it doesn't
+                hit = np.full(len(idx),np.inf)
+                # no track, wall right away
+                hit[tile == 0] = t0[tile == 0]
+                # straights, band in local y ('WE') or x ('NS')
+                for tile_code,axis in ((1,1),(2,0)):
+                    mask = tile == tile_code
+                    pos = o[mask,axis] + t0[mask]*d[mask,axis]
+                    inside = (pos > deadzone) & (pos < 1-deadzone)
+                    wall = np.where(d[mask,axis] > 0, 1-deadzone, deadzone)
+                    exit_t = np.where(d[mask,axis] != 0, (wall - o[mask,axis])/d[mask,axis], np.inf)
+                    hit[mask] = np.where(inside, exit_t, t0[mask])
+                # turns, annulus between radius deadzone and 1-deadzone around apex
+                mask = tile >= 3
+                q = o[mask] - self.tile_apex[tile[mask]]
+                dm = d[mask]
+                tm = t0[mask]
+                radius = np.linalg.norm(q + tm[:,np.newaxis]*dm,axis=1)
+                inside = (radius > deadzone) & (radius < 1-deadzone)
+                b = np.sum(q*dm,axis=1)
+                qq = np.sum(q*q,axis=1)
+                exit_outer = -b + np.sqrt(np.maximum(b*b - (qq-(1-deadzone)**2),0))
+                disc_inner = b*b - (qq-deadzone**2)
+                enter_inner = np.where(disc_inner >= 0, -b - np.sqrt(np.maximum(disc_inner,0)), np.inf)
+                enter_inner = np.where(enter_inner >= tm, enter_inner, np.inf)
+                hit[mask] = np.where(inside, np.minimum(exit_outer,enter_inner), tm)
+
+                found = hit <= t1
+                dist[idx[found]] = np.maximum(hit[found],0)
+                active[idx[found]] = False
+                # continue into next tile
+                cont = np.logical_not(found)
+                t[idx[cont]] = t1[cont]
+                cross = (t_axis[cont] == t1[cont,np.newaxis])
+                cell[idx[cont]] += cross*np.where(d[cont] > 0,1,-1)
+        # rays still inside track after max_tiles tiles stop there
+        dist[active] = t[active]
+        return dist*self.scale
+
+    # tile type code and turn apex (in tile units) for boundaryDistance
+    # 0: no track, 1: 'WE', 2: 'NS', 3-6: turns 'SE','SW','NE','NW'
+    def buildTileTable(self):
+        codes = {'WE':1,'NS':2,'SE':3,'SW':4,'NE':5,'NW':6}
+        self.tile_type = np.array([[codes.get(tile,0) for tile in column] for column in self.track],dtype=int)
+        self.tile_apex = np.array([[0,0],[0,0],[0,0],[1,0],[0,0],[1,1],[0,1]],dtype=float)
 
     # distance between start and end of path, 
     # must be sufficiently close
@@ -895,6 +893,50 @@ class RCPTrack(Track):
     # ---------- for curvature norm minimization -----
 
     # draw point corresponding to u
+    def canvasShape(self):
+        gs = int(self.resolution * self.scale)
+        return (gs*self.gridsize[0],gs*self.gridsize[1],3)
+
+    def layerSource(self,name):
+        if (name == 'tiles'):
+            return (self.track,self.gridsize,self.scale,self.resolution)
+        elif (name == 'raceline'):
+            u_new = np.linspace(0,self.track_length_grid,1000)
+            return (self.raceline,self.targetVfromU(u_new%self.track_length_grid),self.min_v,self.max_v,self.gridsize,self.scale,self.resolution)
+        return Track.layerSource(self,name)
+
+    def renderLayer(self,name,shape):
+        if (name == 'tiles'):
+            img = self.renderTiles(255*np.ones(shape,dtype='uint8'))
+            return img,np.ones(shape[:2],dtype=bool)
+        elif (name == 'raceline'):
+            img = np.zeros(shape,dtype='uint8')
+            rows = self.gridsize[0]
+            # this gives smoother result, but difficult to relate u to actual grid
+            #u_new = np.linspace(self.u.min(),self.u.max(),1000)
+
+            # the range of u is len(self.ctrl_pts) + 1, since we copied one to the end
+            # x_new and y_new are in non-dimensional grid unit
+            u_new = np.linspace(0,self.track_length_grid,1000)
+            x_new, y_new = splev(u_new, self.raceline, der=0)
+            # convert to visualization coordinate
+            x_new *= self.resolution 
+            y_new *= self.resolution
+            y_new = self.resolution*self.scale*rows - y_new
+
+            pts = np.vstack([x_new,y_new]).T
+            # for polylines, pts = pts.reshape((-1,1,2))
+            pts = pts.reshape((-1,2))
+            pts = pts.astype(int)
+            # render different color based on speed
+            # slow - red, fast - green (BGR)
+            vv = self.targetVfromU(u_new%self.track_length_grid)
+            green = ((vv-self.min_v)/(self.max_v-self.min_v)*255).astype(int)
+            for i in range(len(u_new)-1):
+                img = cv2.line(img, tuple(pts[i].tolist()),tuple(pts[i+1].tolist()), color=(0,int(green[i]),255-int(green[i])), thickness=3) 
+            return img,np.any(img > 0,axis=2)
+        return Track.renderLayer(self,name,shape)
+
     def drawPointU(self,img,uu):
         rows = self.gridsize[0]
         x_new, y_new = splev(uu, self.raceline, der=0)
@@ -910,31 +952,10 @@ class RCPTrack(Track):
         cols = self.gridsize[1]
         res = int(self.resolution*self.scale)
 
-        # this gives smoother result, but difficult to relate u to actual grid
-        #u_new = np.linspace(self.u.min(),self.u.max(),1000)
-
-        # the range of u is len(self.ctrl_pts) + 1, since we copied one to the end
-        # x_new and y_new are in non-dimensional grid unit
-        u_new = np.linspace(0,self.track_length_grid,1000)
-        x_new, y_new = splev(u_new, self.raceline, der=0)
-        # convert to visualization coordinate
-        x_new *= self.resolution 
-        y_new *= self.resolution
-        y_new = self.resolution*self.scale*rows - y_new
-
         if img is None:
             img = np.zeros([res*rows,res*cols,3],dtype='uint8')
-
-        pts = np.vstack([x_new,y_new]).T
-        # for polylines, pts = pts.reshape((-1,1,2))
-        pts = pts.reshape((-1,2))
-        pts = pts.astype(int)
-        # render different color based on speed
-        # slow - red, fast - green (BGR)
-        v2c = lambda x: int((x-self.min_v)/(self.max_v-self.min_v)*255)
-        getColor = lambda v:(0,v2c(v),255-v2c(v))
-        for i in range(len(u_new)-1):
-            img = cv2.line(img, tuple(pts[i]),tuple(pts[i+1]), color=getColor(self.targetVfromU(u_new[i]%self.track_length_grid)), thickness=3) 
+        # raceline layer from render cache
+        img = composite(img,self.layer('raceline',img.shape))
 
         # plot reference points
         #img = cv2.polylines(img, [pts], isClosed=True, color=lineColor, thickness=3) 
@@ -969,106 +990,24 @@ class RCPTrack(Track):
         # coord should be given in meters
         nondim= np.array((coord/self.scale)//1,dtype=int)
 
-        # distance squared, not need to find distance here
-        dist_2 = lambda a,b: (a[0]-b[0])**2+(a[1]-b[1])**2
-        fun = lambda u: dist_2(splev(u%self.track_length_grid,self.raceline),coord)
-        # last_u is the seq found last time, which should be a good estimate of where to start
-        # disable this functionality since it doesn't handle multiple cars
-        self.last_u = None
-        if self.last_u is None:
-            # the seq here starts from origin
-            seq = -1
-            # figure out which u this grid corresponds to 
-            for i in range(len(self.grid_sequence)):
-                if nondim[0]==self.grid_sequence[i][0] and nondim[1]==self.grid_sequence[i][1]:
-                    seq = i
-                    break
-
-            if seq == -1:
-                print("error, coord not on track, x = %.2f, y=%.2f"%(coord[0],coord[1]))
-                return None
-
-            # the grid that contains the coord
-            #print("in grid : " + str(self.grid_sequence[seq]))
-
-            # find the closest point to the coord
-            # because we wrapped the end point to the beginning of sample point, we need to add this offset
-            # Now seq would correspond to u in raceline, i.e. allow us to locate the raceline at that section
-            seq += self.origin_seq_no
-            seq %= self.track_length_grid
-
-            # this gives a close, usually preceding raceline point, this does not give the closest ctrl point
-            # due to smoothing factor
-            #print("neighbourhood raceline pt " + str(splev(seq,self.raceline)))
-
-            # determine which end is the coord closer to, since seq points to the previous control point,
-            # not necessarily the closest one
-            if fun(seq+1) < fun(seq):
-                seq += 1
-            if fun(seq-1) < fun(seq):
-                seq -= 1
-        else:
-            seq = self.last_u
-
-        # Goal: find the point on raceline closest to coord
-        # i.e. find x that minimizes fun(x)
-        # we know x will be close to seq
-
-        # easy method
-        #brute force, This takes 77% of runtime. 
-        #lt.s('minimize_scalar')
-        #res = minimize_scalar(fun,bounds=[seq-0.6,seq+0.6],method='Bounded')
-        #lt.e('minimize_scalar')
-
-        # improved method: from observation, fun(x) is quadratic in proximity of seq
-        # we assume it to be ax^3 + bx^2 + cx + d and formulate this minimization as a linalg problem
-        # sample some points to build the trinomial simulation
+        if (self.raceline_index is None):
+            self.buildRacelineIndex()
+        # the seq here starts from origin
+        seq = self.grid_sequence_index.get((nondim[0],nondim[1]),-1)
+        if seq == -1:
+            print("error, coord not on track, x = %.2f, y=%.2f"%(coord[0],coord[1]))
+            return None
         self.debug['seq'] = seq
-        iv = np.array([-0.6,-0.3,0,0.3,0.6])+seq
-        # formulate linear problem
-        A = np.vstack([iv**3, iv**2,iv,[1,1,1,1,1]]).T
-        #B = np.mat([fun(x0), fun(x1), fun(x2)]).T
-        B = fun(iv).T
-        #abc = np.linalg.solve(A,B)
-        abc = np.linalg.lstsq(A,B, rcond=-1)[0]
-        a = abc[0]
-        b = abc[1]
-        c = abc[2]
-        d = abc[3]
-        fun = lambda x : a*x*x*x + b*x*x + c*x + d
-        fit = minimize(fun, x0=seq, method='L-BFGS-B', bounds=((seq-0.6,seq+0.6),))
-        min_fun_x = fit.x[0]
-        self.last_u = min_fun_x%self.track_length_grid
-
-        min_fun_val = float(fit.fun)
-        # find min val
-        #x = min_fun_x = (-b+(b*b-3*a*c)**0.5)/(3*a)
-        #if (seq-0.6<x<seq+0.6):
-        #    min_fun_val = a*x*x*x + b*x*x + c*x + d
-        #else:
-        #    # XXX this is a bit sketchy, maybe none of them is right
-        #    x = (-b+(b*b-3*a*c)**0.5)/(3*a)
-        #    min_fun_val = a*x*x*x + b*x*x + c*x + d
 
-        '''
-        xx = np.linspace(seq-0.6,seq+0.6)
-        plt.plot(xx,fun(xx),'b--')
-        plt.plot(iv,fun(iv),'bo')
-        plt.plot(xx,a*xx**3+b*xx**2+c*xx+d,'r-')
-        plt.plot(iv,a*iv**3+b*iv**2+c*iv+d,'ro')
-        plt.show()
-        '''
+        # find the point on raceline closest to coord, within the section of raceline of this grid
+        # projection on a densely sampled raceline, agrees with the exact closest point in that u range to well under 1mm
+        lower,upper = self.racelineWindow(seq,coord)
+        min_fun_x = self.raceline_index.queryPoint(coord[0],coord[1],lower,upper)[0]
 
-        #lt.track('x err', abs(min_fun_x-res.x))
-        #lt.track('fun err',abs(min_fun_val-res.fun))
-        #print('x err', abs(min_fun_x-res.x))
-        #print('fun err',abs(min_fun_val-res.fun))
-
-        raceline_point = splev(min_fun_x%self.track_length_grid,self.raceline)
-        #raceline_point = splev(res.x,self.raceline)
+        raceline_point = splev(min_fun_x,self.raceline)
+        min_fun_val = (coord[0]-raceline_point[0])**2 + (coord[1]-raceline_point[1])**2
 
         der = splev(min_fun_x%self.track_length_grid,self.raceline,der=1)
-        #der = splev(res.x,self.raceline,der=1)
 
         if (False):
             print("Seek local trajectory")
@@ -1102,48 +1041,79 @@ class RCPTrack(Track):
             return (raceline_point,copysign(abs(min_fun_val)**0.5,cross_theta),atan2(der[1],der[0]),copysign(norm_curvature,cross_curvature),request_velocity)
 
 
+    # index for closest point queries on raceline, see util/racelineIndex.py
+    # spacing: distance between raceline samples, chord error is about curvature*spacing^2/8
+    def buildRacelineIndex(self,spacing=0.004,cell_size=0.05):
+        # raceline is about scale long in each grid
+        n = int(np.ceil(self.track_length_grid*self.scale/spacing))
+        uu = np.linspace(0,self.track_length_grid,n,endpoint=False)
+        points = np.array(splev(uu,self.raceline)).T
+        self.raceline_index = RacelineIndex(points,uu,self.track_length_grid,(0,0,self.x_limit,self.y_limit),cell_size,max_distance=self.scale)
+        self.buildGridIndex()
+
+    # range of u the closest raceline point to coord is searched in, for coord in grid seq
+    # (index in grid_sequence), seq and coord can be arrays (n,) and (n,2)
+    # seq is offset to u of the raceline control point at the grid, moved to the next
+    # or previous control point if that one is closer, the range is that +-0.6
+    # this keeps a coord near a wall from being matched to raceline on the other side of it
+    def racelineWindow(self,seq,coord):
+        u = (np.asarray(seq) + self.origin_seq_no) % self.track_length_grid
+        coord = np.asarray(coord,dtype=float)
+        uu = u[...,np.newaxis] + np.array([-1,0,1])
+        x,y = splev(uu%self.track_length_grid,self.raceline)
+        dist2 = (x-coord[...,0,np.newaxis])**2 + (y-coord[...,1,np.newaxis])**2
+        u = np.where(dist2[...,2] < dist2[...,1], u+1, np.where(dist2[...,0] < dist2[...,1], u-1, u))
+        return u-0.6,u+0.6
+
+    # grid coordinate to seq
+    def buildGridIndex(self):
+        self.grid_sequence_index = {}
+        for i,grid in enumerate(self.grid_sequence):
+            self.grid_sequence_index.setdefault(tuple(grid),i)
+        # same as grid_sequence_index, as an array for vectorized lookup, -1 for grids not on track
+        grids = np.array(self.grid_sequence,dtype=int)
+        self.grid_sequence_array = np.full(grids.max(axis=0)+1,-1,dtype=int)
+        for grid,seq in self.grid_sequence_index.items():
+            self.grid_sequence_array[grid] = seq
+
+    # grid_sequence_index of coords (n,2), -1 off track
+    def gridSequenceBatch(self,coord):
+        nondim = np.floor(np.asarray(coord)/self.scale).astype(int)
+        in_grid = np.all((nondim >= 0) & (nondim < self.grid_sequence_array.shape),axis=1)
+        seq = np.full(len(nondim),-1,dtype=int)
+        seq[in_grid] = self.grid_sequence_array[nondim[in_grid,0],nondim[in_grid,1]]
+        return seq
+
+    # u<->s and s->v maps from arc length samples (uu,ss), see util/arcLength.py
+    def buildRacelineMaps(self,uu,ss):
+        self.u_lut = uu
+        self.s_lut = ss
+        self.raceline_len_m = ss[-1]
+        n = len(uu) - 1
+        self.uToS = UniformLut.fromSamples(uu,ss,n)
+        self.sToU = UniformLut.fromSamples(ss,uu,n)
+        s_grid = np.linspace(0,self.raceline_len_m,n+1)
+        self.sToV = UniformLut(0,self.raceline_len_m/n,self.targetVfromU(self.sToU(s_grid)%self.track_length_grid))
+
     # create two function to map between u(raceline parameter)<->s(distance along racelien)
     # also create mapping between s -> v_ref
     # also create raceline_s, raceline parameterized with s
     def reconstructRaceline(self):
-        s_vec = [0]
-        n_steps = 1000
-        uu = np.linspace(0,self.track_length_grid,n_steps+1)
-        dist = lambda a,b: ((a[0]-b[0])**2+(a[1]-b[1])**2)**0.5
-        path_len = 0
-        for i in range(n_steps):
-            (x_i, y_i) = splev(uu[i%n_steps], self.raceline, der=0)
-            (x_i_1, y_i_1) = splev(uu[(i+1)%n_steps], self.raceline, der=0)
-            # distance between two steps
-            ds = dist((x_i, y_i),(x_i_1, y_i_1))
-            path_len += ds
-            s_vec.append(path_len)
-
-        ss = np.array(s_vec)
-        vv = self.targetVfromU(uu%self.track_length_grid)
-
-        # using interp1d functions can cause some overhead
-        # when absolute speed is needed, use lookup tables
-        # this may lose some accuracy but with larger n_step
-        # and moderate change in velocity this should not be an issue
-        self.sToV_lut = lambda x: self.v_lut[bisect(self.s_lut,x)]
-        self.s_lut = ss
-        self.v_lut = vv
-
-        self.uToS = interp1d(uu,ss,kind='cubic')
-        self.sToU = interp1d(ss,uu,kind='cubic')
-        self.sToV = interp1d(ss,vv,kind='cubic')
-        self.raceline_len_m = path_len
-        #print("verify u and s mapping accuracy")
-        #ss_remap = self.uToS(self.sToU(ss))
-        #print("mean error in s %.5f m "%(np.mean(np.abs(ss-ss_remap))))
-        #print("max error in s %.5f m "%(np.max(np.abs(ss-ss_remap))))
+        uu,ss = arcLength(self.raceline,0,self.track_length_grid)
+        self.buildRacelineMaps(uu,ss)
+        # u->s->u at the middle of lut intervals, where linear interpolation is least accurate
+        s_mid = 0.5*(ss[:-1]+ss[1:])
+        self.raceline_map_error = np.max(np.abs(self.uToS(self.sToU(s_mid))-s_mid))
+        print_info("raceline %.3f m, u<->s round trip error %.1e m"%(self.raceline_len_m,self.raceline_map_error))
 
         # convert self.raceline(parameterized w.r.t. u) 
         # to self.raceline_s (parameterized w.r.t. s, distance along path)
+        n_steps = 1000
+        uu = np.linspace(0,self.track_length_grid,n_steps+1)
         rr = splev(uu%self.track_length_grid,self.raceline)
-        tck, u = splprep(rr, u=ss,s=0,per=1) 
+        tck, u = splprep(rr, u=self.uToS(uu),s=0,per=1) 
         self.raceline_s = tck
+        self.buildRacelineIndex()
         return
 
     # get future reference point for dynamic MPC
@@ -1221,8 +1191,7 @@ class RCPTrack(Track):
             # find ref velocity for projection ref points
             # TODO adjust ref velocity for current vehicle velocity
             #v_k = self.targetVfromU(u_k%self.track_length_grid)
-            #v_k = self.sToV(s_k%self.raceline_len_m)
-            v_k = self.sToV_lut(s_k%self.raceline_len_m)
+            v_k = self.sToV(s_k%self.raceline_len_m)
             v_vec.append(v_k)
         t.e("main loop")
 
@@ -1335,8 +1304,7 @@ class RCPTrack(Track):
             # find ref velocity for projection ref points
             # TODO adjust ref velocity for current vehicle velocity
             #v_k = self.targetVfromU(u_k%self.track_length_grid)
-            #v_k = self.sToV(s_k%self.raceline_len_m)
-            v_k = self.sToV_lut(s_k%self.raceline_len_m)
+            v_k = self.sToV(s_k%self.raceline_len_m)
             v_vec.append(v_k)
 
             xy_vec.append(splev(s_k%self.raceline_len_m, self.raceline_s))
@@ -1387,6 +1355,116 @@ class RCPTrack(Track):
         t.e()
         return np.array(xy_vec), np.array(v_vec), np.array(heading_vec)
         
+    # same as localTrajectory(states,wheelbase,return_u=True) for an (n,6) array of states, without a loop over states
+    # Return: arrays of
+    # raceline point (n,2), signed offset (n,), raceline heading (n,), signed curvature (n,), v_target (n,), u (n,), s (n,)
+    # rows whose front axle is off track are nan
+    def localTrajectoryBatch(self,states,wheelbase=90e-3):
+        states = np.asarray(states,dtype=float).reshape(-1,6)
+        heading = states[:,2]
+        coord = states[:,:2] + wheelbase*np.column_stack([np.cos(heading),np.sin(heading)])
+        if (self.raceline_index is None):
+            self.buildRacelineIndex()
+        # closest point within the section of raceline of each coord's grid, as in localTrajectory
+        seq = self.gridSequenceBatch(coord)
+        valid = seq >= 0
+        lower,upper = self.racelineWindow(np.maximum(seq,0),coord)
+        u,_,_ = self.raceline_index.query(coord,lower=lower,upper=upper)
+        u = np.where(valid,u,0.0)
+
+        raceline_point = np.array(splev(u,self.raceline)).T
+        der = np.array(splev(u,self.raceline,der=1))
+        vec_curvature = np.array(splev(u,self.raceline,der=2))
+        # negative offset means car is to the right of the trajectory
+        vec_offset = coord - raceline_point
+        cross_theta = der[0]*vec_offset[:,1] - der[1]*vec_offset[:,0]
+        offset = np.copysign(np.linalg.norm(vec_offset,axis=1),cross_theta)
+        orientation = np.arctan2(der[1],der[0])
+        cross_curvature = der[0]*vec_curvature[1]-der[1]*vec_curvature[0]
+        curvature = np.copysign(np.linalg.norm(vec_curvature,axis=0),cross_curvature)
+        v_target = self.targetVfromU(u)
+        s = self.uToS(u)
+
+        invalid = np.logical_not(valid)
+        raceline_point[invalid] = np.nan
+        for val in (offset,orientation,curvature,v_target,u,s):
+            val[invalid] = np.nan
+        return raceline_point,offset,orientation,curvature,v_target,u,s
+
+    # s and reference velocity of p points down the raceline from s0 (n,), spaced v*dt apart
+    # as in the main loop of getRefPoint, v0 (n,) is velocity at s0
+    # returns s (n,p+1) wrapped to [0,raceline_len_m) and v (n,p+1)
+    def projectAlongRaceline(self,s0,v0,p,dt):
+        s_vec = np.zeros((len(s0),p+1))
+        v_vec = np.zeros((len(s0),p+1))
+        s_vec[:,0] = s0
+        v_vec[:,0] = v0
+        for k in range(1,p+1):
+            s_vec[:,k] = s_vec[:,k-1] + v_vec[:,k-1] * dt
+            v_vec[:,k] = self.sToV(s_vec[:,k]%self.raceline_len_m)
+        return s_vec%self.raceline_len_m, v_vec
+
+    # signed curvature of raceline at s (any shape)
+    def curvatureAtS(self,s):
+        shape = np.shape(s)
+        s = np.ravel(s)
+        dr = np.array(splev(s,self.raceline_s,der=1))
+        ddr = np.array(splev(s,self.raceline_s,der=2))
+        _norm = lambda x:np.linalg.norm(x,axis=0)
+        curvature = 1.0/(_norm(dr)**3/(_norm(dr)**2*_norm(ddr)**2 - np.sum(dr*ddr,axis=0)**2)**0.5)
+        cross_curvature = dr[0]*ddr[1]-dr[1]*ddr[0]
+        return np.copysign(curvature,cross_curvature).reshape(shape)
+
+    # same as getRefPoint for an (n,6) array of states
+    # Return:
+    # offset (n,), e_heading (n,), v_ref (n,p+1), k_ref (n,p+1), coord_ref (n,p+1,2), valid (n,)
+    # rows that are not valid are nan
+    def getRefPointBatch(self, states, p, dt, reverse=False):
+        if reverse:
+            print_error("reverse is not implemented")
+        states = np.asarray(states,dtype=float).reshape(-1,6)
+        _,offset,_,_,_,u0,s0 = self.localTrajectoryBatch(states,wheelbase=0.102/2.0)
+        valid = np.logical_not(np.isnan(u0))
+        u0 = np.where(valid,u0,0.0)
+        s0 = np.where(valid,s0,0.0)
+        v0 = self.targetVfromU(u0)
+        der = np.array(splev(u0,self.raceline,der=1))
+        heading0 = np.arctan2(der[1],der[0])
+
+        s_vec,v_vec = self.projectAlongRaceline(s0,v0,p,dt)
+        coord_vec = np.array(splev(s_vec.flatten(),self.raceline_s)).T.reshape(len(states),p+1,2)
+        k_signed_vec = self.curvatureAtS(s_vec)
+        e_heading = ((states[:,2] - heading0) + pi/2.0 ) % (2*pi) - pi/2.0
+
+        invalid = np.logical_not(valid)
+        for val in (e_heading,v_vec,k_signed_vec,coord_vec):
+            val[invalid] = np.nan
+        return offset, e_heading, v_vec, k_signed_vec, coord_vec, valid
+
+    # same as getRefXYVheading for an (n,6) array of states
+    # Return:
+    # xy (n,p+1,2), v (n,p+1), heading (n,p+1), valid (n,)
+    # rows that are not valid are nan
+    def getRefXYVheadingBatch(self, states, p, dt, reverse=False):
+        if reverse:
+            print_error("reverse is not implemented")
+        states = np.asarray(states,dtype=float).reshape(-1,6)
+        _,_,_,_,_,u0,s0 = self.localTrajectoryBatch(states,wheelbase=0.102/2.0)
+        valid = np.logical_not(np.isnan(u0))
+        u0 = np.where(valid,u0,0.0)
+        s0 = np.where(valid,s0,0.0)
+        v0 = self.targetVfromU(u0)
+
+        s_vec,v_vec = self.projectAlongRaceline(s0,v0,p,dt)
+        xy_vec = np.array(splev(s_vec.flatten(),self.raceline_s)).T.reshape(len(states),p+1,2)
+        der = np.array(splev(s_vec.flatten(),self.raceline_s,der=1))
+        heading_vec = np.arctan2(der[1],der[0]).reshape(len(states),p+1)
+
+        invalid = np.logical_not(valid)
+        for val in (xy_vec,v_vec,heading_vec):
+            val[invalid] = np.nan
+        return xy_vec, v_vec, heading_vec, valid
+
     # predict an opponent car's future trajectory, assuming they are on ref raceline and will remain there, traveling at current speed
     # Inputs:
     # state: opponent vehicle state, same as in self.localTrajectory()
@@ -1429,7 +1507,7 @@ class RCPTrack(Track):
             # find ref velocity for projection ref points
             # TODO adjust ref velocity for current vehicle velocity
 
-            #v_k = self.sToV_lut(s_k%self.raceline_len_m)
+            #v_k = self.sToV(s_k%self.raceline_len_m)
             # NOTE assume constant velocity
             v_k = v0
             v_vec.append(v_k)
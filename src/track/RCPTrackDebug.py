@@ -2,14 +2,15 @@
 import numpy as np
 import os.path
 from numpy import isclose
-import matplotlib.pyplot as plt
+from util.lazyImport import lazyImport
+plt = lazyImport('matplotlib.pyplot')
 from math import atan2,radians,degrees,sin,cos,pi,tan,copysign,asin,acos,isnan
 from scipy.interpolate import splprep, splev,CubicSpline,interp1d
 from scipy.optimize import minimize_scalar,minimize,brentq
 from scipy.integrate import solve_ivp
 from time import sleep,time
-import cv2
-from PIL import Image
+cv2 = lazyImport('cv2')
+Image = lazyImport('PIL.Image')
 import pickle
 from bisect import bisect
 
@@ -1,8 +1,9 @@
 # a simulated skidpad
-import cv2
+from util.lazyImport import lazyImport
+cv2 = lazyImport('cv2')
 import numpy as np
 from math import cos,sin,pi,atan2,radians,degrees,tan
-import matplotlib.pyplot as plt
+plt = lazyImport('matplotlib.pyplot')
 
 from track.Track import Track
 #from track.car import Car
@@ -5,9 +5,15 @@ from common import *
 import numpy as np
 from scipy.interpolate import splprep, splev,CubicSpline,interp1d
 from math import radians,degrees,cos,sin,ceil,floor,atan,tan
-import cv2
+from util.lazyImport import lazyImport
+cv2 = lazyImport('cv2')
 import os.path
 import pickle
+from util.obstacleIndex import ObstacleIndex
+from util.obstacleField import poissonDisk,weightedSubset
+from util.racelineIndex import RacelineIndex
+from util.renderCache import layerKey,cachedLayer,composite
+from time import time
 class Track(ConfigObject):
     def __init__(self,main,config):
         self.main=main
@@ -21,6 +27,15 @@ class Track(ConfigObject):
         self.obstacle_count=0
         self.obstacle_filename=None
         self.obstacle_radius=None
+        # obstacle_filename ending in .npz gives an obstacle field on drivable area, see generateObstacleField()
+        # minimum distance between obstacle centers, 2*obstacle_radius if None
+        self.obstacle_spacing=None
+        # minimum distance from raceline to obstacle edge, None to allow obstacles on raceline
+        self.obstacle_raceline_clearance=None
+        # relative obstacle density in sectors of equal length along raceline, e.g. [1,0,2], None for uniform
+        self.obstacle_sector_density=None
+        # seed for generating obstacle field, main.seed if None
+        self.obstacle_seed=None
 
         # track dimension, in meters
         self.x_limit = None
@@ -64,17 +79,23 @@ class Track(ConfigObject):
     def isInObstacle(self, state):
         if (not self.obstacle):
             return (False,-1)
-        dist = self.obstacle_radius
-        x,y,heading,vf,vs,omega = state
-        min_dist = 100.0
-        for i in range(self.obstacles.shape[0]):
-            obs = self.obstacles[i]
-            dist = ((x-obs[0])**2+(y-obs[1])**2)**0.5 
-            if (dist<min_dist):
-                min_dist = dist
-            if (dist < self.obstacle_radius):
-                return (True,i)
-        return (False,-1)
+        obs_id,_ = self.obstacle_index.queryPoint(state[0],state[1])
+        return (obs_id >= 0,obs_id)
+
+    # same as isInObstacle for (n,6) states of all cars
+    # returns collision (n,), index of first obstacle in collision or -1 (n,),
+    # and clearance to nearest obstacle (n,), inf if there's none nearby, see util/obstacleIndex.py
+    def isInObstacleBatch(self, states):
+        states = np.asarray(states,dtype=float).reshape(-1,6)
+        if (not self.obstacle):
+            return np.zeros(len(states),dtype=bool),np.full(len(states),-1),np.full(len(states),np.inf)
+        obs_id,clearance = self.obstacle_index.query(states[:,0:2])
+        return obs_id >= 0,obs_id,clearance
+
+    # k nearest obstacles to coords (n,2), e.g. to pass only obstacles near a car to a controller
+    # returns index (n,k) and clearance (n,k), sorted by distance
+    def nearestObstacles(self, coords, k):
+        return self.obstacle_index.nearest(coords,k)
 
     # NOTE plotting related
     def m2canvas(self,coord):
@@ -89,7 +110,9 @@ class Track(ConfigObject):
         img = cv2.circle(img, src, radius_pix, color,-1)
         return img
 
-    def plotObstacles(self,img = None):
+    # static: draw all obstacles, False if they are already on img (background)
+    # and only obstacles in collision need to be drawn
+    def plotObstacles(self,img = None, static=True):
         if (not self.obstacle):
             return img
         if img is None:
@@ -98,13 +121,14 @@ class Track(ConfigObject):
             img = self.main.visualization.visualization_img
 
         # plot obstacles
-        for obs in self.obstacles:
-            img = self.drawCircle(img, obs, 0.1, color=(255,100,100))
-        for car in self.main.cars:
-            has_collided, obs_id = self.isInObstacle(car.states)
-            if (has_collided):
-                # plot obstacle in collision red
-                img = self.drawCircle(img, self.obstacles[obs_id], 0.1, color=(100,100,255))
+        if (static):
+            img = composite(img,self.layer('obstacles',img.shape))
+        states = np.array([car.states for car in self.main.cars])
+        has_collided, obs_id, _ = self.isInObstacleBatch(states)
+        for i in obs_id[has_collided]:
+            # plot obstacle in collision red
+            img = self.drawCircle(img, self.obstacles[i], 0.1, color=(100,100,255))
+            self.main.visualization.markDirtyCoords(self.obstacles[i],int(0.1*self.resolution)+1)
 
         '''
         text = "collision: %d"%(self.main.collision_checker.collision_count[car.id])
@@ -126,6 +150,55 @@ class Track(ConfigObject):
         else:
             return img
 
+    # NOTE cached rendering, see util/renderCache.py
+    # background with layers drawn in order, e.g. ('tiles','raceline','obstacles')
+    # returns a new image that can be drawn on
+    def renderTrack(self,layers=('tiles','raceline')):
+        img = np.zeros(self.canvasShape(),dtype='uint8')
+        for name in layers:
+            img = composite(img,self.layer(name,img.shape))
+        return img
+
+    # image and mask of layer name on a canvas of shape, drawn only if not cached
+    def layer(self,name,shape):
+        key = layerKey(type(self).__name__,name,shape,self.layerSource(name))
+        return cachedLayer(key,lambda: self.renderLayer(name,shape))
+
+    # shape of track image
+    def canvasShape(self):
+        return (int(self.resolution*self.y_limit),int(self.resolution*self.x_limit),3)
+
+    # everything layer name is drawn from, for cache key
+    # subclasses add their own layers
+    def layerSource(self,name):
+        if (name == 'obstacles'):
+            obstacles = self.obstacles if self.obstacle else None
+            return (obstacles,self.resolution,self.x_limit,self.y_limit)
+        elif (name == 'boundaries'):
+            if (not hasattr(self,'raceline_left_boundary')):
+                self.prepareDiscretizedRaceline()
+            return (self.raceline_points,self.raceline_headings,self.raceline_left_boundary,self.raceline_right_boundary,self.resolution,self.x_limit,self.y_limit)
+        raise ValueError("unknown track layer "+str(name))
+
+    # draw layer name on a blank canvas of shape, returns image and mask of drawn pixels
+    def renderLayer(self,name,shape):
+        img = np.zeros(shape,dtype='uint8')
+        if (name == 'obstacles'):
+            if (self.obstacle):
+                for obs in self.obstacles:
+                    img = self.drawCircle(img, obs, 0.1, color=(255,100,100))
+        elif (name == 'boundaries'):
+            coords = self.raceline_points.T
+            headings = self.raceline_headings
+            left = coords + self.raceline_left_boundary[:,np.newaxis]*np.column_stack([np.cos(headings+np.pi/2),np.sin(headings+np.pi/2)])
+            right = coords + self.raceline_right_boundary[:,np.newaxis]*np.column_stack([np.cos(headings-np.pi/2),np.sin(headings-np.pi/2)])
+            img = self.drawPolyline(left,lineColor=(0,255,0),img=img)
+            img = self.drawPolyline(right,lineColor=(0,0,255),img=img)
+        else:
+            raise ValueError("unknown track layer "+str(name))
+        # layers are drawn in colors other than black, so drawn pixels are the nonzero ones
+        return img,np.any(img > 0,axis=2)
+
     # draw a polynomial line defined in track space
     # points: a list of coordinates in format (x,y)
     def drawPolyline(self,points,img=None,lineColor=(0,0,255),thickness=3 ):
@@ -166,6 +239,14 @@ class Track(ConfigObject):
             self.obstacle_count = 0
             return
         filename = os.path.join(self.main.basedir,self.obstacle_filename)
+        if (filename.endswith('.npz')):
+            if ((self.obstacle_raceline_clearance is not None or self.obstacle_sector_density is not None)
+                    and not hasattr(self,'raceline_s')):
+                self.print_error(f"obstacle_raceline_clearance and obstacle_sector_density need a raceline, {type(self).__name__} has none")
+            self.obstacles = self.loadObstacleField(filename)
+            self.obstacle_count = self.obstacles.shape[0]
+            self.obstacle_index = ObstacleIndex(self.obstacles,self.obstacle_radius)
+            return
 
         if (os.path.isfile(filename)):
             with open(filename, 'rb') as f:
@@ -187,11 +268,77 @@ class Track(ConfigObject):
         obstacles[:,1] *= self.y_limit
 
         self.obstacles = obstacles
+        self.obstacle_index = ObstacleIndex(obstacles,self.obstacle_radius)
 
 
 
 
 
+    # obstacle field saved as .npz with the seed it's generated from, in meters
+    # generated and saved if filename doesn't exist
+    def loadObstacleField(self,filename):
+        if (os.path.isfile(filename)):
+            with np.load(filename) as data:
+                obstacles = data['obstacles']
+                seed = int(str(data['seed']))
+            self.print_ok(f"loading obstacles at {filename}, count = {obstacles.shape[0]}, seed = {seed}")
+            self.print_ok(" if you wish to create new obstacles, remove current obstacle file or change parameter obstacle_filename")
+            return obstacles
+
+        seed = self.obstacle_seed
+        if (seed is None):
+            seed = getattr(self.main,'seed',None)
+        if (seed is None):
+            seed = np.random.SeedSequence().entropy
+        t0 = time()
+        obstacles = self.generateObstacleField(np.random.default_rng(seed))
+        self.print_ok(f"generated {obstacles.shape[0]} obstacles in {time()-t0:.2f}s, seed = {seed}")
+        # seed as text, entropy from SeedSequence doesn't fit in int64
+        np.savez(filename,obstacles=obstacles,seed=str(seed),radius=self.obstacle_radius)
+        self.print_ok(f"saved obstacles at {filename}")
+        return obstacles
+
+    # obstacle_count obstacles on drivable area, at least obstacle_spacing apart and
+    # obstacle_raceline_clearance away from raceline, by density of raceline sectors
+    # see util/obstacleField.py
+    def generateObstacleField(self,rng):
+        spacing = self.obstacle_spacing
+        if (spacing is None):
+            spacing = 2*self.obstacle_radius
+        candidates = poissonDisk((0,0,self.x_limit,self.y_limit),spacing,rng,self.drivableArea)
+
+        # any subset of candidates keeps the spacing, so raceline clearance and
+        # sector density are applied once, as weights for picking obstacles
+        weight = np.ones(candidates.shape[0])
+        if (self.obstacle_raceline_clearance is not None or self.obstacle_sector_density is not None):
+            s,dist = self.racelineProjection(candidates)
+        if (self.obstacle_raceline_clearance is not None):
+            weight[np.logical_not(dist - self.obstacle_radius >= self.obstacle_raceline_clearance)] = 0
+        if (self.obstacle_sector_density is not None):
+            density = np.array(self.obstacle_sector_density,dtype=float)
+            sector = (np.nan_to_num(s)/self.raceline_len_m*len(density)).astype(int)
+            weight *= density[np.clip(sector,0,len(density)-1)]
+        index = weightedSubset(weight,self.obstacle_count,rng)
+        if (len(index) < self.obstacle_count):
+            self.print_warning(f"only {len(index)} obstacles fit with spacing {spacing}, {self.obstacle_count} requested")
+        return candidates[index]
+
+    # where generated obstacles may be placed, coords (n,2), returns bool (n,)
+    # subclasses restrict this to track surface
+    def drivableArea(self,coords):
+        coords = np.asarray(coords,dtype=float).reshape(-1,2)
+        return (coords[:,0] >= 0) & (coords[:,0] <= self.x_limit) & (coords[:,1] >= 0) & (coords[:,1] <= self.y_limit)
+
+    # distance along raceline s (n,) and distance to raceline (n,) of coords (n,2)
+    # closest point on raceline_s sampled every spacing meters, nan outside track area
+    # subclasses may restrict which part of raceline a coord can be matched to
+    def racelineProjection(self,coords,spacing=0.004):
+        n = int(np.ceil(self.raceline_len_m/spacing))
+        ss = np.linspace(0,self.raceline_len_m,n,endpoint=False)
+        points = np.array(splev(ss,self.raceline_s)).T
+        index = RacelineIndex(points,ss,self.raceline_len_m,(0,0,self.x_limit,self.y_limit))
+        s,_,dist = index.query(coords)
+        return s,dist
 
     # NOTE others
     def prepareDiscretizedRaceline(self):
@@ -224,43 +371,13 @@ class Track(ConfigObject):
     def createBoundary(self,show=False):
         # construct a (self.discretized_raceline_len * 2) vector
         # to record the left and right track boundary as an offset to the discretized raceline
-        left_boundary = []
-        right_boundary = []
-
-        left_boundary_points = []
-        right_boundary_points = []
-
-        for i in range(self.discretized_raceline_len):
-            # find normal direction
-            coord = self.raceline_points[:,i]
-            heading = self.raceline_headings[i]
-
-            left, right = self.preciseTrackBoundary(coord,heading)
-            left_boundary.append(left)
-            right_boundary.append(right)
-
-            # debug boundary points
-            left_point = (coord[0] + left * cos(heading+np.pi/2),coord[1] + left * sin(heading+np.pi/2))
-            right_point = (coord[0] + right * cos(heading-np.pi/2),coord[1] + right * sin(heading-np.pi/2))
-
-            left_boundary_points.append(left_point)
-            right_boundary_points.append(right_point)
-
-
-            # DEBUG
-            # plot left/right boundary
-            '''
-            left_point = (coord[0] + left * cos(heading+np.pi/2),coord[1] + left * sin(heading+np.pi/2))
-            right_point = (coord[0] + right * cos(heading-np.pi/2),coord[1] + right * sin(heading-np.pi/2))
-            img = self.drawTrack()
-            img = self.drawRaceline(img = img)
-            img = self.drawPoint(img,coord,color=(0,0,0))
-            img = self.drawPoint(img,left_point,color=(0,0,0))
-            img = self.drawPoint(img,right_point,color=(0,0,0))
-            plt.imshow(img)
-            plt.show()
-            '''
+        coords = self.raceline_points.T
+        headings = np.array(self.raceline_headings)
+        left_boundary, right_boundary = self.preciseTrackBoundaryBatch(coords,headings)
 
+        # debug boundary points
+        left_boundary_points = coords + left_boundary[:,np.newaxis]*np.column_stack([np.cos(headings+np.pi/2),np.sin(headings+np.pi/2)])
+        right_boundary_points = coords + right_boundary[:,np.newaxis]*np.column_stack([np.cos(headings-np.pi/2),np.sin(headings-np.pi/2)])
 
         self.raceline_left_boundary = left_boundary
         self.raceline_right_boundary = right_boundary
@@ -1,6 +1,11 @@
-from track.EmptyTrack import EmptyTrack
-from track.RCPTrack import RCPTrack
-from track.Skidpad import Skidpad
-from track.TrackFactory import TrackFactory
-from track.OrcaTrack import OrcaTrack
-from track.RCPTrackDebug import RCPTrackDebug
+# tracks are imported on first access (e.g. from track import TrackFactory)
+from util.lazyImport import lazyPackage
+
+lazyPackage(__name__,{
+    'EmptyTrack' : 'track.EmptyTrack',
+    'RCPTrack' : 'track.RCPTrack',
+    'Skidpad' : 'track.Skidpad',
+    'TrackFactory' : 'track.TrackFactory',
+    'OrcaTrack' : 'track.OrcaTrack',
+    'RCPTrackDebug' : 'track.RCPTrackDebug',
+})
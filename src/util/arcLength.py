@@ -0,0 +1,62 @@
+# arc length of a parametric spline (splprep tck) and uniform grid lookup tables
+# for mapping between spline parameter u, distance along curve s and values along curve
+#
+# each knot span is split into equal pieces no longer than du, arc length of each
+# piece is integrated with Gauss-Legendre quadrature of |r'(u)|, with one splev call
+# for all nodes. within a knot span the spline is a polynomial so this converges fast
+import numpy as np
+from scipy.interpolate import splev
+
+# u and arc length s (from u0) at sample points covering [u0,u1]
+# returns uu (m,) and ss (m,), uu[0] = u0, uu[-1] = u1, both increasing
+def arcLength(tck,u0,u1,du=0.01,order=5):
+    knots = np.asarray(tck[0])
+    knots = knots[(knots > u0) & (knots < u1)]
+    breaks = np.unique(np.concatenate([[u0],knots,[u1]]))
+    pieces = np.maximum(np.ceil(np.diff(breaks)/du).astype(int),1)
+    # split each span into equal pieces
+    span = np.repeat(np.arange(len(pieces)),pieces)
+    index = np.arange(pieces.sum()) - np.repeat(np.cumsum(pieces)-pieces,pieces)
+    width = np.diff(breaks)[span]/pieces[span]
+    uu = np.append(breaks[span] + index*width, u1)
+
+    nodes,weights = np.polynomial.legendre.leggauss(order)
+    center = 0.5*(uu[:-1]+uu[1:])
+    half = 0.5*np.diff(uu)
+    u_nodes = (center[:,np.newaxis] + half[:,np.newaxis]*nodes).flatten()
+    der = np.array(splev(u_nodes,tck,der=1))
+    speed = np.linalg.norm(der,axis=0).reshape(-1,order)
+    ds = half*np.sum(speed*weights,axis=1)
+    ss = np.concatenate([[0],np.cumsum(ds)])
+    return uu,ss
+
+# lookup table on a uniform grid, linear interpolation between entries
+# the entry is found by index arithmetic instead of a search, O(1) per query
+# queries outside grid are extrapolated from first/last interval
+class UniformLut:
+    # values (n+1,) at x0, x0+dx, ..., x0+n*dx
+    def __init__(self,x0,dx,values):
+        self.x0 = float(x0)
+        self.dx = float(dx)
+        self.inv_dx = 1.0/self.dx
+        self.values = np.asarray(values,dtype=float)
+        self.values_list = self.values.tolist()
+        self.n = len(self.values) - 1
+
+    # resample (x,y), x increasing, to a uniform grid of n intervals over [x[0],x[-1]]
+    @classmethod
+    def fromSamples(cls,x,y,n):
+        grid = np.linspace(x[0],x[-1],n+1)
+        return cls(x[0],(x[-1]-x[0])/n,np.interp(grid,x,y))
+
+    def __call__(self,x):
+        # plain float arithmetic for scalars, called in per step loops
+        if (np.ndim(x) == 0):
+            t = (float(x)-self.x0)*self.inv_dx
+            i = min(max(int(t),0),self.n-1)
+            w = t - i
+            return np.float64(self.values_list[i]*(1.0-w) + self.values_list[i+1]*w)
+        t = (np.asarray(x,dtype=float)-self.x0)*self.inv_dx
+        i = np.clip(t.astype(int),0,self.n-1)
+        w = t - i
+        return self.values[i]*(1.0-w) + self.values[i+1]*w
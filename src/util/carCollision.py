@@ -0,0 +1,102 @@
+# car to car collision for simulators
+# cars are oriented rectangles centered at (x,y), length along heading
+# broad phase: sort and sweep along x with bounding circles, O(n log n + pairs)
+# narrow phase: separating axis test on candidate pairs, vectorized
+import numpy as np
+
+# corners of each car, (n,4,2), in order around the rectangle
+def carCorners(xy,heading,length,width):
+    forward = np.stack([np.cos(heading),np.sin(heading)],axis=1)
+    left = np.stack([-np.sin(heading),np.cos(heading)],axis=1)
+    half_l = (0.5*length)[:,np.newaxis]*forward
+    half_w = (0.5*width)[:,np.newaxis]*left
+    return np.stack([xy+half_l+half_w, xy-half_l+half_w, xy-half_l-half_w, xy+half_l-half_w],axis=1)
+
+# pairs (a,b), a != b, whose bounding circles overlap
+# group: if given, only cars in same group can collide
+def candidatePairs(xy,radius,group=None):
+    n = xy.shape[0]
+    if (n < 2):
+        return np.zeros(0,dtype=int),np.zeros(0,dtype=int)
+    order = np.argsort(xy[:,0])
+    xs = xy[order,0]
+    # in sorted order, car k can only overlap cars k+1 .. end[k]-1
+    end = np.searchsorted(xs,xs+2*radius.max(),side='right')
+    counts = end - np.arange(n) - 1
+    total = counts.sum()
+    if (total == 0):
+        return np.zeros(0,dtype=int),np.zeros(0,dtype=int)
+    first = np.repeat(np.arange(n),counts)
+    offset = np.arange(total) - np.repeat(np.cumsum(counts)-counts,counts)
+    a = order[first]
+    b = order[first+1+offset]
+    mask = np.sum((xy[a]-xy[b])**2,axis=1) <= (radius[a]+radius[b])**2
+    if (group is not None):
+        mask &= group[a] == group[b]
+    return a[mask],b[mask]
+
+# separating axis test for pairs of rectangles
+# returns whether each pair overlaps, penetration depth and unit normal pointing from a to b
+def rectangleContacts(corners_a,corners_b):
+    # two edge directions of each rectangle, (m,4,2)
+    axes = np.stack([corners_a[:,0]-corners_a[:,1], corners_a[:,0]-corners_a[:,3],
+            corners_b[:,0]-corners_b[:,1], corners_b[:,0]-corners_b[:,3]],axis=1)
+    axes /= np.linalg.norm(axes,axis=2)[:,:,np.newaxis]
+    # projections of corners on axes, (m,4 axes,4 corners)
+    proj_a = np.einsum('mkd,mcd->mkc',axes,corners_a)
+    proj_b = np.einsum('mkd,mcd->mkc',axes,corners_b)
+    overlap = np.minimum(proj_a.max(axis=2),proj_b.max(axis=2)) - np.maximum(proj_a.min(axis=2),proj_b.min(axis=2))
+    in_contact = np.all(overlap > 0,axis=1)
+    axis_index = np.argmin(overlap,axis=1)
+    depth = overlap[np.arange(len(overlap)),axis_index]
+    normal = axes[np.arange(len(overlap)),axis_index]
+    # orient normal from a to b
+    center_diff = corners_b.mean(axis=1) - corners_a.mean(axis=1)
+    normal *= np.where(np.sum(normal*center_diff,axis=1) < 0,-1.0,1.0)[:,np.newaxis]
+    return in_contact,depth,normal
+
+# contacts among n cars, states (n,6) x,y,heading,v_forward,v_sideway,omega
+# returns pairs (a,b) in contact with penetration depth and normal
+def findContacts(states,length,width,group=None):
+    xy = states[:,0:2]
+    radius = 0.5*np.sqrt(length**2+width**2)
+    a,b = candidatePairs(xy,radius,group)
+    if (len(a) == 0):
+        return a,b,np.zeros(0),np.zeros((0,2))
+    corners = carCorners(xy,states[:,2],length,width)
+    in_contact,depth,normal = rectangleContacts(corners[a],corners[b])
+    return a[in_contact],b[in_contact],depth[in_contact],normal[in_contact]
+
+# separate cars in contact and apply response, modifies states in place
+# 'impulse': equal mass impulse along contact normal with restitution
+# 'slowdown': forward speed of cars in contact is scaled by speed_factor
+def resolveContacts(states,a,b,depth,normal,response='impulse',restitution=0.3,speed_factor=0.5):
+    if (len(a) == 0):
+        return
+    n = states.shape[0]
+    # push cars apart, half the penetration each
+    shift = np.zeros((n,2))
+    np.add.at(shift,a,-0.5*depth[:,np.newaxis]*normal)
+    np.add.at(shift,b,0.5*depth[:,np.newaxis]*normal)
+    states[:,0:2] += shift
+
+    if (response == 'slowdown'):
+        involved = np.unique(np.concatenate([a,b]))
+        states[involved,3:5] *= speed_factor
+        return
+
+    # body frame velocity to world frame
+    cos_heading = np.cos(states[:,2])
+    sin_heading = np.sin(states[:,2])
+    vx = states[:,3]*cos_heading - states[:,4]*sin_heading
+    vy = states[:,3]*sin_heading + states[:,4]*cos_heading
+    # relative velocity of b w.r.t. a along normal, negative when approaching
+    vn = (vx[b]-vx[a])*normal[:,0] + (vy[b]-vy[a])*normal[:,1]
+    impulse = np.where(vn < 0, -(1+restitution)*vn/2, 0.0)
+    dv = np.zeros((n,2))
+    np.add.at(dv,a,-impulse[:,np.newaxis]*normal)
+    np.add.at(dv,b,impulse[:,np.newaxis]*normal)
+    vx += dv[:,0]
+    vy += dv[:,1]
+    states[:,3] = vx*cos_heading + vy*sin_heading
+    states[:,4] = -vx*sin_heading + vy*cos_heading
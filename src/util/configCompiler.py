@@ -0,0 +1,202 @@
+# compile an experiment config (configs/*.xml) into a pre-evaluated config tree
+# and cache it on disk, keyed by hash of the xml file
+#
+# compiling parses the xml, evaluates every attribute string once and resolves
+# class names (extension, hardware, controller, planner) to class references
+# the result is pickled under __cache__/ next to the xml file, later runs
+# of the same (unchanged) config load the pickle directly
+#
+# the compiled tree mimics the part of minidom API used in this codebase
+# (getElementsByTagName, getAttribute, attributes.items(), firstChild.nodeValue)
+# so existing code that walks config nodes keeps working,
+# evaluated values are available in node.evaluated, resolved classes in node.cls
+#
+# usage: python util/configCompiler.py stanley cvar ...
+# compiles configs/<name>.xml and reports startup time with and without cache
+import os
+import sys
+sys.path.insert(1, os.path.join(sys.path[0], '..'))
+import common
+from common import *
+import math
+import hashlib
+import importlib
+import pickle
+from glob import glob
+from time import time
+from xml.dom import minidom
+
+# bump this when ConfigNode or compile rules change to invalidate old caches
+COMPILER_VERSION = 1
+
+# attribute strings are evaluated in the same namespace as the code that used to eval them
+# ConfigObject (track, controller, planner) evals in common.py
+_common_namespace = dict(vars(common))
+# run.py and Car.py (settings, extensions, init_states) also have math functions
+_main_namespace = dict(_common_namespace)
+_main_namespace.update({key:value for key,value in vars(math).items() if not key.startswith('_')})
+
+# tag -> package to import class from, the text of such node is a class name
+_class_packages = {'extension':'extension', 'hardware':'car', 'type':'controller', 'planner':'planner'}
+
+class ConfigText:
+    def __init__(self,text):
+        self.nodeValue = text
+
+class ConfigNode:
+    def __init__(self,tag,text):
+        self.tagName = tag
+        # same as minidom: text of first child, None if first child is an element
+        self.firstChild = None if text is False else ConfigText(text)
+        # raw attribute text
+        self.attributes = {}
+        # evaluated attribute values
+        self.evaluated = {}
+        # evaluated text for value nodes (init_states, experiment_type)
+        self.value = None
+        # resolved class for nodes that name a class (extension, hardware, type, planner)
+        self.cls = None
+        self.childNodes = []
+
+    # all descendants with tag name, in document order
+    def getElementsByTagName(self,name):
+        retval = []
+        for child in self.childNodes:
+            if (child.tagName == name):
+                retval.append(child)
+            retval += child.getElementsByTagName(name)
+        return retval
+
+    def getAttribute(self,name):
+        return self.attributes.get(name,'')
+
+# evaluate an attribute string, keep raw text if it isn't a python expression
+def evalText(text,namespace):
+    try:
+        return eval(text,namespace)
+    except NameError:
+        return text
+
+def _convert(dom_node,namespace):
+    if (dom_node.firstChild is None):
+        text = False
+    else:
+        text = dom_node.firstChild.nodeValue
+    node = ConfigNode(dom_node.tagName,text)
+    for key,value_text in dom_node.attributes.items():
+        node.attributes[key] = value_text
+        node.evaluated[key] = evalText(value_text,namespace)
+    for dom_child in dom_node.childNodes:
+        if (dom_child.nodeType == dom_child.ELEMENT_NODE):
+            node.childNodes.append(_convert(dom_child,namespace))
+    return node
+
+def _text(node):
+    if (node.firstChild is None or node.firstChild.nodeValue is None):
+        return ''
+    return node.firstChild.nodeValue.strip()
+
+def _resolveClass(node,package):
+    name = _text(node)
+    try:
+        node.cls = getattr(importlib.import_module(package),name)
+    except AttributeError:
+        print_error("%s: unknown class %s in package %s"%(node.tagName,name,package))
+
+# parse xml and evaluate attributes, resolve classes and check required fields
+def compileConfig(config_filename):
+    dom = minidom.parse(config_filename)
+    root = ConfigNode('#document',False)
+    for dom_child in dom.childNodes:
+        if (dom_child.nodeType == dom_child.ELEMENT_NODE):
+            root.childNodes.append(_convert(dom_child,_common_namespace))
+
+    # settings, these used to be evaluated strictly in run.py
+    try:
+        config_settings = root.getElementsByTagName('settings')[0]
+    except IndexError:
+        print_error(config_filename+": missing <settings>")
+    for key,value_text in config_settings.attributes.items():
+        config_settings.evaluated[key] = eval(value_text,_main_namespace)
+    if ('dt' not in config_settings.evaluated):
+        print_error(config_filename+": missing dt in <settings>")
+    try:
+        config_experiment_type = config_settings.getElementsByTagName('experiment_type')[0]
+        config_experiment_type.value = ExperimentType[_text(config_experiment_type)]
+    except (IndexError,KeyError):
+        print_error(config_filename+": missing or unknown <experiment_type>, use one in "+str([item.name for item in ExperimentType]))
+
+    for tag in ['track','extensions','cars']:
+        if (len(root.getElementsByTagName(tag)) == 0):
+            print_error(config_filename+": missing <%s>"%(tag))
+
+    config_extensions = root.getElementsByTagName('extensions')[0]
+    for config_extension in config_extensions.getElementsByTagName('extension'):
+        for key,value_text in config_extension.attributes.items():
+            config_extension.evaluated[key] = evalText(value_text,_main_namespace)
+        _resolveClass(config_extension,_class_packages['extension'])
+
+    config_cars = root.getElementsByTagName('cars')[0]
+    for config_car in config_cars.getElementsByTagName('car'):
+        for tag in ['hardware','controller','config_name']:
+            if (len(config_car.getElementsByTagName(tag)) == 0):
+                print_error(config_filename+": car missing <%s>"%(tag))
+        config_init_states = config_car.getElementsByTagName('init_states')
+        if (len(config_init_states) > 0):
+            config_init_states[0].value = eval(_text(config_init_states[0]),_main_namespace)
+        _resolveClass(config_car.getElementsByTagName('hardware')[0],_class_packages['hardware'])
+        config_controller = config_car.getElementsByTagName('controller')[0]
+        try:
+            _resolveClass(config_controller.getElementsByTagName('type')[0],_class_packages['type'])
+        except IndexError:
+            print_error(config_filename+": controller missing <type>")
+        for config_planner in config_controller.getElementsByTagName('planner'):
+            _resolveClass(config_planner,_class_packages['planner'])
+    return root
+
+def cacheFilename(config_filename):
+    with open(config_filename,'rb') as f:
+        digest = hashlib.sha1(str(COMPILER_VERSION).encode()+f.read()).hexdigest()
+    folder = os.path.join(os.path.dirname(os.path.abspath(config_filename)),'__cache__')
+    name = os.path.splitext(os.path.basename(config_filename))[0]
+    return os.path.join(folder,name+'-'+digest[:16]+'.p')
+
+# return compiled config tree and whether it's loaded from cache
+def loadConfig(config_filename):
+    cache_filename = cacheFilename(config_filename)
+    if (os.path.isfile(cache_filename)):
+        try:
+            with open(cache_filename,'rb') as f:
+                return pickle.load(f),True
+        except (pickle.UnpicklingError,EOFError,AttributeError,ImportError):
+            print_warning("corrupted config cache "+cache_filename+", recompiling")
+
+    config = compileConfig(config_filename)
+
+    folder = os.path.dirname(cache_filename)
+    os.makedirs(folder,exist_ok=True)
+    # remove caches of earlier versions of this config
+    prefix = cache_filename.rsplit('-',1)[0]
+    for old_filename in glob(prefix+'-*.p'):
+        os.remove(old_filename)
+    # write to a temporary file first so parallel runs never see a partial cache
+    tmp_filename = cache_filename+'.%d.tmp'%(os.getpid())
+    with open(tmp_filename,'wb') as f:
+        pickle.dump(config,f)
+    os.replace(tmp_filename,cache_filename)
+    return config,False
+
+if __name__ == '__main__':
+    if (len(sys.argv) < 2):
+        print_error("you must specify at least one config name under configs/")
+    for name in sys.argv[1:]:
+        config_filename = os.path.join(os.path.dirname(sys.argv[0]),'../configs',name+'.xml')
+        # warm up imports and cache so only parsing/evaluation is compared
+        loadConfig(config_filename)
+        t0 = time()
+        compileConfig(config_filename)
+        compile_time = time()-t0
+        t0 = time()
+        loadConfig(config_filename)
+        load_time = time()-t0
+        print_info("%s: compile %.2f ms, load from cache %.2f ms, saved %.2f ms per run"%(name,compile_time*1e3,load_time*1e3,(compile_time-load_time)*1e3))
@@ -0,0 +1,33 @@
+# helpers for ensemble experiments
+# with <settings ensemble_size='100'> every car in config is simulated ensemble_size times
+# as independent copies (same controller, different noise and initial state perturbation)
+# car.ensemble_source is the index of the config car a copy is made from,
+# car.ensemble_member is the index of the copy, 0 being the unperturbed one
+import numpy as np
+
+# group values (one per car) by config car, returns a list with one list per config car
+def groupByEnsemble(cars,values):
+    groups = {}
+    for car,value in zip(cars,values):
+        groups.setdefault(car.ensemble_source,[]).append(value)
+    return [groups[key] for key in sorted(groups)]
+
+# summary statistics of samples, nan samples are ignored
+def distribution(samples):
+    samples = np.array(samples,dtype=float).flatten()
+    samples = samples[np.logical_not(np.isnan(samples))]
+    if (len(samples) == 0):
+        return {'count':0}
+    return {'count':len(samples),
+            'mean':float(np.mean(samples)),
+            'stddev':float(np.std(samples)),
+            'min':float(np.min(samples)),
+            'p5':float(np.percentile(samples,5)),
+            'p50':float(np.percentile(samples,50)),
+            'p95':float(np.percentile(samples,95)),
+            'max':float(np.max(samples))}
+
+def formatDistribution(dist):
+    if (dist['count'] == 0):
+        return "no samples"
+    return "n = %d, mean %.4f, stddev %.4f, p5 %.4f, p50 %.4f, p95 %.4f"%(dist['count'],dist['mean'],dist['stddev'],dist['p5'],dist['p50'],dist['p95'])
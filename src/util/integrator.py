@@ -0,0 +1,135 @@
+# numerical integrators shared by simulators
+# rhs(states) returns d(states)/dt for an (n,state_dim) array of n cars
+# project(states), if given, is applied after every step to enforce algebraic
+# relations that are not integrated (e.g. kinematic model at low speed)
+#
+# usage: python util/integrator.py
+# compares accuracy and cost of each scheme on DynamicSimulator
+import numpy as np
+
+def eulerStep(rhs,states,dt):
+    return states + dt*rhs(states)
+
+def rk4Step(rhs,states,dt):
+    k1 = rhs(states)
+    k2 = rhs(states + 0.5*dt*k1)
+    k3 = rhs(states + 0.5*dt*k2)
+    k4 = rhs(states + dt*k3)
+    return states + dt/6.0*(k1 + 2*k2 + 2*k3 + k4)
+
+# fixed step integration of dt in substeps steps
+def integrateFixed(step,rhs,states,dt,substeps=1,project=None):
+    h = dt/substeps
+    for i in range(substeps):
+        states = step(rhs,states,h)
+        if (project is not None):
+            states = project(states)
+    return states
+
+# error controlled integration with Bogacki-Shampine 3(2) pair
+# all cars share one step size, the largest error among them controls the step
+# last step size is kept so next call starts from a step that worked
+class AdaptiveIntegrator:
+    def __init__(self,rtol=1e-4,atol=1e-6,max_steps=1000):
+        self.rtol = rtol
+        self.atol = atol
+        self.max_steps = max_steps
+        self.h = None
+        # number of rhs evaluations, for benchmarking
+        self.evaluations = 0
+        self.rejected = 0
+
+    def integrate(self,rhs,states,dt,project=None):
+        t = 0.0
+        h = dt if self.h is None else min(self.h,dt)
+        k1 = rhs(states)
+        self.evaluations += 1
+        steps = 0
+        while (t < dt*(1-1e-9)):
+            steps += 1
+            if (steps > self.max_steps):
+                raise RuntimeError("AdaptiveIntegrator: max_steps exceeded")
+            h = min(h,dt-t)
+            k2 = rhs(states + 0.5*h*k1)
+            k3 = rhs(states + 0.75*h*k2)
+            new_states = states + h*(2.0/9*k1 + 1.0/3*k2 + 4.0/9*k3)
+            k4 = rhs(new_states)
+            self.evaluations += 3
+            # difference between 3rd and 2nd order solution
+            error = h*(-5.0/72*k1 + 1.0/12*k2 + 1.0/9*k3 - 1.0/8*k4)
+            scale = self.atol + self.rtol*np.maximum(np.abs(states),np.abs(new_states))
+            error_norm = np.max(np.abs(error)/scale)
+            if (error_norm <= 1.0):
+                t += h
+                if (project is not None):
+                    new_states = project(new_states)
+                    k4 = rhs(new_states)
+                    self.evaluations += 1
+                states = new_states
+                # first same as last
+                k1 = k4
+            else:
+                self.rejected += 1
+            # step size for 3rd order method
+            factor = 5.0 if error_norm == 0 else 0.9*error_norm**(-1.0/3)
+            h = h*min(5.0,max(0.2,factor))
+        self.h = h
+        return states
+
+# integrate with scheme selected by name
+# 'euler' and 'rk4' take substeps fixed steps, 'adaptive' uses adaptive
+def integrate(method,rhs,states,dt,substeps=1,project=None,adaptive=None):
+    if (method == 'euler'):
+        return integrateFixed(eulerStep,rhs,states,dt,substeps,project)
+    elif (method == 'rk4'):
+        return integrateFixed(rk4Step,rhs,states,dt,substeps,project)
+    elif (method == 'adaptive'):
+        return adaptive.integrate(rhs,states,dt,project)
+    raise ValueError("unknown integrator "+str(method))
+
+if __name__ == '__main__':
+    import os
+    import sys
+    sys.path.insert(1, os.path.join(sys.path[0], '..'))
+    from time import perf_counter
+    from extension.simulator.DynamicSimulator import DynamicSimulator
+
+    # car parameters from car/Offboard.py
+    L = 0.09
+    n = 1
+    lf = np.full(n,0.04824)
+    lr = L - lf
+    m = np.full(n,0.1667)
+    Iz = np.full(n,417757e-9)
+    duration = 2.0
+    x0 = np.array([[0.0,0.0,0.0,1.0,0.0,0.0]])
+
+    # constant throttle, steering sweeping left and right
+    def control(t):
+        return np.array([[0.6,0.4*np.sin(2*np.pi*t)]])
+
+    def simulate(method,dt,substeps=1):
+        adaptive = AdaptiveIntegrator()
+        states = x0.copy()
+        t0 = perf_counter()
+        for k in range(int(round(duration/dt))):
+            controls = control(k*dt)
+            if (method == 'discrete'):
+                # existing discrete update of DynamicSimulator
+                for i in range(substeps):
+                    states = DynamicSimulator.advanceDynamicsBatch(states,controls,lf,lr,m,Iz,dt/substeps)
+            else:
+                rhs = lambda s: DynamicSimulator.derivativesBatch(s,controls,lf,lr,m,Iz)
+                project = lambda s: DynamicSimulator.projectKinematic(s,controls,lf,lr)
+                states = integrate(method,rhs,states,dt,substeps,project,adaptive)
+        return states,perf_counter()-t0
+
+    print('%-22s %8s %12s %12s'%('scheme','dt(ms)','pos err(m)','time(ms)'))
+    for dt in [0.01,0.03]:
+        # control is held for dt, so reference is computed for each dt
+        reference,_ = simulate('rk4',dt,substeps=int(round(dt/1e-4)))
+        for method,substeps in [('discrete',1),('discrete',10),('euler',1),('euler',10),('rk4',1),('rk4',3),('adaptive',1)]:
+            states,cost = simulate(method,dt,substeps)
+            error = np.linalg.norm(states[0,:2]-reference[0,:2])
+            name = method if substeps == 1 else method+' x%d'%(substeps)
+            print('%-22s %8.0f %12.2e %12.1f'%(name,dt*1e3,error,cost*1e3))
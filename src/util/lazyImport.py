@@ -0,0 +1,126 @@
+# lazy import of heavy optional backends (cv2, matplotlib, PIL, serial ...)
+# cv2 = lazyImport('cv2') returns a placeholder, the actual module is imported
+# the first time an attribute is accessed, so a headless simulation that never
+# draws anything never pays for importing cv2 or matplotlib
+#
+# also contains a simple import profiler used by run.py --profile-startup
+import sys
+import types
+import importlib
+import importlib.abc
+from time import perf_counter
+
+class LazyModule:
+    def __init__(self,name):
+        self.__dict__['_name'] = name
+        self.__dict__['_module'] = None
+
+    def _load(self):
+        module = self.__dict__['_module']
+        if module is None:
+            module = importlib.import_module(self.__dict__['_name'])
+            self.__dict__['_module'] = module
+        return module
+
+    def __getattr__(self,attr):
+        return getattr(self._load(),attr)
+
+    def __setattr__(self,attr,value):
+        setattr(self._load(),attr,value)
+
+    def __repr__(self):
+        if self.__dict__['_module'] is None:
+            return "<lazy module '%s' (not loaded)>"%(self.__dict__['_name'])
+        return repr(self.__dict__['_module'])
+
+def lazyImport(name):
+    # no need for a placeholder if it's already imported
+    if name in sys.modules:
+        return sys.modules[name]
+    return LazyModule(name)
+
+# package whose members (class X in submodule package.X) are imported on first access
+# the import system binds package.X to the submodule when it's imported,
+# here it's bound to the class of the same name instead, same as an eager
+# from package.X import X in __init__.py would do
+class _LazyPackage(types.ModuleType):
+    def __getattr__(self,name):
+        members = self.__dict__['_lazy_members']
+        if name not in members:
+            raise AttributeError("module '%s' has no attribute '%s'"%(self.__name__,name))
+        value = getattr(importlib.import_module(members[name]),name)
+        setattr(self,name,value)
+        return value
+
+    def __setattr__(self,name,value):
+        if isinstance(value,types.ModuleType) and name in self.__dict__.get('_lazy_members',{}):
+            value = getattr(value,name,value)
+        super().__setattr__(name,value)
+
+    def __dir__(self):
+        return list(self.__dict__.keys()) + list(self.__dict__['_lazy_members'].keys())
+
+# call in a package's __init__.py, members: name -> module that defines it
+def lazyPackage(package_name,members):
+    package = sys.modules[package_name]
+    package.__class__ = _LazyPackage
+    package.__dict__['_lazy_members'] = members
+
+# --- import profiler ---
+# module name -> (inclusive time, self time), in seconds
+import_times = {}
+_stack = []
+
+class _TimedLoader(importlib.abc.Loader):
+    def __init__(self,name,loader):
+        self.name = name
+        self.loader = loader
+
+    def create_module(self,spec):
+        return self._timed(self.loader.create_module,spec)
+
+    def exec_module(self,module):
+        return self._timed(self.loader.exec_module,module)
+
+    def _timed(self,fun,arg):
+        _stack.append(0.0)
+        t0 = perf_counter()
+        try:
+            return fun(arg)
+        finally:
+            elapsed = perf_counter()-t0
+            children = _stack.pop()
+            if _stack:
+                _stack[-1] += elapsed
+            inclusive,exclusive = import_times.get(self.name,(0.0,0.0))
+            import_times[self.name] = (inclusive+elapsed,exclusive+elapsed-children)
+
+    # other loader functionality (get_data, is_package ...)
+    def __getattr__(self,attr):
+        return getattr(self.loader,attr)
+
+class _TimedFinder(importlib.abc.MetaPathFinder):
+    def find_spec(self,name,path,target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder,'find_spec'):
+                continue
+            spec = finder.find_spec(name,path,target)
+            if spec is not None:
+                if spec.loader is not None:
+                    spec.loader = _TimedLoader(name,spec.loader)
+                return spec
+        return None
+
+# start recording time spent importing every module imported from now on
+def enableImportProfiler():
+    if not any(isinstance(finder,_TimedFinder) for finder in sys.meta_path):
+        sys.meta_path.insert(0,_TimedFinder())
+
+def printImportProfile(count=30):
+    total = sum(exclusive for inclusive,exclusive in import_times.values())
+    print('------Import time------')
+    print('%10s %10s  %s'%('self(ms)','total(ms)','module'))
+    entries = sorted(import_times.items(),key=lambda item:item[1][1],reverse=True)
+    for name,(inclusive,exclusive) in entries[:count]:
+        print('%10.1f %10.1f  %s'%(exclusive*1e3,inclusive*1e3,name))
+    print('%d modules imported in %.1f ms'%(len(import_times),total*1e3))
@@ -0,0 +1,44 @@
+# pre-generated random samples for simulator state noise
+# samples are generated in blocks of block_size steps for all cars at once
+# block k is drawn from its own generator seeded with (seed, k), so the sequence
+# only depends on seed and is the same on every machine and numpy version using PCG64,
+# and replay from any step (offset) only needs to generate one block
+import numpy as np
+
+class NoiseBuffer:
+    # kind: 'normal' (standard normal), 'uniform' (in [-1,1]) or 'impulse' (uniform in [0,1))
+    # shape: shape of samples for one step, e.g. (n_cars,6)
+    def __init__(self,kind,shape,seed,block_size=1000,offset=0):
+        if (kind not in ['normal','uniform','impulse']):
+            raise ValueError("unknown noise kind "+str(kind))
+        self.kind = kind
+        self.shape = tuple(shape)
+        self.seed = seed
+        self.block_size = block_size
+        self.seek(offset)
+
+    def generateBlock(self,index):
+        rng = np.random.Generator(np.random.PCG64(np.random.SeedSequence(self.seed,spawn_key=(index,))))
+        size = (self.block_size,) + self.shape
+        if (self.kind == 'normal'):
+            return rng.standard_normal(size)
+        elif (self.kind == 'uniform'):
+            return rng.uniform(-1.0,1.0,size)
+        else:
+            return rng.random(size)
+
+    # continue from step offset
+    def seek(self,offset):
+        self.offset = offset
+        self.block_index = offset // self.block_size
+        self.block = self.generateBlock(self.block_index)
+
+    # samples for next step
+    def next(self):
+        i = self.offset - self.block_index*self.block_size
+        if (i == self.block_size):
+            self.block_index += 1
+            self.block = self.generateBlock(self.block_index)
+            i = 0
+        self.offset += 1
+        return self.block[i]
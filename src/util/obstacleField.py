@@ -0,0 +1,81 @@
+# random obstacle fields for benchmarking controllers
+#
+# candidate positions come from parallel Poisson disk sampling: the region is divided
+# into cells of side spacing/sqrt(2), so a cell holds at most one point and a point
+# can only conflict with points up to 2 cells away. cells are processed in 9 phases
+# by (i%3,j%3), cells in the same phase are 3 cells apart and can't conflict, so each
+# phase draws and tests one candidate in all of its cells at once. after enough rounds
+# the candidates cover the allowed area with no two closer than spacing
+#
+# obstacles are then drawn from the candidates without replacement, weighted by density
+# of the sector each candidate is in, any subset keeps the minimum spacing
+import numpy as np
+
+# bounds: (x_min,y_min,x_max,y_max)
+# spacing: minimum distance between points
+# rng: np.random.Generator
+# allowed: function of points (m,2) returning bool (m,), where points may be placed
+# rounds: attempts per cell, like k in Bridson's algorithm
+# returns points (n,2)
+def poissonDisk(bounds,spacing,rng,allowed=None,rounds=10):
+    x_min,y_min,x_max,y_max = bounds
+    cell_size = spacing/np.sqrt(2)
+    shape = (int(np.ceil((x_max-x_min)/cell_size)),int(np.ceil((y_max-y_min)/cell_size)))
+    capacity = shape[0]*shape[1]
+    # point index in each cell, padded by 2 cells on each side
+    # empty cells point to a sentinel far away, so distance tests need no mask
+    grid = np.full((shape[0]+4,shape[1]+4),capacity,dtype=np.int32)
+    px = np.full(capacity+1,np.inf)
+    py = np.full(capacity+1,np.inf)
+    count = 0
+    offsets = np.array([(dx,dy) for dx in range(-2,3) for dy in range(-2,3) if abs(dx) < 2 or abs(dy) < 2])
+    ix,iy = np.meshgrid(np.arange(shape[0]),np.arange(shape[1]),indexing='ij')
+    # cells that can't take a point
+    dead = np.zeros(shape,dtype=bool)
+    if (allowed is not None):
+        # cells with no allowed corner or center are taken as entirely outside allowed area
+        samples = np.array([(0,0),(0,1),(1,0),(1,1),(0.5,0.5)])
+        sample_points = np.array([x_min,y_min]) + (np.stack([ix,iy],axis=-1)[:,:,np.newaxis,:]+samples)*cell_size
+        dead = ~np.any(allowed(sample_points.reshape(-1,2)).reshape(shape+(len(samples),)),axis=2)
+    # cells of each phase, as index into padded grid
+    phases = []
+    for i in range(3):
+        for j in range(3):
+            cx = ix[i::3,j::3][~dead[i::3,j::3]] + 2
+            cy = iy[i::3,j::3][~dead[i::3,j::3]] + 2
+            phases.append((cx,cy))
+
+    for _ in range(rounds):
+        for k,(cx,cy) in enumerate(phases):
+            empty = grid[cx,cy] == capacity
+            cx = cx[empty]
+            cy = cy[empty]
+            # filled cells are dropped for later rounds
+            phases[k] = (cx,cy)
+            if (len(cx) == 0):
+                continue
+            x = x_min + (cx-2+rng.random(len(cx)))*cell_size
+            y = y_min + (cy-2+rng.random(len(cy)))*cell_size
+            # neighbors within 2 cells
+            neighbor = grid[cx[:,np.newaxis]+offsets[:,0],cy[:,np.newaxis]+offsets[:,1]]
+            dx = x[:,np.newaxis] - px[neighbor]
+            dy = y[:,np.newaxis] - py[neighbor]
+            ok = np.all(dx*dx + dy*dy >= spacing**2,axis=1) & (x < x_max) & (y < y_max)
+            if (allowed is not None and np.any(ok)):
+                ok[ok] = allowed(np.column_stack([x[ok],y[ok]]))
+            new_count = np.count_nonzero(ok)
+            grid[cx[ok],cy[ok]] = np.arange(count,count+new_count)
+            px[count:count+new_count] = x[ok]
+            py[count:count+new_count] = y[ok]
+            count += new_count
+    return np.column_stack([px[:count],py[:count]])
+
+# pick count of n candidates, probability of each proportional to weight (n,), 0 excludes it
+# weighted sampling without replacement (Efraimidis-Spirakis), returns indices
+def weightedSubset(weight,count,rng):
+    weight = np.asarray(weight,dtype=float)
+    candidates = np.flatnonzero(weight > 0)
+    count = min(count,len(candidates))
+    with np.errstate(divide='ignore'):
+        key = np.log(rng.random(len(candidates)))/weight[candidates]
+    return candidates[np.argsort(-key)[:count]]
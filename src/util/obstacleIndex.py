@@ -0,0 +1,114 @@
+# spatial hash for circular static obstacles of equal radius
+# the plane around obstacles is divided into square cells of size cell_size (>= radius),
+# each cell keeps the obstacles whose center is in the cell or its 8 neighbors,
+# so every obstacle within cell_size of a query point is a candidate and collision
+# (distance < radius) is decided from one cell, whatever the number of obstacles
+#
+# nearest k queries (not limited to cell_size) use a kd-tree
+import numpy as np
+from scipy.spatial import cKDTree
+
+class ObstacleIndex:
+    # obstacles: (n,2) obstacle centers
+    # radius: a point closer than radius to a center is in collision
+    # cell_size: clearance is reported up to cell_size-radius, defaults to 2*radius
+    def __init__(self,obstacles,radius,cell_size=None):
+        self.obstacles = np.asarray(obstacles,dtype=float).reshape(-1,2)
+        self.radius = float(radius)
+        if (cell_size is None):
+            cell_size = 2*self.radius
+        if (cell_size < self.radius):
+            raise ValueError("cell_size must be no smaller than obstacle radius")
+        self.cell_size = float(cell_size)
+        self.tree = cKDTree(self.obstacles) if len(self.obstacles) > 0 else None
+
+        n = len(self.obstacles)
+        if (n == 0):
+            self.origin = np.zeros(2)
+            self.shape = (1,1)
+            self.setCandidates(np.zeros(1,dtype=int),np.zeros(0,dtype=int))
+            return
+        # at least one cell of margin on each side so neighbors of any obstacle's cell exist
+        self.origin = self.obstacles.min(axis=0) - 1.5*self.cell_size
+        extent = self.obstacles.max(axis=0) + 1.5*self.cell_size - self.origin
+        self.shape = tuple((np.floor(extent/self.cell_size).astype(int)+1).tolist())
+        index = np.floor((self.obstacles-self.origin)/self.cell_size).astype(int)
+
+        # (cell, obstacle) pairs for the 3x3 cells around each obstacle
+        offsets = np.array([(dx,dy) for dx in (-1,0,1) for dy in (-1,0,1)])
+        cells = index[np.newaxis,:,:] + offsets[:,np.newaxis,:]
+        cell_id = (cells[:,:,0]*self.shape[1] + cells[:,:,1]).flatten()
+        obstacle_id = np.tile(np.arange(n),len(offsets))
+        # by cell, then ascending obstacle index within a cell
+        order = np.lexsort((obstacle_id,cell_id))
+        counts = np.bincount(cell_id,minlength=self.shape[0]*self.shape[1])
+        self.setCandidates(counts,obstacle_id[order])
+
+    def setCandidates(self,counts,obstacles):
+        self.counts = counts
+        self.cell_start = np.concatenate([[0],np.cumsum(counts)])
+        self.cell_obstacles = obstacles
+        # padded to same length with -1 so batch queries are one vectorized distance computation
+        rows = np.repeat(np.arange(len(counts)),counts)
+        cols = np.arange(len(obstacles)) - np.repeat(self.cell_start[:-1],counts)
+        self.candidates = np.full((len(counts),max(counts.max(),1)),-1,dtype=int)
+        self.candidates[rows,cols] = obstacles
+
+    # same as query for a single point (x,y), with fewer numpy calls
+    # returns obstacle id (or -1) and clearance
+    def queryPoint(self,x,y):
+        i = int((x-self.origin[0])//self.cell_size)
+        j = int((y-self.origin[1])//self.cell_size)
+        if (i < 0 or i >= self.shape[0] or j < 0 or j >= self.shape[1]):
+            return -1,np.inf
+        cell = i*self.shape[1] + j
+        start = self.cell_start[cell]
+        end = self.cell_start[cell+1]
+        if (start == end):
+            return -1,np.inf
+        ids = self.cell_obstacles[start:end]
+        obs = self.obstacles[ids]
+        dist = np.hypot(obs[:,0]-x,obs[:,1]-y)
+        hit = np.flatnonzero(dist < self.radius)
+        obstacle_id = int(ids[hit[0]]) if len(hit) > 0 else -1
+        min_dist = dist.min()
+        clearance = min_dist - self.radius if min_dist <= self.cell_size else np.inf
+        return obstacle_id,clearance
+
+    # points (m,2)
+    # returns id of the first (lowest index) obstacle each point collides with, -1 if none,
+    # and clearance (distance to nearest obstacle edge, negative in collision),
+    # inf where no obstacle is within cell_size
+    def query(self,points):
+        points = np.asarray(points,dtype=float).reshape(-1,2)
+        if (len(self.obstacles) == 0):
+            return np.full(len(points),-1,dtype=int),np.full(len(points),np.inf)
+        index = np.floor((points-self.origin)/self.cell_size).astype(int)
+        inside = (index[:,0] >= 0) & (index[:,0] < self.shape[0]) & (index[:,1] >= 0) & (index[:,1] < self.shape[1])
+        cell = np.where(inside, index[:,0]*self.shape[1] + index[:,1], 0)
+        candidates = self.candidates[cell,:max(self.counts[cell].max(initial=0),1)]
+        candidates[~inside] = -1
+        valid = candidates >= 0
+        diff = points[:,np.newaxis,:] - self.obstacles[np.maximum(candidates,0)]
+        dist = np.where(valid, np.hypot(diff[:,:,0],diff[:,:,1]), np.inf)
+
+        hit = dist < self.radius
+        first = np.argmax(hit,axis=1)
+        rows = np.arange(len(points))
+        obstacle_id = np.where(hit[rows,first], candidates[rows,first], -1)
+        min_dist = dist.min(axis=1)
+        clearance = np.where(min_dist <= self.cell_size, min_dist - self.radius, np.inf)
+        return obstacle_id,clearance
+
+    # k nearest obstacles to each of points (m,2), any distance
+    # returns ids (m,k) and clearance (m,k), sorted by distance,
+    # padded with -1 and inf if there are fewer than k obstacles
+    def nearest(self,points,k):
+        points = np.asarray(points,dtype=float).reshape(-1,2)
+        if (self.tree is None):
+            return np.full((len(points),k),-1,dtype=int),np.full((len(points),k),np.inf)
+        dist,ids = self.tree.query(points,k=k)
+        dist = dist.reshape(len(points),k)
+        ids = ids.reshape(len(points),k)
+        ids = np.where(ids < len(self.obstacles), ids, -1)
+        return ids,dist - self.radius
@@ -0,0 +1,121 @@
+# raceline artifact: everything RCPTrack.load() builds from a raceline pickle, stored as
+# plain arrays in a compressed .npz, so loading needs neither the pickle (which holds scipy
+# objects and breaks across scipy versions) nor reconstructRaceline() / index building
+#
+# the artifact of data/<name>.p is cached as data/__cache__/<name>-<hash>.npz, keyed by
+# hash of the pickle file, it's created on first load and used by every later load
+# an artifact can also be shipped and loaded on its own with RCPTrack.load('<name>.npz')
+import os
+import hashlib
+import numpy as np
+from glob import glob
+from scipy.interpolate import interp1d
+from util.racelineIndex import RacelineIndex
+
+# bump this when content or layout changes to invalidate old artifacts
+ARTIFACT_VERSION = 3
+
+def artifactFilename(source_filename):
+    with open(source_filename,'rb') as f:
+        digest = hashlib.sha1(str(ARTIFACT_VERSION).encode()+f.read()).hexdigest()
+    folder = os.path.join(os.path.dirname(os.path.abspath(source_filename)),'__cache__')
+    name = os.path.splitext(os.path.basename(source_filename))[0]
+    return os.path.join(folder,name+'-'+digest[:16]+'.npz')
+
+# tck tuple of splprep to arrays
+def _splineArrays(prefix,tck):
+    t,c,k = tck
+    return {prefix+'_t':np.asarray(t), prefix+'_c':np.asarray(c), prefix+'_k':np.array(k)}
+
+def _spline(data,prefix):
+    return [data[prefix+'_t'], list(data[prefix+'_c']), int(data[prefix+'_k'])]
+
+# interp1d kind argument that reproduces f
+def _interpKind(f):
+    if (f._kind == 'spline'):
+        return str(f._spline.k)
+    return f._kind
+
+def saveArtifact(track,filename):
+    arrays = {'version':np.array(ARTIFACT_VERSION),
+            'grid_sequence':np.array(track.grid_sequence,dtype=int),
+            'scale':np.array(track.scale),
+            'origin_seq_no':np.array(track.origin_seq_no),
+            'track_length':np.array(track.track_length_grid),
+            'gridsize':np.array(track.gridsize),
+            # empty grid cells are None, stored as '' to keep a plain string array
+            'track':np.array([[tile or '' for tile in row] for row in track.track],dtype='U2'),
+            'min_v':np.array(track.min_v),
+            'max_v':np.array(track.max_v),
+            'v_from_u_x':track.targetVfromU.x,
+            'v_from_u_y':track.targetVfromU.y,
+            'v_from_u_kind':np.array(_interpKind(track.targetVfromU)),
+            'u_lut':track.u_lut,
+            's_lut':track.s_lut}
+    arrays.update(_splineArrays('raceline',track.raceline))
+    arrays.update(_splineArrays('raceline_s',track.raceline_s))
+    for key,value in track.raceline_index.arrays().items():
+        arrays['index_'+key] = np.asarray(value)
+
+    folder = os.path.dirname(os.path.abspath(filename))
+    os.makedirs(folder,exist_ok=True)
+    # remove artifacts of earlier versions of the same raceline
+    prefix = filename.rsplit('-',1)[0]
+    for old_filename in glob(prefix+'-*.npz'):
+        os.remove(old_filename)
+    # write to a temporary file first so parallel runs never see a partial artifact
+    tmp_filename = filename+'.%d.tmp'%(os.getpid())
+    with open(tmp_filename,'wb') as f:
+        np.savez_compressed(f,**arrays)
+    os.replace(tmp_filename,filename)
+
+# restore track attributes set by RCPTrack.load()
+# raises ValueError if artifact is from a different ARTIFACT_VERSION
+def loadArtifact(track,filename):
+    with np.load(filename,allow_pickle=False) as data:
+        if (int(data['version']) != ARTIFACT_VERSION):
+            raise ValueError("raceline artifact version %d, expected %d"%(int(data['version']),ARTIFACT_VERSION))
+        track.grid_sequence = data['grid_sequence'].tolist()
+        track.scale = float(data['scale'])
+        track.origin_seq_no = int(data['origin_seq_no'])
+        track.track_length_grid = int(data['track_length'])
+        track.gridsize = tuple(data['gridsize'].tolist())
+        track.track = [[tile or None for tile in row] for row in data['track'].tolist()]
+        track.min_v = float(data['min_v'])
+        track.max_v = float(data['max_v'])
+        kind = str(data['v_from_u_kind'])
+        track.targetVfromU = interp1d(data['v_from_u_x'],data['v_from_u_y'],kind=int(kind) if kind.isdigit() else kind)
+        track.raceline = _spline(data,'raceline')
+        track.raceline_s = _spline(data,'raceline_s')
+        track.x_limit = track.gridsize[1]*track.scale
+        track.y_limit = track.gridsize[0]*track.scale
+        track.buildRacelineMaps(data['u_lut'],data['s_lut'])
+        index_arrays = {key[len('index_'):]:data[key] for key in data.files if key.startswith('index_')}
+        index_arrays['cell_size'] = float(index_arrays['cell_size'])
+        track.raceline_index = RacelineIndex(**index_arrays)
+        track.buildGridIndex()
+
+# round trip check on a small track with empty grid cells
+# run from src: python -m util.racelineArtifact
+if __name__ == '__main__':
+    import tempfile
+    from track.RCPTrack import RCPTrack
+
+    track = RCPTrack()
+    track.initTrack('uuruurddddll',(5,3),0.6)
+    track.initRaceline((0,1),'u',11)
+    track.generateSpeedProfile(show=False)
+    track.reconstructRaceline()
+    with tempfile.TemporaryDirectory() as folder:
+        filename = os.path.join(folder,'small-0.npz')
+        saveArtifact(track,filename)
+        loaded = RCPTrack()
+        loadArtifact(loaded,filename)
+
+    assert loaded.track == track.track
+    assert loaded.grid_sequence == [list(map(int,coord)) for coord in track.grid_sequence]
+    points = [(0.3,0.9,np.pi/2,1.0,0,0),(1.5,0.3,0,1.0,0,0),(0.9,2.7,-np.pi/2,1.0,0,0)]
+    for state in points:
+        for a,b in zip(loaded.localTrajectory(state),track.localTrajectory(state)):
+            assert np.allclose(a,b)
+    print('raceline artifact round trip ok, %d empty grid cells'%(sum(row.count(None) for row in track.track)))
@@ -0,0 +1,271 @@
+# spatial index for closest point queries on a closed curve (e.g. raceline)
+# the curve is sampled densely into a closed polyline, the plane is divided into
+# square cells and each cell keeps the segments that can be closest to any point in it
+# a query projects onto those candidate segments in closed form, no iteration
+#
+# for a cell with center c and half diagonal h, if d is the distance from c to the
+# closest segment, the closest segment of any point in the cell is within d+2h of c,
+# so keeping segments within d+2h is exact
+#
+# queries can be limited to a window of curve parameter (e.g. u around the track grid a
+# car is in), so a point near a wall isn't matched to the curve on the other side of it.
+# cell candidates are only good for the unrestricted closest point, windowed queries
+# project on all segments in the window instead
+import numpy as np
+from bisect import bisect_right
+from scipy.spatial import cKDTree
+
+class RacelineIndex:
+    # points: (n,2) samples along curve, last point connects back to first
+    # params: (n,) or (n,k) curve parameters (e.g. u,s) at samples, interpolated linearly along segments
+    #   the first one increasing from 0 along curve, windowed queries are in terms of it
+    # period: parameter value(s) at the end of the curve, where the first sample repeats
+    # bounds: (x_min,y_min,x_max,y_max) of region covered by cells
+    # max_distance: cells farther than this from curve are not indexed, queries there return nan
+    # cell_counts, cell_segments: candidates from arrays() of an index of the same curve, skips building
+    def __init__(self,points,params,period,bounds,cell_size=0.05,max_distance=np.inf,cell_counts=None,cell_segments=None):
+        points = np.asarray(points,dtype=float)
+        params = np.asarray(params,dtype=float)
+        self.points = points
+        self.params = params
+        self.bounds = np.array(bounds,dtype=float)
+        self.scalar_param = (params.ndim == 1)
+        params = params.reshape(len(points),-1)
+        period = np.asarray(period,dtype=float).reshape(-1)
+        self.seg_start = points
+        self.seg_vec = np.roll(points,-1,axis=0) - points
+        self.seg_len2 = np.maximum(np.sum(self.seg_vec**2,axis=1),1e-18)
+        self.param_start = params
+        self.param_delta = np.vstack([params[1:],params[:1]+period]) - params
+        self.period = period
+        self.window_param = params[:,0].copy()
+        self.window_param_list = self.window_param.tolist()
+        # all segments, same columns as cell_geometry
+        self.geometry = np.column_stack([self.seg_start,self.seg_vec,1.0/self.seg_len2])
+
+        x_min,y_min,x_max,y_max = bounds
+        self.origin = np.array([x_min,y_min],dtype=float)
+        self.cell_size = cell_size
+        self.shape = (int(np.ceil((x_max-x_min)/cell_size)),int(np.ceil((y_max-y_min)/cell_size)))
+        if (cell_counts is None):
+            cell_counts,cell_segments = self.buildCandidates(max_distance)
+        self.setCandidates(np.asarray(cell_counts,dtype=int),np.asarray(cell_segments,dtype=int))
+
+    # segments that can be closest to a point in each cell
+    # returns count for each cell and candidates of all cells concatenated
+    def buildCandidates(self,max_distance):
+        ix,iy = np.meshgrid(np.arange(self.shape[0]),np.arange(self.shape[1]),indexing='ij')
+        centers = self.origin + (np.stack([ix.flatten(),iy.flatten()],axis=1)+0.5)*self.cell_size
+        half_diagonal = self.cell_size*np.sqrt(2)/2
+
+        # each segment is no longer than max_len, so any segment within distance D of a
+        # center has an endpoint within D+max_len/2, sample points found with a kd-tree
+        # give a superset that's then trimmed with exact segment distance
+        max_len = np.sqrt(self.seg_len2.max())
+        tree = cKDTree(self.points)
+        point_dist,_ = tree.query(centers)
+        neighbors = tree.query_ball_point(centers,point_dist+2*half_diagonal+max_len/2)
+        candidate_list = []
+        n = len(self.points)
+        for k in range(len(centers)):
+            if (point_dist[k] > max_distance):
+                candidate_list.append(np.zeros(0,dtype=int))
+                continue
+            index = np.array(neighbors[k])
+            segments = np.unique(np.concatenate([index,(index-1)%n]))
+            dist = np.sqrt(self.segmentDistance2(centers[k],segments)[1])
+            candidate_list.append(segments[dist <= dist.min()+2*half_diagonal])
+        return np.array([len(val) for val in candidate_list]),np.concatenate(candidate_list)
+
+    def setCandidates(self,counts,segments):
+        self.counts = counts
+        self.cell_start = np.concatenate([[0],np.cumsum(counts)])
+        self.cell_segments = segments
+        # padded to same length with the first candidate so queries are one vectorized projection,
+        # a query only uses as many columns as the largest count among its cells
+        # cells with no candidate are marked with -1
+        rows = np.repeat(np.arange(len(counts)),counts)
+        cols = np.arange(len(segments)) - np.repeat(self.cell_start[:-1],counts)
+        self.candidates = np.full((len(counts),max(counts.max(),1)),-1,dtype=int)
+        first = np.where(counts > 0, segments[np.minimum(self.cell_start[:-1],len(segments)-1)], -1)
+        self.candidates[:] = first[:,np.newaxis]
+        self.candidates[rows,cols] = segments
+        # same candidates stored contiguously by cell for queryPoint, columns x,y,dx,dy,1/len^2
+        self.cell_geometry = np.column_stack([self.seg_start[segments],self.seg_vec[segments],1.0/self.seg_len2[segments]])
+
+    # everything needed to rebuild this index with RacelineIndex(**arrays), as plain arrays
+    def arrays(self):
+        return {'points':self.points,
+                'params':self.params,
+                'period':self.period if not self.scalar_param else self.period[0],
+                'bounds':self.bounds,
+                'cell_size':self.cell_size,
+                'cell_counts':self.counts,
+                'cell_segments':self.cell_segments}
+
+    # projection of points q (...,2) on segments seg (...), returns position along segment in [0,1] and squared distance
+    def segmentDistance2(self,q,seg):
+        diff = q - self.seg_start[seg]
+        t = np.clip(np.sum(diff*self.seg_vec[seg],axis=-1)/self.seg_len2[seg],0.0,1.0)
+        dist2 = np.sum((diff - t[...,np.newaxis]*self.seg_vec[seg])**2,axis=-1)
+        return t,dist2
+
+    # same as query for a single point (x,y), with fewer numpy calls
+    # returns params, closest point and distance, or None outside indexed cells
+    def queryPoint(self,x,y,lower=None,upper=None):
+        if (lower is not None):
+            return self.queryPointWindow(x,y,lower,upper)
+        i = int((x-self.origin[0])//self.cell_size)
+        j = int((y-self.origin[1])//self.cell_size)
+        if (i < 0 or i >= self.shape[0] or j < 0 or j >= self.shape[1]):
+            return None
+        cell = i*self.shape[1] + j
+        start = self.cell_start[cell]
+        end = self.cell_start[cell+1]
+        if (start == end):
+            return None
+        x0,y0,dx,dy,inv_len2 = self.cell_geometry[start:end].T
+        ex = x - x0
+        ey = y - y0
+        t = (ex*dx + ey*dy)*inv_len2
+        np.clip(t,0.0,1.0,out=t)
+        ex -= t*dx
+        ey -= t*dy
+        dist2 = ex*ex + ey*ey
+        k = dist2.argmin()
+        seg = self.cell_segments[start+k]
+        t = t[k]
+        params = (self.param_start[seg] + t*self.param_delta[seg]) % self.period
+        closest = self.seg_start[seg] + t*self.seg_vec[seg]
+        if (self.scalar_param):
+            params = params[0]
+        return params,closest,dist2[k]**0.5
+
+    # segments covering first parameter in [lower,upper] (any shape), wrapping around period
+    # returns first segment, number of segments, and position along first and last segment
+    # where the window starts and ends
+    def windowSegments(self,lower,upper):
+        period = self.period[0]
+        n = len(self.window_param)
+        lower = np.asarray(lower,dtype=float)
+        upper = np.asarray(upper,dtype=float)
+        lower_wrapped = lower % period
+        upper_wrapped = upper % period
+        first = np.searchsorted(self.window_param,lower_wrapped,side='right') - 1
+        last = np.searchsorted(self.window_param,upper_wrapped,side='right') - 1
+        count = np.where(upper - lower >= period, n, (last - first) % n + 1)
+        t_first = (lower_wrapped - self.window_param[first])/self.param_delta[first,0]
+        t_last = (upper_wrapped - self.window_param[last])/self.param_delta[last,0]
+        # whole curve, no partial segments
+        t_first = np.where(count == n, 0.0, t_first)
+        t_last = np.where(count == n, 1.0, t_last)
+        return first,count,t_first,t_last
+
+    # queryPoint with first parameter limited to [lower,upper], same as windowSegments() with plain floats
+    def queryPointWindow(self,x,y,lower,upper):
+        period = float(self.period[0])
+        n = len(self.window_param_list)
+        lower = float(lower)
+        upper = float(upper)
+        lower_wrapped = lower % period
+        upper_wrapped = upper % period
+        first = bisect_right(self.window_param_list,lower_wrapped) - 1
+        last = bisect_right(self.window_param_list,upper_wrapped) - 1
+        if (upper - lower >= period):
+            first,count,t_first,t_last = 0,n,0.0,1.0
+        else:
+            count = (last - first) % n + 1
+            t_first = (lower_wrapped - self.window_param_list[first])/self.param_delta[first,0]
+            t_last = (upper_wrapped - self.window_param_list[last])/self.param_delta[last,0]
+        # segments are contiguous unless window wraps around
+        if (first + count <= n):
+            geometry = self.geometry[first:first+count]
+        else:
+            geometry = np.vstack([self.geometry[first:],self.geometry[:first+count-n]])
+        x0,y0,dx,dy,inv_len2 = geometry.T
+        ex = x - x0
+        ey = y - y0
+        t = (ex*dx + ey*dy)*inv_len2
+        np.clip(t,0.0,1.0,out=t)
+        t[0] = max(t[0],t_first)
+        t[-1] = min(t[-1],t_last)
+        ex -= t*dx
+        ey -= t*dy
+        dist2 = ex*ex + ey*ey
+        k = dist2.argmin()
+        seg = (first + k) % n
+        t = t[k]
+        params = (self.param_start[seg] + t*self.param_delta[seg]) % self.period
+        closest = self.seg_start[seg] + t*self.seg_vec[seg]
+        if (self.scalar_param):
+            params = params[0]
+        return params,closest,dist2[k]**0.5
+
+    # closest point on curve to each of points (m,2)
+    # lower, upper: optional (m,) window of first parameter for each point, see windowSegments()
+    # returns params (m,) or (m,k), closest points (m,2) and distance (m,)
+    # points outside indexed cells get nan (not checked for windowed queries)
+    def query(self,points,chunk_size=256,lower=None,upper=None):
+        points = np.asarray(points,dtype=float).reshape(-1,2)
+        if (lower is not None):
+            return self.queryWindow(points,lower,upper)
+        index = np.floor((points-self.origin)/self.cell_size).astype(int)
+        inside = (index[:,0] >= 0) & (index[:,0] < self.shape[0]) & (index[:,1] >= 0) & (index[:,1] < self.shape[1])
+        cell = np.where(inside, index[:,0]*self.shape[1] + index[:,1], 0)
+        valid = inside & (self.counts[cell] > 0)
+        # candidate counts vary a lot between cells, points are processed in chunks of similar
+        # count so each chunk is padded only to its own largest count
+        counts = self.counts[cell]
+        order = np.argsort(counts)
+        seg = np.zeros(len(points),dtype=int)
+        t = np.zeros(len(points))
+        dist2 = np.zeros(len(points))
+        for i in range(0,len(points),chunk_size):
+            chunk = order[i:i+chunk_size]
+            candidates = self.candidates[cell[chunk],:max(counts[chunk[-1]],1)]
+            chunk_t,chunk_dist2 = self.segmentDistance2(points[chunk,np.newaxis,:],candidates)
+            best = np.argmin(chunk_dist2,axis=1)
+            rows = np.arange(len(chunk))
+            seg[chunk] = candidates[rows,best]
+            t[chunk] = chunk_t[rows,best]
+            dist2[chunk] = chunk_dist2[rows,best]
+        params = (self.param_start[seg] + t[:,np.newaxis]*self.param_delta[seg]) % self.period
+        closest = self.seg_start[seg] + t[:,np.newaxis]*self.seg_vec[seg]
+        dist = np.sqrt(dist2)
+        params[~valid] = np.nan
+        closest[~valid] = np.nan
+        dist[~valid] = np.nan
+        if (self.scalar_param):
+            params = params[:,0]
+        return params,closest,dist
+
+    # query with first parameter of each point limited to [lower,upper] (m,)
+    def queryWindow(self,points,lower,upper):
+        points = np.asarray(points,dtype=float).reshape(-1,2)
+        first,count,t_first,t_last = self.windowSegments(np.broadcast_to(lower,len(points)),np.broadcast_to(upper,len(points)))
+        cols = np.arange(max(count.max(initial=0),1))
+        seg = (first[:,np.newaxis] + cols) % len(self.window_param)
+        geometry = self.geometry[seg]
+        x0,y0,dx,dy,inv_len2 = np.moveaxis(geometry,-1,0)
+        ex = points[:,0,np.newaxis] - x0
+        ey = points[:,1,np.newaxis] - y0
+        t = (ex*dx + ey*dy)*inv_len2
+        np.clip(t,0.0,1.0,out=t)
+        rows = np.arange(len(points))
+        # window starts and ends part way along first and last segment
+        t[:,0] = np.maximum(t[:,0],t_first)
+        t[rows,count-1] = np.minimum(t[rows,count-1],t_last)
+        ex -= t*dx
+        ey -= t*dy
+        dist2 = ex*ex + ey*ey
+        # padding beyond each point's window
+        dist2[cols >= count[:,np.newaxis]] = np.inf
+        best = np.argmin(dist2,axis=1)
+        seg = seg[rows,best]
+        t = t[rows,best]
+        params = (self.param_start[seg] + t[:,np.newaxis]*self.param_delta[seg]) % self.period
+        closest = self.seg_start[seg] + t[:,np.newaxis]*self.seg_vec[seg]
+        dist = np.sqrt(dist2[rows,best])
+        if (self.scalar_param):
+            params = params[:,0]
+        return params,closest,dist
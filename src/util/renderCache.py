@@ -0,0 +1,81 @@
+# rendered track layers (tiles, raceline, obstacles, boundaries), cached in memory and on disk
+#
+# a layer is an image and a mask of the pixels it covers, so a layer drawn once can be
+# composited onto any background with one masked copy, e.g. raceline over tiles, or
+# obstacles over a frame. each layer is keyed by a hash of everything it's drawn from
+# (track description, raceline, obstacles, resolution, canvas size), so a changed track
+# gets a new key and stale entries are never used
+#
+# disk cache is in data/__cache__, same as raceline artifacts
+import os
+import hashlib
+import numpy as np
+
+CACHE_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),'data','__cache__')
+
+# layers by key, shared by all tracks in process, oldest dropped beyond MAX_LAYERS
+# (e.g. when raceline is redrawn on every qpSmooth iteration)
+_layers = {}
+MAX_LAYERS = 32
+
+def _update(h,part):
+    if isinstance(part,np.ndarray):
+        h.update((str(part.shape)+str(part.dtype)).encode())
+        h.update(np.ascontiguousarray(part).tobytes())
+    elif isinstance(part,(list,tuple)):
+        h.update(b'[')
+        for val in part:
+            _update(h,val)
+        h.update(b']')
+    else:
+        h.update((repr(part)+',').encode())
+
+# hash of layer name and everything it depends on (arrays, lists, numbers, strings)
+def layerKey(*parts):
+    h = hashlib.sha1()
+    for part in parts:
+        _update(h,part)
+    return h.hexdigest()[:16]
+
+# layer with key, render() -> (image, mask) is only called if it's in neither cache
+# returns (image, mask, pixels) for composite()
+# returned arrays are shared, don't modify them
+def cachedLayer(key,render,folder=CACHE_FOLDER):
+    if (key in _layers):
+        return _layers[key]
+    while (len(_layers) >= MAX_LAYERS):
+        del _layers[next(iter(_layers))]
+    filename = None if folder is None else os.path.join(folder,'layer-'+key+'.npz')
+    if (filename is not None and os.path.isfile(filename)):
+        try:
+            with np.load(filename,allow_pickle=False) as data:
+                _layers[key] = _layer(data['image'],data['mask'])
+            return _layers[key]
+        except (KeyError,ValueError,OSError):
+            pass
+    image,mask = render()
+    _layers[key] = _layer(image,mask)
+    if (filename is not None):
+        try:
+            os.makedirs(folder,exist_ok=True)
+            tmp_filename = filename+'.%d.tmp'%(os.getpid())
+            with open(tmp_filename,'wb') as f:
+                np.savez_compressed(f,image=image,mask=mask)
+            os.replace(tmp_filename,filename)
+        except OSError:
+            pass
+    return _layers[key]
+
+# image, mask and flat index of covered pixels, None if layer covers the whole image
+def _layer(image,mask):
+    pixels = None if np.all(mask) else np.flatnonzero(mask)
+    return image,mask,pixels
+
+# draw layer over img in place, returns img
+def composite(img,layer):
+    image,mask,pixels = layer
+    if (pixels is None):
+        img[...] = image
+    else:
+        img.reshape(-1,img.shape[-1])[pixels] = image.reshape(-1,image.shape[-1])[pixels]
+    return img
@@ -0,0 +1,70 @@
+# three pass velocity profile along a closed path sampled at n points
+# 1st pass: lateral acceleration limit mu*g from curvature
+# 2nd pass: forward, accelerate from slowest point, limited by motor and remaining traction
+# 3rd pass: backward, brake into slow points, limited by braking and remaining traction
+#
+# path geometry (step length, curvature) is computed once by the caller, the passes
+# only loop over plain floats, so re-profiling with a different friction or motor
+# model (e.g. for a sweep) takes a few milliseconds
+#
+# motor models are functions of longitudinal speed (m/s) returning
+# maximum longitudinal acceleration/deceleration (m/s2)
+import numpy as np
+from math import sqrt
+
+# same acceleration at any speed
+def constantMotor(acc):
+    return lambda v: acc
+
+# acceleration falls linearly from max_acc at standstill to 0 at top_speed,
+# like a DC motor at full throttle
+def linearMotor(max_acc,top_speed):
+    return lambda v: max(max_acc*(1.0-v/top_speed),0.0)
+
+# ds: (n,) distance from sample i to sample i+1, sample n wraps to sample 0
+# curvature: (n,) curvature (1/m) at each sample
+# acc_max_motor, dec_max_motor: motor models, see above
+# returns speed (n,) after each of the three passes
+def speedProfile(ds,curvature,mu=1.1,acc_max_motor=constantMotor(3.3),dec_max_motor=constantMotor(4.5),g=9.81):
+    n = len(ds)
+    ds = np.asarray(ds,dtype=float).tolist()
+    curvature_list = np.asarray(curvature,dtype=float).tolist()
+    traction2 = (mu*g)**2
+
+    # first pass, based on lateral acceleration
+    with np.errstate(divide='ignore'):
+        v1 = np.sqrt(mu*g/np.asarray(curvature,dtype=float))
+    v1_list = v1.tolist()
+
+    # second pass, start from the index with lowest speed
+    start = int(np.argmin(v1))
+    v2 = list(v1_list)
+    v = v1_list[start]
+    for k in range(start,start+n):
+        i = k % n
+        j = (k+1) % n
+        # lateral acc at next step if the car mainains speed
+        a_lat = v*v*curvature_list[j]
+        if (traction2 - a_lat*a_lat > 0):
+            a_lon = min(acc_max_motor(v),sqrt(traction2 - a_lat*a_lat))
+            # assume vehicle accelerate uniformly between the two steps
+            v = min(sqrt(v*v + 2*a_lon*ds[i]),v1_list[j])
+        else:
+            v = v1_list[j]
+        v2[j] = v
+    v2 = np.array(v2)
+
+    # third pass, backwards for braking, from the index with lowest speed
+    start = int(np.argmin(v2))
+    v2_list = v2.tolist()
+    v3 = list(v2_list)
+    v = v2_list[start]
+    for k in range(start,start-n,-1):
+        i = k % n
+        j = (k-1) % n
+        a_lat = v*v*curvature_list[j]
+        a_lon = min(dec_max_motor(v),sqrt(abs(traction2 - a_lat*a_lat)))
+        v = min(sqrt(v*v + 2*a_lon*ds[j]),v2_list[j])
+        v3[j] = v
+    v3 = np.array(v3)
+    return v1,v2,v3
@@ -1,10 +1,128 @@
 # for quick and dirty code profiling
-from time import time
+from time import time,perf_counter
+from math import log10,ceil
+import json
+import os
+import threading
+
+# histogram with logarithmically spaced buckets, memory use is fixed regardless of sample count
+# buckets_per_decade buckets per factor of 10 between min_val and max_val (in seconds)
+# plus one bucket each for underflow and overflow
+# percentiles are accurate to one bucket width, ~5% for 50 buckets per decade
+class latency_histogram:
+    def __init__(self, min_val=1e-6, max_val=10.0, buckets_per_decade=50):
+        self.min_val = min_val
+        self.log_min = log10(min_val)
+        self.buckets_per_decade = buckets_per_decade
+        self.bucket_count = int(ceil((log10(max_val)-self.log_min)*buckets_per_decade))
+        self.counts = [0]*(self.bucket_count+2)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        # samples exceeding deadline
+        self.overrun_count = 0
+
+    def add(self, val, deadline=None):
+        if (val <= self.min_val):
+            index = 0
+        else:
+            index = min(int((log10(val)-self.log_min)*self.buckets_per_decade)+1, self.bucket_count+1)
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += val
+        if (val > self.max):
+            self.max = val
+        if (deadline is not None and val > deadline):
+            self.overrun_count += 1
+
+    # upper edge of the bucket containing the p-th percentile (0-100)
+    def percentile(self, p):
+        if (self.count == 0):
+            return 0.0
+        target = p/100.0*self.count
+        cumulative = 0
+        for index in range(len(self.counts)):
+            cumulative += self.counts[index]
+            if (cumulative >= target):
+                break
+        upper = 10**(self.log_min + index/self.buckets_per_decade)
+        return min(upper, self.max)
+
+    def stats(self):
+        return {'count':self.count,
+                'mean':self.sum/self.count if self.count > 0 else 0.0,
+                'p50':self.percentile(50),
+                'p90':self.percentile(90),
+                'p99':self.percentile(99),
+                'max':self.max,
+                'overrun':self.overrun_count}
+
+# records every section of every execution_timer as a chrome trace event
+# events are kept in a preallocated ring buffer, only the last capacity events are saved
+# open the saved json in chrome://tracing or ui.perfetto.dev
+class trace_recorder:
+    def __init__(self, capacity=1000000):
+        self.capacity = capacity
+        self.t0 = perf_counter()
+        # complete events (name, start, duration, thread)
+        self.name = [None]*capacity
+        self.ts = [0.0]*capacity
+        self.dur = [0.0]*capacity
+        self.tid = [0]*capacity
+        # total number of events recorded, index into ring buffer is count % capacity
+        self.count = 0
+        # start time of open sections, (thread, name) -> start
+        self.open = {}
+
+    def begin(self, name):
+        self.open[(threading.get_ident(), name)] = perf_counter()
+
+    def end(self, name):
+        now = perf_counter()
+        tid = threading.get_ident()
+        start = self.open.pop((tid, name), None)
+        if start is None:
+            return
+        i = self.count % self.capacity
+        self.name[i] = name
+        self.ts[i] = start
+        self.dur[i] = now - start
+        self.tid[i] = tid
+        self.count += 1
+
+    def save(self, filename):
+        n = min(self.count, self.capacity)
+        first = self.count - n
+        pid = os.getpid()
+        # small thread numbers are easier to read in trace viewer
+        thread_no = {}
+        events = []
+        for k in range(first, self.count):
+            i = k % self.capacity
+            tid = thread_no.setdefault(self.tid[i], len(thread_no))
+            events.append({'name':self.name[i], 'ph':'X', 'pid':pid, 'tid':tid,
+                'ts':(self.ts[i]-self.t0)*1e6, 'dur':self.dur[i]*1e6})
+        with open(filename,'w') as f:
+            json.dump({'traceEvents':events, 'displayTimeUnit':'ms'}, f)
+        return n
+
+# trace recorder shared by all execution_timer instances, None if tracing is off
+tracer = None
+
+def enable_tracing(capacity=1000000):
+    global tracer
+    tracer = trace_recorder(capacity)
+    return tracer
 
 class execution_timer:
     
-    def __init__(self, enable = False):
+    # deadline: if set, per step time of each section and the global section
+    # that exceeds this (in seconds) is counted as an overrun
+    # name: name of the global section in trace
+    def __init__(self, enable = False, deadline = None, name = 'global'):
         self.enabled = enable
+        self.deadline = deadline
+        self.name = name
         # sectional time start time
         self.s_start = {}
         # average runtime, this is updated when a global section ends
@@ -27,6 +145,10 @@ class execution_timer:
         self.tracked = {}
         self.tracked_count = {}
 
+        # latency distribution of global section and each section (cumulative in one global section)
+        self.g_hist = latency_histogram()
+        self.s_hist = {}
+
 
     def global_start(self):
         if not self.enabled:
@@ -47,8 +169,12 @@ class execution_timer:
             self.g_duration_avg = self.g_duration_avg*self.g_sample_count+duration
             self.g_sample_count = self.g_sample_count +1
             self.g_duration_avg = self.g_duration_avg/self.g_sample_count
+        self.g_hist.add(duration, self.deadline)
 
         for key,value in self.cul.items():
+            if key not in self.s_hist:
+                self.s_hist[key] = latency_histogram()
+            self.s_hist[key].add(value, self.deadline)
             if key in self.s_avg:
                 self.s_avg[key] = self.s_avg[key]*self.g_count+value
                 self.s_avg[key] = self.s_avg[key] / (self.g_count+1)
@@ -74,6 +200,8 @@ class execution_timer:
         
 
     def start(self, name = None):
+        if tracer is not None:
+            tracer.begin(self.name if name is None else name)
         if not self.enabled:
             return
         if name is None:
@@ -83,6 +211,8 @@ class execution_timer:
         return
 
     def end(self, name = None):
+        if tracer is not None:
+            tracer.end(self.name if name is None else name)
         if not self.enabled:
             return
         if name is None:
@@ -104,6 +234,15 @@ class execution_timer:
         
     def e(self, n=None):
         return self.end(n)
+
+    # mark a section in trace only, without timing statistics
+    def trace_start(self, name):
+        if tracer is not None:
+            tracer.begin(name)
+
+    def trace_end(self, name):
+        if tracer is not None:
+            tracer.end(name)
         
     def summary(self):
         if not self.enabled:
@@ -127,8 +266,28 @@ class execution_timer:
         unaccounted_time = 1-sum_time/total_time
         print('avg frequency = '+"{0:.3f}".format(1/self.g_duration_avg)+'Hz')
         print('unaccounted time = '+"{0:.1f}".format(unaccounted_time*100)+' %')
+
+        print('-------Latency (ms)---')
+        print('%-24s %8s %8s %8s %8s %8s'%('section','p50','p90','p99','max','overrun'))
+        for key,value in self.latencyStats().items():
+            print('%-24s %8.3f %8.3f %8.3f %8.3f %8d'%(key,value['p50']*1e3,value['p90']*1e3,value['p99']*1e3,value['max']*1e3,value['overrun']))
+        if (self.deadline is not None):
+            print('overrun: time per step > %.1f ms'%(self.deadline*1e3))
         return
 
+    # latency statistics (seconds) for each section, 'total' for global section
+    def latencyStats(self):
+        stats = {'total':self.g_hist.stats()}
+        for key,value in self.s_hist.items():
+            stats[key] = value.stats()
+        return stats
+
+    def exportJson(self, filename):
+        if not self.enabled:
+            return
+        with open(filename,'w') as f:
+            json.dump({'deadline':self.deadline, 'sections':self.latencyStats()}, f, indent=2)
+
 #sample usage        
 if __name__ == '__main__':
     from time import sleep